@@ -0,0 +1,184 @@
+# Background data acquisition for the dhtui display.
+#
+# Every data source (DHT sensor, weather API, CPU temperature, memory/storage) runs
+# on its own schedule in a small thread pool, so the render loop never waits on the
+# network, GPIO or a subprocess. Each finished reading is published as a new,
+# immutable Snapshot; the render loop just reads engine.snapshot, which is a single
+# attribute load and needs no lock.
+import collections
+import concurrent.futures
+import threading
+import time
+import types
+
+# State of one source as seen by the render loop.
+# value keeps the last good reading; a failed read never clears it.
+SourceState = collections.namedtuple(
+    "SourceState",
+    ["value", "updated_at", "latency", "last_error", "reads", "errors"],
+)
+
+
+class Snapshot:
+    __slots__ = ("sources", "version", "published_at")
+
+    def __init__(self, sources, version, published_at):
+        self.sources = types.MappingProxyType(sources) # name -> SourceState
+        self.version = version
+        self.published_at = published_at
+
+    # Last good value for a source, or default if it never produced one
+    def get(self, name, default=None):
+        state = self.sources.get(name)
+        if state is None or state.value is None:
+            return default
+        return state.value
+
+    # Seconds since the source last produced a good value (None if never)
+    def staleness(self, name, now=None):
+        state = self.sources.get(name)
+        if state is None or state.updated_at is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return now - state.updated_at
+
+
+class Source:
+    def __init__(self, name, fetch, interval, enabled=None):
+        self.name = name
+        self.fetch = fetch # Callable returning the new value; raises on failure
+        self.interval = interval # Seconds between reads, or a callable returning them
+        self.enabled = enabled # Optional callable; the source is skipped while it returns False
+        self.next_due = 0.0
+
+
+class AcquisitionEngine:
+    def __init__(self, max_workers=4, clock=time.monotonic):
+        self.clock = clock
+        self.sources = {}
+        self.snapshot = Snapshot({}, 0, clock())
+        self._executor = None
+        self._max_workers = max_workers
+        self._publish_lock = threading.Lock() # Only writers take this
+        self._wakeup = threading.Event()
+        self._in_flight = set()
+        self._listeners = []
+        self._thread = None
+        self._running = False
+
+    def add_source(self, name, fetch, interval, enabled=None):
+        source = Source(name, fetch, interval, enabled)
+        self.sources[name] = source
+        self._wakeup.set()
+        return source
+
+    # Registers callback(name, value) to run on the worker thread after each good reading
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    # Publishes a value without reading the source, e.g. a cached value at startup.
+    # It counts as stale until the source produces a fresh reading.
+    def seed(self, name, value):
+        with self._publish_lock:
+            sources = dict(self.snapshot.sources)
+            previous = sources.get(name) or SourceState(None, None, None, None, 0, 0)
+            sources[name] = previous._replace(value=value)
+            self.snapshot = Snapshot(sources, self.snapshot.version + 1, self.clock())
+
+    # Publishes a fresh reading obtained elsewhere (e.g. from the LAN hub) as if the
+    # source had just read it, and notifies the listeners
+    def publish(self, name, value):
+        now = self.clock()
+        self._publish(name, value, None, now, now)
+        self._notify(name, value)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(self._max_workers, len(self.sources)), thread_name_prefix="acquisition")
+        self._thread = threading.Thread(target=self._run, name="acquisition-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Scheduler thread: submits every due source and sleeps until the next one is due
+    def _run(self):
+        while self._running:
+            now = self.clock()
+            next_wakeup = now + 1.0
+            for source in list(self.sources.values()):
+                if source.name in self._in_flight:
+                    continue
+                if source.enabled is not None and not source.enabled():
+                    continue
+                if now >= source.next_due:
+                    self._in_flight.add(source.name)
+                    interval = source.interval() if callable(source.interval) else source.interval
+                    source.next_due = now + interval
+                    future = self._executor.submit(self._read, source)
+                    future.add_done_callback(lambda _f, name=source.name: self._finished(name))
+                next_wakeup = min(next_wakeup, source.next_due)
+            self._wakeup.wait(timeout=max(0.0, next_wakeup - self.clock()))
+            self._wakeup.clear()
+
+    def _finished(self, name):
+        self._in_flight.discard(name)
+        self._wakeup.set()
+
+    # Runs on a worker thread
+    def _read(self, source):
+        started = self.clock()
+        try:
+            value = source.fetch()
+            error = None
+        except Exception as e:
+            value = None
+            error = e
+        self._publish(source.name, value, error, started, self.clock())
+        if error is None and value is not None:
+            self._notify(source.name, value)
+
+    def _notify(self, name, value):
+        for callback in self._listeners:
+            try:
+                callback(name, value)
+            except Exception as e:
+                print(f"Error in {name} listener: {e}")
+
+    def _publish(self, name, value, error, started, finished):
+        with self._publish_lock:
+            sources = dict(self.snapshot.sources)
+            previous = sources.get(name) or SourceState(None, None, None, None, 0, 0)
+            if error is None and value is not None:
+                state = previous._replace(value=value, updated_at=finished, latency=finished - started,
+                                          last_error=None, reads=previous.reads + 1)
+            else:
+                if error is not None:
+                    print(f"Error reading {name}: {error}")
+                state = previous._replace(latency=finished - started,
+                                          last_error=str(error) if error is not None else "no data",
+                                          reads=previous.reads + 1, errors=previous.errors + 1)
+            sources[name] = state
+            # Replacing the attribute is atomic; readers see the old or the new snapshot, never a mix
+            self.snapshot = Snapshot(sources, self.snapshot.version + 1, finished)
+
+    # One line per source: last latency, staleness and error count
+    def report(self):
+        snapshot = self.snapshot
+        now = self.clock()
+        lines = []
+        for name, state in snapshot.sources.items():
+            staleness = snapshot.staleness(name, now)
+            latency = f"{state.latency * 1000:.0f} ms" if state.latency is not None else "n/a"
+            stale = f"{staleness:.1f} s" if staleness is not None else "never"
+            lines.append(f"{name}: latency {latency}, stale {stale}, {state.errors}/{state.reads} errors")
+        return lines
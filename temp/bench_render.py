@@ -0,0 +1,190 @@
+# Frame-time benchmark and golden-frame check for the dhtui display.
+#
+# Renders the display headless (SDL dummy driver) with a simulated clock and scripted
+# readings, so results are repeatable on any Linux machine. For each resolution it
+# reports per-widget draw time, whole-frame p50/p99 and frames per CPU-second, then
+# compares a fixed reference frame against the PNGs in golden/.
+#
+#   python bench_render.py                    # benchmark and check golden frames
+#   python bench_render.py --update-golden    # rewrite the golden frames
+#   python bench_render.py --sizes 1024x600,1920x1080 --frames 600
+import argparse
+import collections
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import dhtui
+from acquisition import Snapshot, SourceState
+from locations import WeatherTable
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+DEFAULT_SIZES = "800x480,1024x600,1280x720,1920x1080,3840x2160"
+# One weather code per icon family, cycled during the benchmark
+WEATHER_CODES = [0, 2, 45, 53, 63, 73, 81, 86, 95]
+
+# A golden frame matches if few pixels differ noticeably (font hinting can shift edges)
+PIXEL_TOLERANCE = 32 # Per-channel difference that counts as "changed"
+MAX_CHANGED_FRACTION = 0.002
+
+
+# Deterministic readings for frame n: values drift so gauges and circles repaint,
+# and the weather code changes every 120 frames
+def scripted_snapshot(frame):
+    phase = frame / 40
+    names = dhtui.locations.names()
+    weather = WeatherTable(names, {
+        "temperature_2m": [8 + 6 * math.sin(phase / 3 + i) for i in range(len(names))],
+        "relative_humidity_2m": [70 + 15 * math.cos(phase / 4 + i) for i in range(len(names))],
+        "wind_speed_10m": [3 + 2 * math.sin(phase / 2) for _ in names],
+        "weather_code": [WEATHER_CODES[(frame // 120 + i) % len(WEATHER_CODES)] for i in range(len(names))],
+        "apparent_temperature": [5 + 6 * math.sin(phase / 3 + i) for i in range(len(names))],
+        "sunlight": [50 + 40 * math.sin(phase / 6 + i) for i in range(len(names))],
+        "temperature_2m_max": [14.0 + i for i in range(len(names))],
+        "temperature_2m_min": [2.0 + i for i in range(len(names))],
+    }, times=[frame + 1] * len(names))
+    values = {
+        "indoor": (22 + 3 * math.sin(phase), 45 + 10 * math.cos(phase * 0.7), frame),
+        "weather": weather,
+        "cpu_temperature": 48 + 8 * math.sin(phase / 5),
+        "system_stats": {"memory": 35 + 5 * math.sin(phase / 7), "storage": 61.0},
+    }
+    sources = {name: SourceState(value, 0.0, 0.0, None, 1, 0) for name, value in values.items()}
+    return Snapshot(sources, frame + 1, 0.0)
+
+
+def reset_display_values():
+    dhtui.display_temperature_c = None
+    dhtui.display_humidity = None
+    dhtui.last_smoothing_ms = None
+    dhtui.init_derived_metrics() # Fresh high/low and trend trackers, fed by apply_snapshot()
+
+
+# Wraps every widget's draw() so its time is recorded under the widget's name
+def instrument_widgets(timings):
+    for widget in dhtui.widgets:
+        def timed_draw(surface, state, original=widget.draw, name=widget.name):
+            start = time.perf_counter()
+            rect = original(surface, state)
+            timings[name].append(time.perf_counter() - start)
+            return rect
+        widget.draw = timed_draw
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def render_frame(frame, step_ms):
+    dhtui.clock.advance(step_ms)
+    dhtui.apply_snapshot(scripted_snapshot(frame))
+    dhtui.update_outdoor_values(dhtui.clock.ticks())
+    dhtui.update_display_values(dhtui.clock.ticks())
+    dirty_rects = dhtui.draw_screen()
+    if dirty_rects:
+        pygame.display.update(dirty_rects)
+    return dirty_rects
+
+
+def benchmark(size, frames, step_ms):
+    dhtui.clock = dhtui.SimulatedClock()
+    dhtui.init_display(headless=True, size=size)
+    reset_display_values()
+    dhtui.apply_snapshot(scripted_snapshot(0))
+    dhtui.draw_screen() # Builds the widgets and draws the first full frame
+
+    widget_timings = collections.defaultdict(list)
+    instrument_widgets(widget_timings)
+
+    frame_times = []
+    pixels = 0
+    cpu_start = time.process_time()
+    for frame in range(1, frames + 1):
+        start = time.perf_counter()
+        dirty_rects = render_frame(frame, step_ms)
+        frame_times.append(time.perf_counter() - start)
+        pixels += sum(rect.width * rect.height for rect in dirty_rects)
+    cpu_seconds = time.process_time() - cpu_start
+
+    # Worst case: every widget repainted
+    full_times = []
+    for _ in range(20):
+        start = time.perf_counter()
+        pygame.display.update(dhtui.draw_screen(force=True))
+        full_times.append(time.perf_counter() - start)
+
+    return {
+        "frame_p50_ms": percentile(frame_times, 0.5) * 1000,
+        "frame_p99_ms": percentile(frame_times, 0.99) * 1000,
+        "full_redraw_p50_ms": percentile(full_times, 0.5) * 1000,
+        "frames_per_cpu_second": frames / cpu_seconds if cpu_seconds else float("inf"),
+        "pixels_per_frame": pixels / frames,
+        "widgets": {name: (len(samples), sum(samples) / len(samples) * 1000)
+                    for name, samples in sorted(widget_timings.items())},
+    }
+
+
+# Renders the fixed reference frame used for golden comparisons
+def reference_frame(size):
+    dhtui.clock = dhtui.SimulatedClock()
+    dhtui.init_display(headless=True, size=size)
+    reset_display_values()
+    dhtui.apply_snapshot(scripted_snapshot(0))
+    dhtui.update_outdoor_values(0)
+    dhtui.update_display_values(dhtui.clock.ticks())
+    dhtui.draw_screen(force=True)
+    return dhtui.screen
+
+
+def check_golden(size, update):
+    path = os.path.join(GOLDEN_DIR, f"frame_{size[0]}x{size[1]}.png")
+    surface = reference_frame(size)
+    if update or not os.path.exists(path):
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        pygame.image.save(surface, path)
+        return True, f"wrote {os.path.relpath(path)}"
+
+    golden = pygame.image.load(path)
+    if golden.get_size() != surface.get_size():
+        return False, f"size {surface.get_size()} != golden {golden.get_size()}"
+    diff = np.abs(pygame.surfarray.array3d(surface).astype(np.int16)
+                  - pygame.surfarray.array3d(golden).astype(np.int16)).max(axis=2)
+    changed = float((diff > PIXEL_TOLERANCE).mean())
+    ok = changed <= MAX_CHANGED_FRACTION
+    return ok, f"{changed:.3%} of pixels differ (limit {MAX_CHANGED_FRACTION:.1%})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dhtui rendering headless")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated WIDTHxHEIGHT list")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--step-ms", type=int, default=250, help="simulated time between frames")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite the golden frames")
+    parser.add_argument("--no-golden", action="store_true", help="skip the golden frame check")
+    args = parser.parse_args()
+
+    sizes = [dhtui.parse_size(text) for text in args.sizes.split(",")]
+    failures = 0
+    for size in sizes:
+        results = benchmark(size, args.frames, args.step_ms)
+        print(f"== {size[0]}x{size[1]}: frame p50 {results['frame_p50_ms']:.2f} ms, "
+              f"p99 {results['frame_p99_ms']:.2f} ms, full redraw p50 {results['full_redraw_p50_ms']:.2f} ms, "
+              f"{results['frames_per_cpu_second']:.0f} frames/CPU-s, {results['pixels_per_frame']:,.0f} px/frame")
+        for name, (count, mean_ms) in results["widgets"].items():
+            print(f"   {name:<18} {count:5d} draws  {mean_ms:7.3f} ms mean")
+        if not args.no_golden:
+            ok, message = check_golden(size, args.update_golden)
+            print(f"   golden: {'ok' if ok else 'MISMATCH'} ({message})")
+            failures += not ok
+
+    pygame.quit()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+# Derived values for the dhtui display: today's high/low, dew point, heat index,
+# absolute humidity, EWMA smoothing and trends.
+#
+# Every new reading updates the trackers in O(1) (amortised for the high/low deques),
+# so nothing is recomputed from history per frame. The formulas and the EWMA are
+# written over NumPy arrays and work the same on single values, so after a restart
+# the trackers are rebuilt from a whole day of stored samples in one vectorised pass
+# (backfill()) and then continue sample by sample.
+#
+# Trends compare a fast and a slow EWMA: on a steady ramp the slow one lags behind
+# the fast one by rate * (slow tau - fast tau), which gives the rate of change
+# without keeping a window of samples.
+import collections
+import datetime
+import math
+
+import numpy as np
+
+MAX_EXPONENT = 600.0 # Largest exp() argument used in one EWMA block (e^709 overflows)
+
+
+# --- psychrometrics (arrays or scalars) ---
+# Dew point in °C (Magnus formula, Sonntag 1990 coefficients)
+def dew_point(temperature_c, humidity):
+    temperature_c = np.asarray(temperature_c, dtype=np.float64)
+    humidity = np.clip(np.asarray(humidity, dtype=np.float64), 0.1, 100.0) # log(0) below
+    gamma = np.log(humidity / 100.0) + 17.62 * temperature_c / (243.12 + temperature_c)
+    return 243.12 * gamma / (17.62 - gamma)
+
+
+# Heat index ("feels like" from temperature and humidity) in °C, NOAA's Rothfusz
+# regression with its low and high humidity adjustments. Below about 27 °C it is
+# close to the temperature itself.
+def heat_index(temperature_c, humidity):
+    t = np.asarray(temperature_c, dtype=np.float64) * 9 / 5 + 32
+    rh = np.asarray(humidity, dtype=np.float64)
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 6.83783e-3 * t * t
+            - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh + 8.5282e-4 * t * rh * rh
+            - 1.99e-6 * t * t * rh * rh)
+    dry = (rh < 13) & (t >= 80) & (t <= 112)
+    full = np.where(dry, full - (13 - rh) / 4 * np.sqrt(np.clip((17 - np.abs(t - 95.0)) / 17, 0, None)), full)
+    humid = (rh > 85) & (t >= 80) & (t <= 87)
+    full = np.where(humid, full + (rh - 85) / 10 * (87 - t) / 5, full)
+    index = np.where((simple + t) / 2 < 80, simple, full)
+    return (index - 32) * 5 / 9
+
+
+# Absolute humidity in g/m³
+def absolute_humidity(temperature_c, humidity):
+    temperature_c = np.asarray(temperature_c, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    saturation_hpa = 6.112 * np.exp(17.67 * temperature_c / (temperature_c + 243.5))
+    return saturation_hpa * humidity * 2.1674 / (273.15 + temperature_c)
+
+
+# --- smoothing ---
+# EWMA of irregularly spaced samples with time constant tau (seconds): each sample
+# moves the average by 1 - exp(-dt / tau). Returns the average after every sample.
+# Without an initial level the first sample starts it.
+#
+# Unrolled, y[n] = exp(-L[n]) * (y0 + sum(a[k] * x[k] * exp(L[k]))) with L the summed
+# dt / tau, so the whole series is a cumulative sum. The samples are cut into blocks
+# whose decay stays below MAX_EXPONENT to keep exp() finite.
+def ewma(times, values, tau, initial=None, initial_time=None):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(values)
+    if not len(values):
+        return out
+    if initial is None:
+        initial, initial_time = values[0], times[0]
+    steps = np.clip(np.diff(np.r_[initial_time, times]), 0, None) / tau
+    decay = np.cumsum(steps)
+    weights = -np.expm1(-steps) # 1 - exp(-dt / tau)
+
+    level = initial
+    start = 0
+    while start < len(values):
+        base = decay[start]
+        end = max(start + 1, int(np.searchsorted(decay, base + MAX_EXPONENT, side="right")))
+        relative = decay[start:end] - base
+        level = level * math.exp(-steps[start]) # Decay up to the block's first sample
+        summed = np.cumsum(weights[start:end] * values[start:end] * np.exp(relative))
+        out[start:end] = np.exp(-relative) * (level + summed)
+        level = out[end - 1]
+        start = end
+    return out
+
+
+class Ewma:
+    def __init__(self, tau):
+        self.tau = tau
+        self.value = None
+        self.time = None
+
+    def add(self, t, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += (value - self.value) * -math.expm1(-max(0.0, t - self.time) / self.tau)
+        self.time = t
+
+    # Folds in many samples at once (all newer than the last one added)
+    def extend(self, times, values):
+        if not len(values):
+            return
+        smoothed = ewma(times, values, self.tau, self.value, self.time)
+        self.value = float(smoothed[-1])
+        self.time = float(times[-1])
+
+
+# Rate of change per hour from a fast and a slow EWMA
+class Trend:
+    def __init__(self, fast_tau=300.0, slow_tau=1200.0, threshold=0.5):
+        self.fast = Ewma(fast_tau)
+        self.slow = Ewma(slow_tau)
+        self.threshold = threshold # Per hour; slower changes count as steady
+
+    def add(self, t, value):
+        self.fast.add(t, value)
+        self.slow.add(t, value)
+
+    def extend(self, times, values):
+        self.fast.extend(times, values)
+        self.slow.extend(times, values)
+
+    @property
+    def rate(self):
+        if self.fast.value is None:
+            return None
+        return (self.fast.value - self.slow.value) / (self.slow.tau - self.fast.tau) * 3600
+
+    # 1 rising, -1 falling, 0 steady, None before the first sample
+    @property
+    def direction(self):
+        rate = self.rate
+        if rate is None:
+            return None
+        return 1 if rate > self.threshold else -1 if rate < -self.threshold else 0
+
+
+# --- high/low ---
+def local_midnight(t):
+    return datetime.datetime.combine(datetime.datetime.fromtimestamp(t).date(), datetime.time()).timestamp()
+
+
+def next_local_midnight(t):
+    day = datetime.datetime.fromtimestamp(t).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+
+# Lowest and highest value since local midnight, and within the last `window`
+# seconds if one is given. Two monotonic deques of (time, value): the front of each is
+# the current extreme, and a value that can never become the extreme again (an older
+# one beaten by a newer sample) is dropped when the newer sample arrives.
+class RollingExtremes:
+    def __init__(self, window=None):
+        self.window = window
+        self._lows = collections.deque() # Increasing values
+        self._highs = collections.deque() # Decreasing values
+        self._day_end = None
+
+    def add(self, t, value):
+        if self._day_end is None or t >= self._day_end:
+            self._lows.clear()
+            self._highs.clear()
+            self._day_end = next_local_midnight(t)
+        if self.window is not None:
+            while self._lows and self._lows[0][0] <= t - self.window:
+                self._lows.popleft()
+            while self._highs and self._highs[0][0] <= t - self.window:
+                self._highs.popleft()
+        while self._lows and self._lows[-1][1] >= value:
+            self._lows.pop()
+        self._lows.append((t, value))
+        while self._highs and self._highs[-1][1] <= value:
+            self._highs.pop()
+        self._highs.append((t, value))
+
+    # Folds in many samples at once (all newer than the last one added): the deques are
+    # the samples that are below (above) every later sample in the current span
+    def extend(self, times, values):
+        if not len(values):
+            return
+        times = np.r_[[t for t, _ in self._lows], [t for t, _ in self._highs], times]
+        values = np.r_[[v for _, v in self._lows], [v for _, v in self._highs], values]
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        last = float(times[-1])
+        start = local_midnight(last)
+        if self.window is not None:
+            start = max(start, np.nextafter(last - self.window, np.inf))
+        span = times >= start
+        times, values = times[span], values[span]
+
+        later_low = np.r_[np.minimum.accumulate(values[::-1])[::-1][1:], np.inf]
+        later_high = np.r_[np.maximum.accumulate(values[::-1])[::-1][1:], -np.inf]
+        keep_low = values < later_low
+        keep_high = values > later_high
+        self._lows = collections.deque(zip(times[keep_low].tolist(), values[keep_low].tolist()))
+        self._highs = collections.deque(zip(times[keep_high].tolist(), values[keep_high].tolist()))
+        self._day_end = next_local_midnight(last)
+
+    @property
+    def low(self):
+        return self._lows[0][1] if self._lows else None
+
+    @property
+    def high(self):
+        return self._highs[0][1] if self._highs else None
+
+
+# --- per-place trackers ---
+# Everything derived from one temperature/humidity pair (a sensor or an outdoor
+# location). Samples not newer than the last one, and gaps (NaN), are ignored, so the
+# same reading can be offered on every snapshot.
+class DerivedMetrics:
+    def __init__(self, temperature_threshold=0.5, humidity_threshold=2.0):
+        self.temperature = RollingExtremes()
+        self.humidity = RollingExtremes()
+        self.temperature_trend = Trend(threshold=temperature_threshold) # °C per hour
+        self.humidity_trend = Trend(threshold=humidity_threshold) # Percentage points per hour
+        self.last_time = None
+        self.last_temperature = None
+        self.dew_point = None
+        self.heat_index = None
+        self.absolute_humidity = None
+
+    def add(self, t, temperature_c, humidity):
+        if self.last_time is not None and t <= self.last_time:
+            return False
+        if not (math.isfinite(temperature_c) and math.isfinite(humidity)):
+            return False
+        self.last_time = t
+        self.temperature.add(t, temperature_c)
+        self.humidity.add(t, humidity)
+        self.temperature_trend.add(t, temperature_c)
+        self.humidity_trend.add(t, humidity)
+        self._update(temperature_c, humidity)
+        return True
+
+    # Rebuilds the state from stored samples (e.g. the day so far from the history)
+    def backfill(self, temperature_times, temperatures, humidity_times, humidities):
+        temperature_times, temperatures = _newer(temperature_times, temperatures, self.last_time)
+        humidity_times, humidities = _newer(humidity_times, humidities, self.last_time)
+        self.temperature.extend(temperature_times, temperatures)
+        self.humidity.extend(humidity_times, humidities)
+        self.temperature_trend.extend(temperature_times, temperatures)
+        self.humidity_trend.extend(humidity_times, humidities)
+        if len(temperatures) and len(humidities):
+            self.last_time = float(max(temperature_times[-1], humidity_times[-1]))
+            self._update(float(temperatures[-1]), float(humidities[-1]))
+
+    def _update(self, temperature_c, humidity):
+        self.last_temperature = temperature_c
+        self.dew_point = float(dew_point(temperature_c, humidity))
+        self.heat_index = float(heat_index(temperature_c, humidity))
+        self.absolute_humidity = float(absolute_humidity(temperature_c, humidity))
+
+
+# Finite samples after `after`, as float arrays
+def _newer(times, values, after):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = np.isfinite(values)
+    if after is not None:
+        keep &= times > after
+    return times[keep], values[keep]
@@ -1,35 +1,65 @@
 import time
-import board
-import adafruit_dht # Temporarily commented out to run in simulation mode
-import pygame
+from startup import StartupTimer, LastKnownValues # Cold start: phase timings, last values
+from files import default_data_dir # DHTUI_DATA_DIR
+startup_timer = StartupTimer() # Import and startup phases, printed once everything is running
+with startup_timer.phase("import pygame"):
+    import pygame
+    from pygame.locals import * # Added for QUIT and KEYDOWN
 import sys
 import math
 import os # Added for environment variables
-import requests # Added for making HTTP requests to weather API
 import datetime # Added for clock and calendar
-from pygame.locals import * # Added for QUIT and KEYDOWN
-import subprocess # Added for running shell commands like vcgencmd
-import psutil # Added for system monitoring (memory, disk usage)
-import shutil # Added for disk usage
+import threading
+import functools
+import signal
+with startup_timer.phase("import dhtui modules"):
+    from text_cache import TextCache, DigitAtlas # Cached text surfaces and digit glyphs
+    from acquisition import AcquisitionEngine # Background sensor/weather/system readers
+    from weather_client import WeatherClient, OPEN_METEO_URL, default_cache_path # Cached Open-Meteo client
+    from locations import LocationRegistry # Multi-location batched weather
+    from sensor_worker import SensorReader, SensorSpec, parse_sensor_specs # DHT reads in a separate process
+    from telemetry import AdaptiveSampler, SystemStatsSource, make_thermal_source # CPU temp, memory, storage
+    from frame_governor import FrameGovernor # Sleeps between frames while nothing moves
+    from metrics import MetricsRegistry, MetricsServer, SignalProfiler # Stage timings, counters, /metrics
+    from hub import HubPublisher, HubSubscriber # Shares weather and sensor readings across displays
+    from frame_stream import FrameStreamer # Mirrors the screen to browsers and other displays
+    from recording import Recorder # Field recordings for replay.py
+    from layout import load_layout, compile_layout, DEFAULT_LAYOUT_PATH # Positions and fonts from layout.json
+# The NumPy-backed forecast and history modules and requests are imported by the
+# background startup, after the first frame is on screen.
+
+# --- LAN DATA HUB ---
+# With DHTUI_HUB_MODE=publish this display shares its weather and sensor readings with
+# the other displays; with DHTUI_HUB_MODE=subscribe it takes them from the hub at
+# DHTUI_HUB_ADDRESS instead of polling, and only fetches locally while the hub is
+# quiet. CPU temperature, memory and storage always describe the local Pi.
+HUB_MODE = os.environ.get("DHTUI_HUB_MODE", "") # "", "publish" or "subscribe"
+HUB_ADDRESS = os.environ.get("DHTUI_HUB_ADDRESS", "tcp://0.0.0.0:5007") # or unix:///path/to/hub.sock
+HUB_SOURCES = ["indoor", "weather"] # Including every "indoor:<sensor>" source
+hub_publisher = None
+hub_subscriber = None
 
-# --- PYGAME SETUP ---
-pygame.init()
-pygame.mixer.quit() # Disable audio to prevent ALSA errors
-pygame.mouse.set_visible(False) # Hide the mouse cursor
-
-# Environment variables for Raspberry Pi framebuffer (Temporarily commented out)
-os.environ['SDL_VIDEODRIVER'] = 'fbcon'
-os.environ['SDL_FBDEV'] = '/dev/fb1'
-os.environ['SDL_MOUSEDRV'] = 'TSLIB'
-os.environ['SDL_MOUSEDEV'] = '/dev/input/touchscreen'
-
-# Screen dimensions
-info = pygame.display.Info()
-SCREEN_WIDTH = info.current_w
-SCREEN_HEIGHT = info.current_h
-# Set the screen to half width for gauges, and leave the other half for clock/calendar
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN) # Re-enabled FULLSCREEN
-pygame.display.set_caption("DHT11 Sensor Data")
+# --- SENSOR SETUP ---
+# The DHT11 on GPIO 4 (physical pin 7) is read by its own process pinned to its own core.
+# DHTUI_SENSOR selects another sensor ("dht22:D17") or "fake" for simulated readings;
+# if the sensor cannot be initialized the process falls back to simulation mode.
+# Several sensors are given as "living=dht22:D17;kitchen=dht11:D4@5" (name=backend,
+# optionally @seconds between reads); they are read one after another, never at once.
+# The indoor gauges show the first sensor unless DHTUI_INDOOR_TEMP_SENSOR or
+# DHTUI_INDOOR_HUMIDITY_SENSOR names another one (also one published by the hub).
+# Hub subscribers have no sensor of their own unless DHTUI_SENSOR says so; "none" disables it.
+SENSORS = parse_sensor_specs(os.environ.get("DHTUI_SENSOR", "none" if HUB_MODE == "subscribe" else "dht11:D4"))
+DEFAULT_SENSOR = SENSORS[0].name if SENSORS else "indoor"
+INDOOR_TEMPERATURE_SENSOR = os.environ.get("DHTUI_INDOOR_TEMP_SENSOR", DEFAULT_SENSOR)
+INDOOR_HUMIDITY_SENSOR = os.environ.get("DHTUI_INDOOR_HUMIDITY_SENSOR", DEFAULT_SENSOR)
+sensor_reader = None # Started by start_sensor_process()
+
+# Function to name the acquisition source of a sensor: "indoor" for the default one,
+# so single-sensor setups keep their history, hub and last-values names
+def sensor_source_name(sensor_name):
+    return "indoor" if sensor_name == "indoor" else f"indoor:{sensor_name}"
+
+SENSOR_SOURCES = [sensor_source_name(spec.name) for spec in SENSORS]
 
 # Colors
 WHITE = (255, 255, 255)
@@ -47,82 +77,246 @@ ORANGE = (255, 165, 0) # For CPU temperature
 PURPLE = (128, 0, 128) # For Memory usage
 BROWN = (139, 69, 19) # For Storage usage
 
-# Fonts
-label_font_size = 40
-value_font_size = 180 # Increased for larger numbers on the new gauge
-min_max_font_size = 30
-status_font_size = 30 # Re-added for status message
+# Font sizes, positions and spacing are in layout.json (see LAYOUT below)
 
-font_label = pygame.font.Font(None, label_font_size)
-font_value = pygame.font.Font(None, value_font_size)
-font_min_max = pygame.font.Font(None, min_max_font_size)
-font_status = pygame.font.Font(None, status_font_size) # New font for status
-font_cpu_temp = pygame.font.Font(None, 28) # Smaller font for CPU temp value
-font_cpu_label = pygame.font.Font(None, 20) # Very small font for "CPU" label
+# Timer for printing text cache statistics
+TEXT_CACHE_REPORT_INTERVAL = 60000 # 60 seconds
+last_text_cache_report_time = 0
 
-# New fonts for clock and calendar
-font_time = pygame.font.Font(None, 220) # Increased size
-font_date = pygame.font.Font(None, 80) # Kept at 80
-font_detail = pygame.font.Font(None, 50) # New font for wind/weather details
+# --- CLOCK ---
+# Everything that shows or schedules by time goes through `clock`, so headless runs and
+# benchmarks can swap in a deterministic simulated clock.
+class RealClock:
+    def now(self):
+        return datetime.datetime.now()
 
-# --- SENSOR SETUP ---
-# Set up DHT11 sensor on GPIO 4 (physical pin 7)
-try:
-    dht_device = adafruit_dht.DHT11(board.D4) # Temporarily commented out to run in simulation mode
-    # dht_device = None # Force simulation mode for now
-except Exception as e:
-    print(f"Failed to initialize DHT11 sensor: {e}")
-    print("This script will run in simulation mode.")
-    dht_device = None # Set to None to handle simulation
+    def ticks(self):
+        return pygame.time.get_ticks() # Milliseconds since pygame.init()
+
+    def timestamp(self):
+        return time.time()
+
+class SimulatedClock:
+    def __init__(self, start=datetime.datetime(2024, 1, 1, 12, 0, 0)):
+        self.start = start
+        self.elapsed_ms = 0
+
+    def advance(self, milliseconds):
+        self.elapsed_ms += milliseconds
+
+    def now(self):
+        return self.start + datetime.timedelta(milliseconds=self.elapsed_ms)
+
+    def ticks(self):
+        return self.elapsed_ms
+
+    def timestamp(self):
+        return self.start.timestamp() + self.elapsed_ms / 1000
+
+clock = RealClock()
+
+# --- PYGAME SETUP ---
+# Screen, fonts and text cache are created by init_display(); nothing touches the
+# display at import time, so the module can be imported off-device.
+screen = None
+SCREEN_WIDTH = SCREEN_HEIGHT = None
+
+# Function to open the display. headless uses SDL's dummy driver with the given size.
+def init_display(headless=False, size=None):
+    global screen, SCREEN_WIDTH, SCREEN_HEIGHT
+
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+    pygame.init()
+    pygame.mixer.quit() # Disable audio to prevent ALSA errors
+    pygame.mouse.set_visible(False) # Hide the mouse cursor
+
+    if headless:
+        SCREEN_WIDTH, SCREEN_HEIGHT = size or (1024, 600)
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    else:
+        # Environment variables for Raspberry Pi framebuffer (Temporarily commented out)
+        os.environ['SDL_VIDEODRIVER'] = 'fbcon'
+        os.environ['SDL_FBDEV'] = '/dev/fb1'
+        os.environ['SDL_MOUSEDRV'] = 'TSLIB'
+        os.environ['SDL_MOUSEDEV'] = '/dev/input/touchscreen'
+
+        # Screen dimensions
+        info = pygame.display.Info()
+        SCREEN_WIDTH, SCREEN_HEIGHT = size or (info.current_w, info.current_h)
+        # Set the screen to half width for gauges, and leave the other half for clock/calendar
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN) # Re-enabled FULLSCREEN
+    pygame.display.set_caption("DHT11 Sensor Data")
+    weather_icon_atlases.clear()
+    apply_layout(compile_layout(load_layout_spec(), (SCREEN_WIDTH, SCREEN_HEIGHT)))
+    return screen
+
+# --- LAYOUT ---
+# Where everything goes and how big the fonts are is described in layout.json
+# (DHTUI_LAYOUT points at another file). It is compiled into a table of rects and
+# fonts when the display opens, scaled to its resolution, and compiled again only
+# when the file changes; the file is checked every LAYOUT_CHECK_INTERVAL.
+LAYOUT_PATH = os.environ.get("DHTUI_LAYOUT", DEFAULT_LAYOUT_PATH)
+LAYOUT_CHECK_INTERVAL = 5000 # 5 seconds
+last_layout_check_time = 0
+layout = None # CompiledLayout for the current screen
+layout_spec = None
+layout_mtime = None
+
+# Function to read layout.json, or reuse what was read if the file has not changed
+def load_layout_spec():
+    global layout_spec, layout_mtime
+    mtime = os.path.getmtime(LAYOUT_PATH)
+    if layout_spec is None or mtime != layout_mtime:
+        layout_spec = load_layout(LAYOUT_PATH)
+        layout_mtime = mtime
+    return layout_spec
+
+# Function to make a compiled layout current: its fonts, and the text caches built from them
+def apply_layout(compiled):
+    global layout, widgets
+    global font_label, font_value, font_min_max, font_status, font_cpu_temp, font_cpu_label
+    global font_time, font_date, font_detail, text_cache, digit_atlases
+    layout = compiled
+    widgets = None # Built from the new table on the next draw_screen()
+
+    fonts = compiled.fonts
+    font_label = fonts["label"] # Gauge titles
+    font_value = fonts["value"] # Big gauge numbers
+    font_min_max = fonts["min_max"] # Detail line inside a gauge
+    font_status = fonts["status"]
+    font_cpu_temp = fonts["cpu_temp"] # Value inside a stat circle
+    font_cpu_label = fonts["cpu_label"] # "CPU", "MEM", "DISK"
+    font_time = fonts["time"] # Clock
+    font_date = fonts["date"]
+    font_detail = fonts["detail"] # Wind and weather lines
+
+    # --- TEXT CACHE ---
+    # Rendered text surfaces are reused across frames; the big gauge and clock numbers
+    # are composed from glyphs rasterised once per layout.
+    text_cache = TextCache(max_entries=256)
+    digit_atlases = {
+        (font_value, PALE_CYAN): DigitAtlas(font_value, PALE_CYAN),
+        (font_time, PALE_CYAN): DigitAtlas(font_time, PALE_CYAN),
+    }
+
+    # Labels that never change are rendered once here
+    for static_label in ["Indoor Temp", "Indoor Humid", "Outside Temp", "Outside Humid"]:
+        text_cache.pin(static_label, font_label, PALE_CYAN)
+    for static_label in ["CPU", "MEM", "DISK"]:
+        text_cache.pin(static_label, font_cpu_label, PALE_CYAN)
+
+# Function to recompile the layout if layout.json changed. A broken file is reported
+# and the current layout kept.
+def reload_layout_if_changed():
+    global layout_spec, layout_mtime
+    mtime = None
+    try:
+        mtime = os.path.getmtime(LAYOUT_PATH)
+        if mtime == layout_mtime:
+            return False
+        apply_layout(compile_layout(load_layout_spec(), (SCREEN_WIDTH, SCREEN_HEIGHT)))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Keeping the current layout, could not load {LAYOUT_PATH}: {e}")
+        if mtime is not None:
+            layout_mtime = mtime # Report a broken file once, not every check
+            layout_spec = None # Read it again on the next change
+        return False
+    print(f"Layout reloaded from {LAYOUT_PATH}")
+    return True
+
+# Function to scale a size in design pixels (line widths, small offsets) to the screen
+def px(value):
+    return layout.px(value)
 
 # --- WEATHER API SETUP ---
-WEATHER_API_URL = "https://api.open-meteo.com/v1/forecast"
+# DHTUI_WEATHER_URL points the client at another server (e.g. a local stub for testing)
+WEATHER_API_URL = os.environ.get("DHTUI_WEATHER_URL", OPEN_METEO_URL)
 WOLFSBURG_LAT = 52.427547
 WOLFSBURG_LON = 10.780420
 
+# Locations fetched together in one request per refresh.
+# DHTUI_LOCATIONS overrides the default, e.g. "Plant:52.42,10.78;HQ:48.13,11.58"
+locations = LocationRegistry.from_spec(os.environ.get("DHTUI_LOCATIONS", ""))
+if len(locations) == 0:
+    locations.add("Wolfsburg", WOLFSBURG_LAT, WOLFSBURG_LON)
+
+# Which location the outdoor gauges show. On a wall of panels each one can pick its own
+# site with DHTUI_PANEL_LOCATION; a single panel can cycle through all of them instead.
+PANEL_LOCATION = os.environ.get("DHTUI_PANEL_LOCATION") or locations.names()[0]
+LOCATION_ROTATE_INTERVAL = int(os.environ.get("DHTUI_LOCATION_ROTATE_MS", "0")) # 0 = no cycling
+
+# Shared keep-alive session with an on-disk response cache (created by init_data_sources())
+weather_client = None
+
+# Hourly and daily forecast arrays are fetched about once an hour; "now" values,
+# daily high/low, sunlight and feels-like are interpolated from them locally.
+forecast = None
+forecast_response = None # Response the current forecast was parsed from
+
 # Store last known good outside values
+weather_table = None # WeatherTable with one row per location
+outdoor_location_name = PANEL_LOCATION
 outdoor_temperature_c = None
 outdoor_humidity = None
 outdoor_wind_speed = None # New global variable for wind speed
 outdoor_weather_description = "N/A" # New global variable for weather description
-
-# Function to fetch outside weather data
+outdoor_feels_like_c = None
+outdoor_sunlight = None # Percent, 100 - cloud cover
+outdoor_temperature_max = None # Today's high/low
+outdoor_temperature_min = None
+
+# Parameters for the forecast request (all locations at once)
+def get_weather_params():
+    from forecast import forecast_params
+    return forecast_params(locations)
+
+# Function to turn an API response into the forecast used between fetches
+def parse_forecast(data):
+    global forecast, forecast_response
+    # print(f"API Response: {data}") # Added for debugging
+    if data is not forecast_response: # Cached responses are the same object until the next fetch
+        from forecast import Forecast
+        forecast = Forecast.from_response(data, locations.names())
+        forecast_response = data
+        if recorder is not None:
+            recorder.record_response(data)
+    return forecast
+
+# Function to get outside weather for every location.
+# Runs on an acquisition thread; the client serves the cached forecast until the next
+# hourly update, so this is usually just an interpolation. Raises on failure so the
+# last good values stay on screen.
 def get_outside_weather():
-    global outdoor_temperature_c, outdoor_humidity, outdoor_wind_speed, outdoor_weather_description
-    params = {
-        "latitude": WOLFSBURG_LAT,
-        "longitude": WOLFSBURG_LON,
-        "current": "temperature_2m,relative_humidity_2m,wind_speed_10m,weather_code", # Added weather_code
-        "temperature_unit": "celsius",
-        # "timezone": "UTC" # Removed API timezone request
-    }
-    try:
-        response = requests.get(WEATHER_API_URL, params=params, timeout=5)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
-        # print(f"API Response: {data}") # Added for debugging
-        if "current" in data:
-            outdoor_temperature_c = data["current"]["temperature_2m"]
-            outdoor_humidity = data["current"]["relative_humidity_2m"]
-            # Convert wind speed from m/s to km/h (1 m/s = 3.6 km/h)
-            outdoor_wind_speed = data["current"]["wind_speed_10m"] * 3.6 # Convert to km/h
-            weather_code = data["current"]["weather_code"]
-            outdoor_weather_description = get_weather_description(weather_code)
-
-            # print(f"Outside Weather: Temp={outdoor_temperature_c}°C, Humidity={outdoor_humidity}%, Wind={outdoor_wind_speed:.1f} km/h, Weather={outdoor_weather_description}")
-        else:
-            print("current data not found in API response.")
-            outdoor_temperature_c = None
-            outdoor_humidity = None
-            outdoor_wind_speed = None
-            outdoor_weather_description = "N/A"
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching outside weather: {e}")
-        outdoor_temperature_c = None
-        outdoor_humidity = None
-        outdoor_wind_speed = None
-        outdoor_weather_description = "N/A"
+    return parse_forecast(weather_client.fetch(get_weather_params())).at(clock.timestamp())
+
+# Function to pick the location the outdoor gauges show right now
+def select_outdoor_location(current_time_ms):
+    names = locations.names()
+    if LOCATION_ROTATE_INTERVAL > 0 and len(names) > 1:
+        return names[(current_time_ms // LOCATION_ROTATE_INTERVAL) % len(names)]
+    return PANEL_LOCATION
+
+# Function to copy one location's row into the outdoor globals
+def update_outdoor_values(current_time_ms):
+    global outdoor_location_name, outdoor_temperature_c, outdoor_humidity, outdoor_wind_speed, outdoor_weather_description
+    global outdoor_feels_like_c, outdoor_sunlight, outdoor_temperature_max, outdoor_temperature_min
+    outdoor_location_name = select_outdoor_location(current_time_ms)
+    row = weather_table.row(outdoor_location_name) if weather_table is not None else None
+    if row is None:
+        return
+    outdoor_temperature_c = row["temperature_2m"]
+    outdoor_humidity = row["relative_humidity_2m"]
+    # Convert wind speed from m/s to km/h (1 m/s = 3.6 km/h)
+    outdoor_wind_speed = row["wind_speed_10m"] * 3.6 if row["wind_speed_10m"] is not None else None
+    if row["weather_code"] is not None:
+        outdoor_weather_description = get_weather_description(row["weather_code"])
+    outdoor_feels_like_c = row.get("apparent_temperature")
+    outdoor_sunlight = row.get("sunlight")
+    outdoor_temperature_max = row.get("temperature_2m_max")
+    outdoor_temperature_min = row.get("temperature_2m_min")
 
 # New function to interpret WMO weather codes
 def get_weather_description(code):
@@ -158,31 +352,131 @@ target_humidity = None
 display_temperature_c = None
 display_humidity = None
 SMOOTHING_FACTOR = 0.05 # Increased for more visible transitions
+# The smoothing is time-based: SMOOTHING_FACTOR is the step per frame at 60 fps, and
+# other frame rates use the same time constant, so it looks the same at any rate.
+SMOOTHING_REFERENCE_FPS = 60
+SMOOTHING_SETTLE = 0.05 # Snap to the target once this close, so the display can go idle
+last_smoothing_ms = None # Time of the last smoothing step (None while settled)
 
 # New variables for full circle animation
 last_full_animation_time = 0  # Re-initializing at the global scope
 FULL_ANIMATION_INTERVAL = 5000  # Every 5 seconds
 FULL_ANIMATION_DURATION = 1500  # Animation lasts 1.5 seconds (full to actual)
 
-# Simulation variables
-sim_time = 0.0
-
-# Timer for reading the sensor (in milliseconds)
-# The DHT11 sensor is slow and should not be read more than once every 2 seconds.
+# Read intervals for the background acquisition sources (in milliseconds)
+# The sensor process reads the DHT11 at most every 2 seconds; picking up its
+# latest reading from shared memory is cheap, so it is polled at the same rate.
 READ_INTERVAL = 2000  # 2 seconds
-last_read_time = 0
 
-# Timer for fetching outside weather (e.g., every 5 minutes)
-WEATHER_API_INTERVAL = 10 * 1000 # 10 seconds to stay within daily free tier limits
-last_weather_api_read_time = 0
+# Interval for updating outside weather from the cached forecast. The API itself is
+# only asked again after FORECAST_UPDATE_INTERVAL (about once an hour).
+WEATHER_API_INTERVAL = 60 * 1000 # 60 seconds
 
-# Timer for reading CPU temperature (e.g., every 10 seconds)
+# Typical interval for reading CPU temperature; the sampler goes faster or slower around it
 CPU_TEMP_READ_INTERVAL = 10000 # 10 seconds
-last_cpu_temp_read_time = 0
 
-# Timer for reading Memory and Storage (e.g., every 10 seconds)
+# Typical interval for reading Memory and Storage
 SYSTEM_STATS_READ_INTERVAL = 10000 # 10 seconds
-last_system_stats_read_time = 0
+
+# Timer for printing per-source latency and staleness
+ACQUISITION_REPORT_INTERVAL = 60000 # 60 seconds
+last_acquisition_report_time = 0
+
+# --- FRAME GOVERNOR ---
+# Frames are rendered at up to MAX_FPS only while something moves; otherwise the loop
+# sleeps until the next second (or the next minute with DHTUI_IDLE_WAKE=minute).
+# Input and changed readings wake it early.
+MAX_FPS = int(os.environ.get("DHTUI_MAX_FPS", "30"))
+IDLE_WAKE = os.environ.get("DHTUI_IDLE_WAKE", "second") # "second" or "minute"
+DATA_EVENT = pygame.USEREVENT + 1 # Posted by the acquisition threads when a reading changes
+FRAME_GOVERNOR_REPORT_INTERVAL = 60000 # 60 seconds
+last_frame_governor_report_time = 0
+
+# --- METRICS ---
+# Per-stage timing histograms and error counters, served as Prometheus text on
+# http://127.0.0.1:DHTUI_METRICS_PORT/metrics (0 disables it) and logged as one JSON
+# line every minute. SIGUSR1 toggles cProfile and SIGUSR2 tracemalloc; the results
+# are written to DHTUI_PROFILE_DIR.
+METRICS_PORT = int(os.environ.get("DHTUI_METRICS_PORT", "9105"))
+PROFILE_DIR = os.environ.get("DHTUI_PROFILE_DIR") or default_data_dir()
+METRICS_LOG_INTERVAL = 60000 # 60 seconds
+last_metrics_log_time = 0
+metrics_server = None
+
+metrics = MetricsRegistry()
+STAGES = ["event_poll", "sensor_read", "weather_fetch", "cpu_temperature", "system_stats",
+          "apply_snapshot", "update_display_values", "draw_screen", "flip", "stream"]
+stage_timings = {stage: metrics.histogram("stage_seconds", "Time spent per loop or acquisition stage",
+                                          {"stage": stage}) for stage in STAGES}
+frames_counter = metrics.counter("frames_total", "Frames rendered")
+# Totals kept by the sensor process and the weather client, read when collected
+for spec in SENSORS:
+    labels = {"sensor": spec.name}
+    metrics.counter("sensor_reads_total", "DHT read attempts", labels,
+                    getter=lambda name=spec.name: sensor_reader.sensor_stats(name)["reads"])
+    metrics.counter("sensor_errors_total", "Failed DHT reads", labels,
+                    getter=lambda name=spec.name: sensor_reader.sensor_stats(name)["errors"])
+    metrics.counter("sensor_rejected_total", "DHT readings rejected as outliers", labels,
+                    getter=lambda name=spec.name: sensor_reader.sensor_stats(name)["rejected"])
+    metrics.gauge("sensor_read_lateness_max_seconds", "Largest delay of a DHT read behind its schedule", labels,
+                  getter=lambda name=spec.name: sensor_reader.sensor_stats(name)["max_lateness_ms"] / 1000)
+metrics.gauge("sensor_reads_per_second", "DHT reads per second over all sensors",
+              getter=lambda: sensor_reader.stats()["reads_per_second"])
+metrics.gauge("sensor_bus_busy_ratio", "Share of time the sensor process spent in DHT reads",
+              getter=lambda: sensor_reader.stats()["bus_busy"])
+metrics.counter("weather_api_requests_total", "Weather API requests sent",
+                getter=lambda: weather_client.stats()["network_requests"])
+metrics.counter("weather_api_failures_total", "Failed weather API requests",
+                getter=lambda: weather_client.stats()["failures"])
+for source_name in SENSOR_SOURCES + ["weather", "cpu_temperature", "system_stats"]:
+    metrics.counter("acquisition_errors_total", "Failed reads per acquisition source", {"source": source_name},
+                    getter=lambda name=source_name: acquisition.snapshot.sources[name].errors)
+metrics.gauge("time_to_first_frame_seconds", "Seconds from process start to the first frame on screen",
+              getter=lambda: startup_timer.milestones["first frame"])
+metrics.gauge("time_to_live_data_seconds", "Seconds from process start to the first fresh reading",
+              getter=lambda: startup_timer.milestones["first live reading"])
+
+# Function to start the /metrics endpoint and the profiling signal handlers
+def init_metrics():
+    global metrics_server
+    if METRICS_PORT:
+        try:
+            metrics_server = MetricsServer(metrics, port=METRICS_PORT)
+            metrics_server.start()
+            print(f"Metrics on http://{metrics_server.address[0]}:{metrics_server.address[1]}/metrics")
+        except OSError as e:
+            print(f"Metrics endpoint disabled, could not listen on port {METRICS_PORT}: {e}")
+            metrics_server = None
+    SignalProfiler(PROFILE_DIR).install()
+
+# --- FRAME STREAMING ---
+# With DHTUI_STREAM_PORT set, the screen is mirrored at http://DHTUI_STREAM_HOST:PORT/
+# (a browser page) and to `python frame_stream.py mirror URL` on a second display.
+# Only the tiles that changed in a frame are encoded and sent, and nothing is done
+# while no client is connected. Bound to localhost unless DHTUI_STREAM_HOST says otherwise.
+STREAM_PORT = int(os.environ.get("DHTUI_STREAM_PORT", "0")) # 0 disables streaming
+STREAM_HOST = os.environ.get("DHTUI_STREAM_HOST", "127.0.0.1") # 0.0.0.0 to mirror across the LAN
+frame_streamer = None
+
+metrics.counter("stream_tiles_hashed_total", "Screen tiles compared for the frame stream",
+                getter=lambda: frame_streamer.tiles_hashed)
+metrics.counter("stream_tiles_sent_total", "Changed screen tiles sent to stream clients",
+                getter=lambda: frame_streamer.tiles_sent)
+metrics.counter("stream_bytes_sent_total", "Bytes sent to stream clients", getter=lambda: frame_streamer.bytes_sent)
+metrics.gauge("stream_clients", "Connected stream clients", getter=lambda: frame_streamer.client_count())
+
+# Function to start the frame stream server
+def init_frame_stream():
+    global frame_streamer
+    if not STREAM_PORT:
+        return
+    try:
+        frame_streamer = FrameStreamer(STREAM_HOST, STREAM_PORT)
+        frame_streamer.start()
+        print(f"Streaming the screen on http://{frame_streamer.address[0]}:{frame_streamer.address[1]}/")
+    except OSError as e:
+        print(f"Frame stream disabled, could not listen on port {STREAM_PORT}: {e}")
+        frame_streamer = None
 
 # Global variable for CPU temperature
 cpu_temperature_c = None
@@ -191,47 +485,25 @@ cpu_temperature_c = None
 memory_percentage = None
 storage_percentage = None
 
-# Function to read CPU temperature
-def get_cpu_temperature():
-    global cpu_temperature_c
-    try:
-        # Run vcgencmd to get CPU temperature
-        result = subprocess.run(['vcgencmd', 'measure_temp'], capture_output=True, text=True, check=True)
-        output = result.stdout.strip()
-        # Extract temperature (e.g., "temp=45.6'C")
-        temp_str = output.split('=')[1].replace("'C", "")
-        cpu_temperature_c = float(temp_str)
-        # print(f"CPU Temperature: {cpu_temperature_c}°C") # For debugging
-    except Exception as e:
-        print(f"Error reading CPU temperature: {e}")
-        cpu_temperature_c = None
-
-# Function to get memory usage percentage
-def get_memory_usage():
-    global memory_percentage
-    try:
-        mem = psutil.virtual_memory()
-        memory_percentage = mem.percent
-        # print(f"Memory Usage: {memory_percentage}%") # For debugging
-    except Exception as e:
-        print(f"Error reading memory usage: {e}")
-        memory_percentage = None
-
-# Function to get storage usage percentage
-def get_storage_usage():
-    global storage_percentage
-    try:
-        total, used, free = shutil.disk_usage("/")
-        storage_percentage = (used / total) * 100
-        # print(f"Storage Usage: {storage_percentage:.1f}%") # For debugging
-    except Exception as e:
-        print(f"Error reading storage usage: {e}")
-        storage_percentage = None
+# --- SYSTEM TELEMETRY ---
+# CPU temperature is read from sysfs (vcgencmd only if that is missing), memory and
+# storage together from /proc/meminfo and statvfs. Both sample faster while their
+# values change and back off while they are flat. DHTUI_SYSFS_ROOT/DHTUI_PROCFS_ROOT
+# point at a fake tree for testing.
+SYSFS_ROOT = os.environ.get("DHTUI_SYSFS_ROOT", "/sys")
+PROCFS_ROOT = os.environ.get("DHTUI_PROCFS_ROOT", "/proc")
+cpu_temperature_sampler = None
+system_stats_sampler = None
 
 # Helper function to draw text
 def draw_text(surface, text, font, color, x, y, align='center'):
-    text_surface = font.render(text, True, color)
-    text_rect = text_surface.get_rect()
+    atlas = digit_atlases.get((font, color))
+    if atlas is not None and atlas.can_render(text):
+        text_surface = None
+        text_rect = pygame.Rect((0, 0), atlas.size(text))
+    else:
+        text_surface = text_cache.render(text, font, color)
+        text_rect = text_surface.get_rect()
     if align == 'center':
         text_rect.centerx = x
     elif align == 'right':
@@ -239,153 +511,421 @@ def draw_text(surface, text, font, color, x, y, align='center'):
     else:
         text_rect.left = x
     text_rect.centery = y
-    surface.blit(text_surface, text_rect)
+    if text_surface is None:
+        atlas.blit(surface, text, text_rect.left, text_rect.top)
+    else:
+        surface.blit(text_surface, text_rect)
+    return text_rect
+
+# Helper to turn a gauge reading into the text it is drawn with
+def format_gauge_value(value, is_humidity):
+    if value is None:
+        return None
+    return f"{int(round(value))}" if not is_humidity else f"{int(value)}"
 
 # New function to draw a rectangular gauge
-def draw_gauge(surface, center_x, center_y, width, height, value, title, gauge_color, is_humidity):
+def draw_gauge(surface, center_x, center_y, width, height, value, title, gauge_color, is_humidity, detail=None,
+               trend=None):
     gauge_rect = pygame.Rect(center_x - width // 2, center_y - height // 2, width, height)
-    pygame.draw.rect(surface, gauge_color, gauge_rect, border_radius=15) # Rounded corners
-    pygame.draw.rect(surface, DARK_GREY, gauge_rect, 5, border_radius=15) # Border
+    pygame.draw.rect(surface, gauge_color, gauge_rect, border_radius=px(15)) # Rounded corners
+    pygame.draw.rect(surface, DARK_GREY, gauge_rect, px(5), border_radius=px(15)) # Border
 
     # Title
-    draw_text(surface, title, font_label, PALE_CYAN, center_x, center_y - height // 2 - 20)
+    title_rect = draw_text(surface, title, font_label, PALE_CYAN, center_x, center_y - height // 2 - px(20))
 
     # Value
-    if value is not None:
-        display_value = f"{int(round(value))}" if not is_humidity else f"{int(value)}"
-        draw_text(surface, display_value, font_value, PALE_CYAN, center_x, center_y + 10) # Adjusted Y
+    display_value = format_gauge_value(value, is_humidity)
+    if display_value is not None:
+        value_rect = draw_text(surface, display_value, font_value, PALE_CYAN, center_x, center_y + px(10)) # Adjusted Y
     else:
-        draw_text(surface, "N/A", font_value, PALE_CYAN, center_x, center_y)
-
-# Function to draw the main screen
-def draw_screen():
-    screen.fill(BLACK)
-
-    # Gauge dimensions and positions for the left half
-    display_width = SCREEN_WIDTH // 2
-    gauge_width = display_width * 0.4 # Make gauges occupy 40% of the half-screen width
-    gauge_height = SCREEN_HEIGHT * 0.35 # Make gauges occupy 35% of the screen height
-
-    # Spacing and positioning for gauges
-    horizontal_gap = (display_width - (2 * gauge_width)) // 3
-    vertical_gap = (SCREEN_HEIGHT - (2 * gauge_height)) // 3
-
-    x_col1 = horizontal_gap + gauge_width // 2
-    x_col2 = display_width - horizontal_gap - gauge_width // 2
-
-    y_row1 = vertical_gap + gauge_height // 2
-    y_row2 = y_row1 + gauge_height + vertical_gap
-
-    # Indoor gauges
-    draw_gauge(screen, x_col1, y_row1, gauge_width, gauge_height,
-               display_temperature_c, "Indoor Temp", LIGHT_GREEN, is_humidity=False)
-    draw_gauge(screen, x_col2, y_row1, gauge_width, gauge_height,
-               display_humidity, "Indoor Humid", LIGHT_BLUE, is_humidity=True)
-
-    # Outdoor gauges
-    draw_gauge(screen, x_col1, y_row2, gauge_width, gauge_height,
-               outdoor_temperature_c, "Outside Temp", LIGHT_GREEN, is_humidity=False)
-    draw_gauge(screen, x_col2, y_row2, gauge_width, gauge_height,
-               outdoor_humidity, "Outside Humid", LIGHT_BLUE, is_humidity=True)
-
-    # Draw Clock, Calendar, Wind Speed, and Weather Description on the right half of the screen
-    current_datetime = datetime.datetime.now()
-    time_str = current_datetime.strftime("%H:%M")
-    date_str = current_datetime.strftime("%A, %B %d")
-
-    clock_calendar_center_x = SCREEN_WIDTH * 3 // 4
-
-    # Adjusted Y positions for better spacing and to use font_detail
-    clock_y = SCREEN_HEIGHT * 0.25
-    date_y = clock_y + font_time.get_height() // 2 + 30 # Date below clock with good spacing
-    wind_y = date_y + font_date.get_height() // 2 + 50 # Wind below date
-    weather_y = wind_y + font_detail.get_height() + 10 # Weather below wind
-
-    draw_text(screen, time_str, font_time, PALE_CYAN, clock_calendar_center_x, clock_y)
-    draw_text(screen, date_str, font_date, PALE_CYAN, clock_calendar_center_x, date_y)
-
-    # Draw Wind Speed with new font_detail
-    if outdoor_wind_speed is not None:
-        wind_speed_text = f"Wind: {outdoor_wind_speed:.1f} km/h"
-        draw_text(screen, wind_speed_text, font_detail, PALE_CYAN, clock_calendar_center_x, wind_y)
-
-    # Draw Weather Description with new font_detail
-    weather_text_surface = font_detail.render(outdoor_weather_description, True, PALE_CYAN)
-    weather_text_rect = weather_text_surface.get_rect(centerx=clock_calendar_center_x, centery=weather_y) # Revert to center
-    screen.blit(weather_text_surface, weather_text_rect)
-
-    # Draw Weather Icon below the text
-    icon_size = 60 # Define icon size here for local use if needed
-    icon_x = clock_calendar_center_x # Center icon horizontally
-    icon_y = weather_y + font_detail.get_height() // 2 + 40 # Increased padding to move it further down
-    draw_weather_icon(screen, icon_x, icon_y, outdoor_weather_description, icon_size=icon_size)
-
-    # Draw CPU Temperature Circle
-    if cpu_temperature_c is not None:
-        cpu_circle_radius = 40 # Size of the CPU temp circle
-        cpu_circle_x = clock_calendar_center_x # Center horizontally with other right-side elements
-        cpu_circle_y = SCREEN_HEIGHT * 0.85 # Adjusted to be lower for horizontal row
-        draw_cpu_temp_circle(screen, cpu_circle_x, cpu_circle_y, cpu_circle_radius, cpu_temperature_c)
-
-    # Draw Memory Percentage Circle (Left of CPU)
-    if memory_percentage is not None:
-        mem_circle_radius = 40
-        mem_circle_x = cpu_circle_x - cpu_circle_radius - mem_circle_radius - 20 # Position to the left of CPU, with padding
-        mem_circle_y = cpu_circle_y # Same vertical position as CPU
-        draw_percentage_circle(screen, mem_circle_x, mem_circle_y, mem_circle_radius, memory_percentage, "MEM", PURPLE)
-
-    # Draw Storage Percentage Circle (Right of CPU)
-    if storage_percentage is not None:
-        storage_circle_radius = 40
-        storage_circle_x = cpu_circle_x + cpu_circle_radius + storage_circle_radius + 20 # Position to the right of CPU, with padding
-        storage_circle_y = cpu_circle_y # Same vertical position as CPU
-        draw_percentage_circle(screen, storage_circle_x, storage_circle_y, storage_circle_radius, storage_percentage, "DISK", BROWN)
-
-    pygame.display.flip()
+        value_rect = draw_text(surface, "N/A", font_value, PALE_CYAN, center_x, center_y)
+
+    # Small detail line inside the bottom of the gauge (e.g. today's high/low)
+    rects = [title_rect, value_rect]
+    if detail is not None:
+        rects.append(draw_text(surface, detail, font_min_max, PALE_CYAN, center_x, center_y + height // 2 - px(22)))
+
+    # Trend arrow in the top right corner while the value is rising or falling
+    if trend:
+        arrow_x = gauge_rect.right - px(22)
+        arrow_y = gauge_rect.top + px(22)
+        size = px(9)
+        tip_y = arrow_y - size * trend
+        base_y = arrow_y + size * trend
+        pygame.draw.polygon(surface, PALE_CYAN, [(arrow_x, tip_y), (arrow_x - size, base_y), (arrow_x + size, base_y)])
+    return gauge_rect.unionall(rects) # "N/A" is wider than the gauge
+
+# --- RETAINED WIDGETS ---
+# Every element on screen is a widget that remembers the state it last drew and
+# the rect it covered. draw_screen() only repaints widgets whose state changed and
+# hands the touched rects to pygame.display.update() instead of flipping the whole frame.
+class Widget:
+    def __init__(self):
+        self.name = type(self).__name__ # Set to a layout name by build_widgets()
+        self.rect = None # Area covered by the last draw (None if nothing is on screen)
+        self.last_state = None
+
+    # Returns a small comparable value describing what the widget would draw now
+    def state(self):
+        raise NotImplementedError
+
+    # Draws the given state and returns the rect it covered (or None)
+    def draw(self, surface, state):
+        raise NotImplementedError
+
+class GaugeWidget(Widget):
+    def __init__(self, center_x, center_y, width, height, title, gauge_color, is_humidity, value_getter,
+                 detail_getter=None, trend_getter=None):
+        super().__init__()
+        self.center_x = center_x
+        self.center_y = center_y
+        self.width = width
+        self.height = height
+        self.title = title
+        self.gauge_color = gauge_color
+        self.is_humidity = is_humidity
+        self.value_getter = value_getter
+        self.detail_getter = detail_getter # Optional callable returning a small text line
+        self.trend_getter = trend_getter # Optional callable returning 1, -1, or 0/None for no arrow
+
+    def state(self):
+        # The smoothed value moves every frame, but only the rounded text is visible
+        title = self.title() if callable(self.title) else self.title
+        detail = self.detail_getter() if self.detail_getter is not None else None
+        trend = self.trend_getter() if self.trend_getter is not None else None
+        return (title, format_gauge_value(self.value_getter(), self.is_humidity), detail, trend)
+
+    def draw(self, surface, state):
+        title, value_text, detail, trend = state
+        value = None if value_text is None else float(value_text)
+        return draw_gauge(surface, self.center_x, self.center_y, self.width, self.height,
+                          value, title, self.gauge_color, self.is_humidity, detail, trend)
+
+class TextWidget(Widget):
+    def __init__(self, font, color, x, y, text_getter):
+        super().__init__()
+        self.font = font
+        self.color = color
+        self.x = x
+        self.y = y
+        self.text_getter = text_getter
+
+    def state(self):
+        return self.text_getter()
+
+    def draw(self, surface, state):
+        if state is None:
+            return None
+        return draw_text(surface, state, self.font, self.color, self.x, self.y)
+
+class WeatherIconWidget(Widget):
+    def __init__(self, x, y, icon_size, description_getter):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.icon_size = icon_size
+        self.description_getter = description_getter
+
+        self.atlas = get_weather_icon_atlas(icon_size)
+
+    def state(self):
+        description = self.description_getter()
+        return (description, self.atlas.frame_index(description, clock.ticks()))
+
+    def draw(self, surface, state):
+        description, frame = state
+        return self.atlas.blit(surface, description, frame, self.x, self.y)
+
+class StatCircleWidget(Widget):
+    def __init__(self, center_x, center_y, radius, value_getter, draw_circle):
+        super().__init__()
+        self.center_x = center_x
+        self.center_y = center_y
+        self.radius = radius
+        self.value_getter = value_getter
+        self.draw_circle = draw_circle # Callable(surface, x, y, radius, value) -> Rect
+
+    def state(self):
+        value = self.value_getter()
+        if value is None:
+            return None
+        return int(round(value))
+
+    def draw(self, surface, state):
+        if state is None:
+            return None
+        return self.draw_circle(surface, self.center_x, self.center_y, self.radius, state)
+
+# Retained widget list, built once from the screen size on the first draw_screen() call
+widgets = None
+
+# Function to build the widgets from the compiled layout (runs again only when the layout changes)
+def build_widgets():
+    slots = layout.slots
+
+    # Outdoor gauges name the location when more than one is configured
+    def outdoor_title(kind):
+        if len(locations) > 1:
+            return lambda: f"{outdoor_location_name} {kind}"
+        return f"Outside {kind}"
+
+    def wind_text():
+        if outdoor_wind_speed is None:
+            return None
+        if outdoor_feels_like_c is None:
+            return f"Wind: {outdoor_wind_speed:.1f} km/h"
+        return f"Wind: {outdoor_wind_speed:.1f} km/h, feels {int(round(outdoor_feels_like_c))}°"
+
+    def weather_text():
+        if outdoor_sunlight is None:
+            return outdoor_weather_description
+        return f"{outdoor_weather_description}, {int(round(outdoor_sunlight))}% sun"
+
+    def high_low_text():
+        if outdoor_temperature_max is None or outdoor_temperature_min is None:
+            return None
+        return f"H {int(round(outdoor_temperature_max))}°  L {int(round(outdoor_temperature_min))}°"
+
+    # Detail lines and trend arrows from the derived values; places are looked up on
+    # every call because the outdoor gauges can cycle through the locations
+    def indoor_place(sensor_name):
+        return lambda: sensor_source_name(sensor_name)
+
+    def outdoor_place():
+        return f"outdoor:{outdoor_location_name}"
+
+    def indoor_high_low_text():
+        tracker = derived_metrics.get(sensor_source_name(INDOOR_TEMPERATURE_SENSOR))
+        if tracker is None or tracker.temperature.high is None:
+            return None
+        return f"H {int(round(tracker.temperature.high))}°  L {int(round(tracker.temperature.low))}°"
+
+    # Dew point, with the heat index when it feels warmer than it is, or else the absolute humidity
+    def humidity_detail_text(place):
+        def text():
+            tracker = derived_metrics.get(place())
+            if tracker is None or tracker.dew_point is None:
+                return None
+            if tracker.heat_index >= tracker.last_temperature + 1:
+                return f"Dew {int(round(tracker.dew_point))}°  feels {int(round(tracker.heat_index))}°"
+            return f"Dew {int(round(tracker.dew_point))}°  {int(round(tracker.absolute_humidity))} g/m³"
+        return text
+
+    def trend_direction(place, kind):
+        def direction():
+            tracker = derived_metrics.get(place())
+            if tracker is None:
+                return None
+            return getattr(tracker, f"{kind}_trend").direction
+        return direction
+
+    # Indoor gauges name the sensor they show unless it is the default one
+    def indoor_title(kind, sensor_name):
+        return f"Indoor {kind}" if sensor_name == "indoor" else f"{sensor_name} {kind}"
+
+    # Each entry makes the widget for its layout slot; widgets left out of layout.json are not shown
+    makers = {
+        # Indoor gauges
+        "indoor_temp": lambda r: GaugeWidget(r.centerx, r.centery, r.width, r.height,
+                                             indoor_title("Temp", INDOOR_TEMPERATURE_SENSOR), LIGHT_GREEN, False,
+                                             lambda: display_temperature_c, indoor_high_low_text,
+                                             trend_direction(indoor_place(INDOOR_TEMPERATURE_SENSOR), "temperature")),
+        "indoor_humidity": lambda r: GaugeWidget(r.centerx, r.centery, r.width, r.height,
+                                                 indoor_title("Humid", INDOOR_HUMIDITY_SENSOR), LIGHT_BLUE, True,
+                                                 lambda: display_humidity,
+                                                 humidity_detail_text(indoor_place(INDOOR_HUMIDITY_SENSOR)),
+                                                 trend_direction(indoor_place(INDOOR_HUMIDITY_SENSOR), "humidity")),
+        # Outdoor gauges
+        "outdoor_temp": lambda r: GaugeWidget(r.centerx, r.centery, r.width, r.height, outdoor_title("Temp"),
+                                              LIGHT_GREEN, False, lambda: outdoor_temperature_c, high_low_text,
+                                              trend_direction(outdoor_place, "temperature")),
+        "outdoor_humidity": lambda r: GaugeWidget(r.centerx, r.centery, r.width, r.height, outdoor_title("Humid"),
+                                                  LIGHT_BLUE, True, lambda: outdoor_humidity,
+                                                  humidity_detail_text(outdoor_place),
+                                                  trend_direction(outdoor_place, "humidity")),
+        "clock": lambda r: TextWidget(layout.fonts[slots["clock"].font], PALE_CYAN, r.centerx, r.centery,
+                                      lambda: clock.now().strftime("%H:%M")),
+        "date": lambda r: TextWidget(layout.fonts[slots["date"].font], PALE_CYAN, r.centerx, r.centery,
+                                     lambda: clock.now().strftime("%A, %B %d")),
+        "wind": lambda r: TextWidget(layout.fonts[slots["wind"].font], PALE_CYAN, r.centerx, r.centery, wind_text),
+        "weather_text": lambda r: TextWidget(layout.fonts[slots["weather_text"].font], PALE_CYAN, r.centerx,
+                                             r.centery, weather_text),
+        "weather_icon": lambda r: WeatherIconWidget(r.centerx, r.centery, r.width,
+                                                    lambda: outdoor_weather_description),
+        "memory": lambda r: StatCircleWidget(r.centerx, r.centery, r.width // 2, lambda: memory_percentage,
+                                             lambda s, x, y, rad, v: draw_percentage_circle(s, x, y, rad, v, "MEM",
+                                                                                            PURPLE)),
+        "cpu": lambda r: StatCircleWidget(r.centerx, r.centery, r.width // 2, lambda: cpu_temperature_c,
+                                          draw_cpu_temp_circle),
+        "storage": lambda r: StatCircleWidget(r.centerx, r.centery, r.width // 2, lambda: storage_percentage,
+                                              lambda s, x, y, rad, v: draw_percentage_circle(s, x, y, rad, v, "DISK",
+                                                                                             BROWN)),
+    }
+    named_widgets = {}
+    for name, slot in slots.items():
+        if name in makers:
+            named_widgets[name] = makers[name](slot.rect)
+        else:
+            print(f"Layout names unknown widget {name!r}, skipping it")
+    for name, widget in named_widgets.items():
+        widget.name = name
+    return list(named_widgets.values())
+
+# Function to draw the main screen. Returns the list of rects that changed.
+def draw_screen(force=False):
+    global widgets
+    if widgets is None:
+        widgets = build_widgets()
+        force = True
+
+    if force:
+        screen.fill(BLACK)
+        for widget in widgets:
+            widget.rect = None
+
+    # Find widgets whose visible state changed since they were last drawn
+    repaint = {}
+    for widget in widgets:
+        state = widget.state()
+        if force or state != widget.last_state:
+            repaint[widget] = state
+    if not repaint:
+        return []
+
+    # Clearing a widget's old area can wipe part of a neighbour, so pull any
+    # overlapping widget into the repaint set until nothing new is touched
+    cleared = [widget.rect for widget in repaint if widget.rect is not None]
+    grew = True
+    while grew:
+        grew = False
+        for widget in widgets:
+            if widget not in repaint and widget.rect is not None and widget.rect.collidelist(cleared) != -1:
+                repaint[widget] = widget.last_state
+                cleared.append(widget.rect)
+                grew = True
+
+    for rect in cleared:
+        screen.fill(BLACK, rect)
+
+    dirty_rects = list(cleared)
+    for widget, state in repaint.items():
+        widget.rect = widget.draw(screen, state)
+        widget.last_state = state
+        if widget.rect is not None:
+            dirty_rects.append(widget.rect)
+
+    if force:
+        return [screen.get_rect()]
+    return dirty_rects
+
+# Counts how many pixels are pushed to the display each second, next to what a
+# full-frame flip would have pushed for the same number of frames
+class PixelRateCounter:
+    def __init__(self, report_interval_ms=10000):
+        self.report_interval_ms = report_interval_ms
+        self.window_start_ms = None
+        self.frames = 0
+        self.pixels_pushed = 0
+
+    def add_frame(self, dirty_rects, now_ms):
+        if self.window_start_ms is None:
+            self.window_start_ms = now_ms
+        screen_rect = screen.get_rect()
+        for rect in dirty_rects:
+            clipped = rect.clip(screen_rect)
+            self.pixels_pushed += clipped.width * clipped.height
+        self.frames += 1
+
+        elapsed_ms = now_ms - self.window_start_ms
+        if elapsed_ms >= self.report_interval_ms:
+            seconds = elapsed_ms / 1000
+            full_frame = SCREEN_WIDTH * SCREEN_HEIGHT * self.frames * 2 # Old loop flipped twice per frame
+            print(f"Pixels pushed/s: {self.pixels_pushed / seconds:,.0f} "
+                  f"(full redraw would push {full_frame / seconds:,.0f}, {self.frames / seconds:.1f} fps)")
+            self.window_start_ms = now_ms
+            self.frames = 0
+            self.pixels_pushed = 0
+
+# Helper to move a displayed value towards its target by the given fraction
+def smooth_towards(display_value, target_value, alpha):
+    if target_value is None:
+        return display_value
+    if display_value is None or abs(target_value - display_value) <= SMOOTHING_SETTLE:
+        return target_value
+    return display_value + (target_value - display_value) * alpha
 
 # Function to smoothly update display values
-def update_display_values():
-    global display_temperature_c, display_humidity, target_temperature_c, target_humidity
-
-    if target_temperature_c is not None and display_temperature_c is None:
-        display_temperature_c = target_temperature_c
-    elif target_temperature_c is not None:
-        display_temperature_c += (target_temperature_c - display_temperature_c) * SMOOTHING_FACTOR
-
-    if target_humidity is not None and display_humidity is None:
-        display_humidity = target_humidity
-    elif target_humidity is not None:
-        display_humidity += (target_humidity - display_humidity) * SMOOTHING_FACTOR
-
-# Function to read DHT11 sensor data
-def read_sensor_data():
-    global temperature_c, humidity, target_temperature_c, target_humidity, sim_time
-    try:
-        if dht_device: # Only read if the sensor was initialized
-            temp_c_reading = dht_device.temperature
-            humidity_reading = dht_device.humidity
-
-            if temp_c_reading is not None and humidity_reading is not None:
-                target_temperature_c = temp_c_reading # Update target values
-                target_humidity = humidity_reading
-                # print(f"Read successful: Temp={target_temperature_c:.1f}°C, Humidity={target_humidity}%")
-        else: # Simulation mode
-            # Generate fake data that oscillates over time
-            sim_time += 0.1 # Increment simulation time
-            target_temperature_c = 25 + 5 * math.sin(sim_time) # Oscillate between 20 and 30
-            target_humidity = 60 + 10 * math.cos(sim_time * 0.7) # Oscillate between 50 and 70
-            # print("Running in simulation mode.")
-
-    except RuntimeError as error:
-        print(error.args[0])
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-# New function to draw weather icons directly
-def draw_weather_icon(surface, x, y, description, icon_size=60):
+def update_display_values(current_time_ms):
+    global display_temperature_c, display_humidity, last_smoothing_ms
+
+    # Fraction of the remaining distance to cover in the time since the last step.
+    # The first step after a settled period covers nothing, so the idle time before
+    # a new reading arrived does not count towards the transition.
+    elapsed_ms = 0 if last_smoothing_ms is None else current_time_ms - last_smoothing_ms
+    alpha = 1 - (1 - SMOOTHING_FACTOR) ** (elapsed_ms * SMOOTHING_REFERENCE_FPS / 1000)
+
+    display_temperature_c = smooth_towards(display_temperature_c, target_temperature_c, alpha)
+    display_humidity = smooth_towards(display_humidity, target_humidity, alpha)
+    last_smoothing_ms = current_time_ms if display_values_moving() else None
+
+# Function to check whether a smoothed value is still converging
+def display_values_moving():
+    return display_temperature_c != target_temperature_c or display_humidity != target_humidity
+
+# Function to pick the frame interval the screen needs right now, in milliseconds.
+# None means nothing is moving and the loop can sleep until the clock changes.
+def animation_interval_ms():
+    if display_values_moving():
+        return 0 # As fast as the governor allows
+    if ANIMATE_WEATHER_ICONS and outdoor_weather_description in ANIMATED_WEATHER_ICONS:
+        return 1000 / ICON_ANIMATION_FPS
+    return None
+
+# Function to read one DHT sensor.
+# The sensor process does the slow bitbang reads; this only copies the latest
+# validated reading out of shared memory. Returns (temperature, humidity, timestamp).
+def read_sensor_data(sensor_name):
+    return sensor_reader.read(sensor_name)
+
+# Function to copy the latest published readings into the globals the widgets draw.
+# A source that failed keeps its last good value in the snapshot.
+def apply_snapshot(snapshot):
+    global temperature_c, humidity, target_temperature_c, target_humidity
+    global weather_table
+    global cpu_temperature_c, memory_percentage, storage_percentage
+
+    # Each indoor gauge follows the sensor assigned to it
+    indoor = snapshot.get(sensor_source_name(INDOOR_TEMPERATURE_SENSOR))
+    if indoor is not None:
+        temperature_c = target_temperature_c = indoor[0] # Update target value
+    indoor = snapshot.get(sensor_source_name(INDOOR_HUMIDITY_SENSOR))
+    if indoor is not None:
+        humidity = target_humidity = indoor[1]
+
+    weather = snapshot.get("weather")
+    if weather is not None:
+        weather_table = weather
+
+    cpu_temperature_c = snapshot.get("cpu_temperature")
+
+    system_stats = snapshot.get("system_stats")
+    if system_stats is not None:
+        memory_percentage = system_stats["memory"]
+        storage_percentage = system_stats["storage"]
+
+    if derived_metrics:
+        update_derived_metrics(snapshot)
+
+# New function to draw weather icons directly.
+# phase (0..1) selects a frame of the animated version; None draws the still icon.
+def draw_weather_icon(surface, x, y, description, icon_size=60, phase=None):
     center_x, center_y = x, y
     radius = icon_size // 3
 
+    # Offsets and line widths are designed for a 60 px icon and scale with it
+    def size(value):
+        return max(1, int(round(value * icon_size / 60)))
+
     if description == "Clear Sky":
         # Sun
         pygame.draw.circle(surface, YELLOW, (center_x, center_y), radius)
@@ -393,9 +933,9 @@ def draw_weather_icon(surface, x, y, description, icon_size=60):
             angle = math.radians(i * 45)
             start_x = center_x + radius * math.cos(angle)
             start_y = center_y + radius * math.sin(angle)
-            end_x = center_x + (radius + 10) * math.cos(angle)
-            end_y = center_y + (radius + 10) * math.sin(angle)
-            pygame.draw.line(surface, YELLOW, (start_x, start_y), (end_x, end_y), 3)
+            end_x = center_x + (radius + size(10)) * math.cos(angle)
+            end_y = center_y + (radius + size(10)) * math.sin(angle)
+            pygame.draw.line(surface, YELLOW, (start_x, start_y), (end_x, end_y), size(3))
     elif description == "Partly Cloudy":
         # Sun
         pygame.draw.circle(surface, YELLOW, (center_x - radius, center_y - radius), radius // 1.5)
@@ -413,17 +953,26 @@ def draw_weather_icon(surface, x, y, description, icon_size=60):
         pygame.draw.circle(surface, GREY, (center_x, center_y), radius)
         pygame.draw.circle(surface, GREY, (center_x - radius // 2, center_y + radius // 4), radius * 0.7)
         pygame.draw.circle(surface, GREY, (center_x + radius // 2, center_y + radius // 4), radius * 0.7)
-        # Rain drops
+        # Rain drops (falling when animated, staggered so they don't move in step)
         for i in range(3):
-            pygame.draw.line(surface, BLUE, (center_x - 15 + i * 15, center_y + radius + 5), (center_x - 15 + i * 15, center_y + radius + 15), 2)
+            fall = 0 if phase is None else int(((phase + i / 3) % 1) * size(14))
+            drop_x = center_x - size(15) + i * size(15)
+            pygame.draw.line(surface, BLUE, (drop_x, center_y + radius + size(5) + fall),
+                             (drop_x, center_y + radius + size(15) + fall), size(2))
     elif description in ["Snowy", "Snow Showers"]:
         # Cloud
         pygame.draw.circle(surface, GREY, (center_x, center_y), radius)
         pygame.draw.circle(surface, GREY, (center_x - radius // 2, center_y + radius // 4), radius * 0.7)
         pygame.draw.circle(surface, GREY, (center_x + radius // 2, center_y + radius // 4), radius * 0.7)
-        # Snowflakes
+        # Snowflakes (drifting sideways as they fall when animated)
         for i in range(3):
-            pygame.draw.circle(surface, PALE_CYAN, (center_x - 15 + i * 15, center_y + radius + 10), 3)
+            drift = fall = 0
+            if phase is not None:
+                flake_phase = (phase + i / 3) % 1
+                drift = round(size(4) * math.sin(2 * math.pi * flake_phase))
+                fall = int(flake_phase * size(16))
+            pygame.draw.circle(surface, PALE_CYAN, (center_x - size(15) + i * size(15) + drift, center_y + radius + size(10) + fall),
+                               size(3))
     elif description == "Thunderstorm":
         # Dark cloud
         pygame.draw.circle(surface, DARK_GREY, (center_x, center_y), radius)
@@ -431,89 +980,614 @@ def draw_weather_icon(surface, x, y, description, icon_size=60):
         pygame.draw.circle(surface, DARK_GREY, (center_x + radius // 2, center_y + radius // 4), radius * 0.7)
         # Lightning bolt
         points = [
-            (center_x - 10, center_y + radius),
-            (center_x + 5, center_y + radius + 15),
-            (center_x - 5, center_y + radius + 15),
-            (center_x + 10, center_y + radius + 30)
+            (center_x - size(10), center_y + radius),
+            (center_x + size(5), center_y + radius + size(15)),
+            (center_x - size(5), center_y + radius + size(15)),
+            (center_x + size(10), center_y + radius + size(30))
         ]
-        pygame.draw.lines(surface, YELLOW, False, points, 2)
+        if phase is None:
+            pygame.draw.lines(surface, YELLOW, False, points, size(2))
+        elif phase < 0.125:
+            pygame.draw.lines(surface, WHITE, False, points, size(4)) # Flash
+        elif phase < 0.5:
+            pygame.draw.lines(surface, YELLOW, False, points, size(2))
+        # Dark for the rest of the cycle
     else:
         # Unknown / Generic cloud
         pygame.draw.circle(surface, GREY, (center_x, center_y), radius)
         pygame.draw.circle(surface, GREY, (center_x - radius // 2, center_y + radius // 4), radius * 0.7)
         pygame.draw.circle(surface, GREY, (center_x + radius // 2, center_y + radius // 4), radius * 0.7)
 
+# --- WEATHER ICON ATLAS ---
+# Icons change a few times a day, so each one is drawn once per icon size into a sprite
+# sheet (one row per description, one column per animation frame) and the widget blits
+# a subsurface. DHTUI_ANIMATED_ICONS=1 adds falling rain, drifting snow and flashing
+# lightning, played from the precomputed frames at a fixed low frame rate.
+ICON_CELL_PADDING = 4 # Empty pixels around every sprite in the sheet
+WEATHER_ICON_DESCRIPTIONS = ["Clear Sky", "Partly Cloudy", "Foggy", "Drizzle", "Rainy", "Snowy",
+                             "Rain Showers", "Snow Showers", "Thunderstorm", "Unknown"]
+ANIMATED_WEATHER_ICONS = {"Drizzle", "Rainy", "Rain Showers", "Snowy", "Snow Showers", "Thunderstorm"}
+ANIMATE_WEATHER_ICONS = os.environ.get("DHTUI_ANIMATED_ICONS", "0") == "1"
+ICON_ANIMATION_FPS = 8
+ICON_ANIMATION_FRAMES = 8 # One second per cycle
+
+class WeatherIconAtlas:
+    def __init__(self, icon_size, frames=1):
+        self.icon_size = icon_size
+        self.frames = frames
+        # Largest extent of any icon from its centre (the falling snow at the bottom of
+        # its cycle), plus empty padding so no sprite can touch its neighbours in the sheet
+        extent = icon_size // 3 + max(1, int(round(36 * icon_size / 60)))
+        self.cell = 2 * (extent + ICON_CELL_PADDING)
+        self.sheet = pygame.Surface((self.cell * frames, self.cell * len(WEATHER_ICON_DESCRIPTIONS)), pygame.SRCALPHA)
+        self.sprites = {} # description -> [(subsurface, bounding rect within the cell), ...]
+        for row, description in enumerate(WEATHER_ICON_DESCRIPTIONS):
+            frame_count = frames if description in ANIMATED_WEATHER_ICONS else 1
+            sequence = []
+            for frame in range(frame_count):
+                cell_rect = pygame.Rect(frame * self.cell, row * self.cell, self.cell, self.cell)
+                phase = frame / frame_count if frame_count > 1 else None
+                draw_weather_icon(self.sheet, cell_rect.centerx, cell_rect.centery, description, icon_size, phase)
+                sprite = self.sheet.subsurface(cell_rect)
+                sequence.append((sprite, sprite.get_bounding_rect()))
+            self.sprites[description] = sequence
+
+    # Animation frame to show at the given time (always 0 for still icons)
+    def frame_index(self, description, ticks_ms):
+        sequence = self.sprites.get(description, self.sprites["Unknown"])
+        return ticks_ms * ICON_ANIMATION_FPS // 1000 % len(sequence)
+
+    # Blits one frame centred on (x, y) and returns the rect actually painted
+    def blit(self, surface, description, frame, x, y):
+        sprite, bounds = self.sprites.get(description, self.sprites["Unknown"])[frame]
+        left, top = int(x) - self.cell // 2, int(y) - self.cell // 2
+        surface.blit(sprite, (left, top))
+        return bounds.move(left, top)
+
+# One atlas per icon size, built on first use
+weather_icon_atlases = {}
+
+def get_weather_icon_atlas(icon_size):
+    atlas = weather_icon_atlases.get(icon_size)
+    if atlas is None:
+        atlas = WeatherIconAtlas(icon_size, ICON_ANIMATION_FRAMES if ANIMATE_WEATHER_ICONS else 1)
+        weather_icon_atlases[icon_size] = atlas
+    return atlas
+
 # New function to draw CPU temperature in a circle
 def draw_cpu_temp_circle(surface, center_x, center_y, radius, temperature):
-    pygame.draw.circle(surface, ORANGE, (center_x, center_y), radius) # Orange circle
-    pygame.draw.circle(surface, DARK_GREY, (center_x, center_y), radius, 3) # Dark grey border
+    circle_rect = pygame.draw.circle(surface, ORANGE, (center_x, center_y), radius) # Orange circle
+    pygame.draw.circle(surface, DARK_GREY, (center_x, center_y), radius, px(3)) # Dark grey border
 
     # Draw temperature value
     temp_text = f"{int(round(temperature))}°C"
-    draw_text(surface, temp_text, font_cpu_temp, PALE_CYAN, center_x, center_y - 10) # Adjust Y for temp value
+    draw_text(surface, temp_text, font_cpu_temp, PALE_CYAN, center_x, center_y - px(10)) # Adjust Y for temp value
 
     # Draw "CPU" text
-    draw_text(surface, "CPU", font_cpu_label, PALE_CYAN, center_x, center_y + 10) # Position below temp value, using new smaller font
+    draw_text(surface, "CPU", font_cpu_label, PALE_CYAN, center_x, center_y + px(10)) # Position below temp value, using new smaller font
+    return circle_rect
 
 # New generic function to draw a percentage in a circle
 def draw_percentage_circle(surface, center_x, center_y, radius, percentage, label, color):
-    pygame.draw.circle(surface, color, (center_x, center_y), radius) # Colored circle
-    pygame.draw.circle(surface, DARK_GREY, (center_x, center_y), radius, 3) # Dark grey border
+    circle_rect = pygame.draw.circle(surface, color, (center_x, center_y), radius) # Colored circle
+    pygame.draw.circle(surface, DARK_GREY, (center_x, center_y), radius, px(3)) # Dark grey border
 
     # Draw percentage value
     percentage_text = f"{int(round(percentage))} %"
-    draw_text(surface, percentage_text, font_cpu_temp, PALE_CYAN, center_x, center_y - 10) # Reuse font_cpu_temp
+    draw_text(surface, percentage_text, font_cpu_temp, PALE_CYAN, center_x, center_y - px(10)) # Reuse font_cpu_temp
 
     # Draw label
-    draw_text(surface, label, font_cpu_label, PALE_CYAN, center_x, center_y + 10) # Reuse font_cpu_label
+    draw_text(surface, label, font_cpu_label, PALE_CYAN, center_x, center_y + px(10)) # Reuse font_cpu_label
+    return circle_rect
+
+# --- HISTORY ---
+# Every reading is appended to a memory-mapped ring buffer per metric, so history
+# (and daily high/low) survives restarts.
+HISTORY_METRICS = ["indoor_temperature", "indoor_humidity", "cpu_temperature", "memory", "storage"]
+for source_name in SENSOR_SOURCES:
+    if source_name != "indoor":
+        sensor_suffix = source_name[len("indoor"):] # ":kitchen"
+        HISTORY_METRICS += [f"indoor_temperature{sensor_suffix}", f"indoor_humidity{sensor_suffix}"]
+for location_name in locations.names():
+    HISTORY_METRICS += [f"outdoor_temperature:{location_name}", f"outdoor_humidity:{location_name}",
+                        f"outdoor_wind_speed:{location_name}"]
+history = None # Opened by init_data_sources()
+last_recorded_weather_times = {}
+last_recorded_indoor_times = {}
+
+# Function to append a new reading to the history (runs on the acquisition thread)
+def record_history(source_name, value):
+    now = time.time()
+    if source_name.partition(":")[0] == "indoor":
+        sensor_suffix = source_name[len("indoor"):]
+        if f"indoor_temperature{sensor_suffix}" not in HISTORY_METRICS:
+            return # A sensor only known from the hub
+        # The same sensor reading is seen until the sensor process publishes a new one
+        if value[2] != last_recorded_indoor_times.get(source_name):
+            last_recorded_indoor_times[source_name] = value[2]
+            history.append(f"indoor_temperature{sensor_suffix}", value[0], value[2])
+            history.append(f"indoor_humidity{sensor_suffix}", value[1], value[2])
+    elif source_name == "weather":
+        # Each table is the forecast interpolated at one time; the same table can be
+        # published again (e.g. seeded at startup), so record each time once
+        for i, location_name in enumerate(value.names):
+            sample_time = value.times[i] or now
+            if last_recorded_weather_times.get(location_name) == sample_time:
+                continue
+            last_recorded_weather_times[location_name] = sample_time
+            history.append(f"outdoor_temperature:{location_name}", value.column("temperature_2m")[i], sample_time)
+            history.append(f"outdoor_humidity:{location_name}", value.column("relative_humidity_2m")[i], sample_time)
+            history.append(f"outdoor_wind_speed:{location_name}", value.column("wind_speed_10m")[i], sample_time)
+    elif source_name == "cpu_temperature":
+        history.append("cpu_temperature", value, now)
+    elif source_name == "system_stats":
+        history.append("memory", value["memory"], now)
+        history.append("storage", value["storage"], now)
+
+# --- DERIVED VALUES ---
+# Today's high/low, dew point, heat index, absolute humidity and trend for every sensor
+# and outdoor location, updated from each new reading in apply_snapshot(). derived.py
+# needs NumPy, so the trackers come up with the background startup, rebuilt from the
+# day's history in one pass; until then the gauges show no detail line.
+# Function to list the places with derived values: every sensor, the ones the indoor
+# gauges show, and every outdoor location
+def derived_places():
+    places = sorted(set(SENSOR_SOURCES) | {sensor_source_name(INDOOR_TEMPERATURE_SENSOR),
+                                           sensor_source_name(INDOOR_HUMIDITY_SENSOR)})
+    return places + [f"outdoor:{location_name}" for location_name in locations.names()]
+
+DERIVED_PLACES = derived_places()
+DERIVED_BACKFILL_SECONDS = 2 * 3600 # History read before midnight too, so trends start settled
+derived_metrics = {} # Place -> DerivedMetrics, filled by init_derived_metrics()
+
+for place in DERIVED_PLACES:
+    metrics.gauge("dew_point_celsius", "Dew point", {"place": place},
+                  getter=lambda place=place: getattr(derived_metrics.get(place), "dew_point", None))
+    metrics.gauge("heat_index_celsius", "Heat index (feels like)", {"place": place},
+                  getter=lambda place=place: getattr(derived_metrics.get(place), "heat_index", None))
+    metrics.gauge("absolute_humidity_grams_per_cubic_meter", "Absolute humidity", {"place": place},
+                  getter=lambda place=place: getattr(derived_metrics.get(place), "absolute_humidity", None))
+
+# Function to name the history metrics a place's readings are stored under
+def derived_history_metrics(place):
+    if place.startswith("outdoor:"):
+        return f"outdoor_temperature{place[len('outdoor'):]}", f"outdoor_humidity{place[len('outdoor'):]}"
+    sensor_suffix = place[len("indoor"):]
+    return f"indoor_temperature{sensor_suffix}", f"indoor_humidity{sensor_suffix}"
+
+# Function to create the trackers and catch them up on today's history (startup thread)
+def init_derived_metrics():
+    global derived_metrics
+    from derived import DerivedMetrics, local_midnight
+
+    now = clock.timestamp()
+    start = min(local_midnight(now), now - DERIVED_BACKFILL_SECONDS)
+    trackers = {}
+    for place in DERIVED_PLACES:
+        tracker = DerivedMetrics()
+        temperature_metric, humidity_metric = derived_history_metrics(place)
+        if history is not None and temperature_metric in HISTORY_METRICS:
+            tracker.backfill(*history.window(temperature_metric, start), *history.window(humidity_metric, start))
+        trackers[place] = tracker
+    derived_metrics = trackers # Handed to the main thread in one assignment
+
+# Function to feed new readings to the trackers (main thread, from apply_snapshot())
+def update_derived_metrics(snapshot):
+    for place, tracker in derived_metrics.items():
+        if place.startswith("indoor"):
+            reading = snapshot.get(place)
+            if reading is not None:
+                tracker.add(reading[2], reading[0], reading[1])
+
+    weather = snapshot.get("weather")
+    if weather is not None:
+        temperatures = weather.column("temperature_2m")
+        humidities = weather.column("relative_humidity_2m")
+        for i, location_name in enumerate(weather.names):
+            tracker = derived_metrics.get(f"outdoor:{location_name}")
+            if tracker is not None and weather.times[i]:
+                tracker.add(weather.times[i], temperatures[i], humidities[i])
+
+# --- DATA ACQUISITION ---
+acquisition = None
+last_posted_values = {}
+data_sources_thread = None
+
+# Last readings on disk, drawn in the first frame after a restart
+LAST_VALUES_PATH = os.path.join(default_data_dir(), "last_values.bin")
+LAST_VALUES_SAVE_INTERVAL = 60000 # 60 seconds
+last_values_save_time = 0
+last_known_values = LastKnownValues(LAST_VALUES_PATH)
+
+# With DHTUI_RECORD set, every new weather response and every changed reading is
+# appended to that file, to be played back later with replay.py
+RECORD_PATH = os.environ.get("DHTUI_RECORD")
+recorder = None
+
+# Function to describe the locations and sensors this display runs with, so a replay
+# can reproduce them
+def recording_setup():
+    return {
+        "locations": [list(location) for location in locations],
+        "panel_location": PANEL_LOCATION,
+        "location_rotate_ms": LOCATION_ROTATE_INTERVAL,
+        "sensors": [list(spec) for spec in SENSORS],
+        "indoor_temperature_sensor": INDOOR_TEMPERATURE_SENSOR,
+        "indoor_humidity_sensor": INDOOR_HUMIDITY_SENSOR,
+    }
+
+# Function to configure the display like the one a recording was made on (used by replay.py)
+def apply_recording_setup(setup):
+    global locations, PANEL_LOCATION, LOCATION_ROTATE_INTERVAL, outdoor_location_name
+    global SENSORS, SENSOR_SOURCES, INDOOR_TEMPERATURE_SENSOR, INDOOR_HUMIDITY_SENSOR, DERIVED_PLACES
+    locations = LocationRegistry(setup["locations"])
+    PANEL_LOCATION = outdoor_location_name = setup["panel_location"]
+    LOCATION_ROTATE_INTERVAL = setup["location_rotate_ms"]
+    SENSORS = [SensorSpec(*spec) for spec in setup["sensors"]]
+    SENSOR_SOURCES = [sensor_source_name(spec.name) for spec in SENSORS]
+    INDOOR_TEMPERATURE_SENSOR = setup["indoor_temperature_sensor"]
+    INDOOR_HUMIDITY_SENSOR = setup["indoor_humidity_sensor"]
+    DERIVED_PLACES = derived_places()
+
+# Function to add a reading to the recording (runs on the acquisition thread).
+# Weather is recorded as the raw API response by parse_forecast() instead.
+def record_reading(source_name, value):
+    if source_name != "weather":
+        recorder.record_value(source_name, value)
+
+# Function to wake the render loop when a reading changed (runs on the acquisition thread)
+def post_data_event(source_name, value):
+    startup_timer.mark("first live reading")
+    if last_posted_values.get(source_name) == value:
+        return
+    last_posted_values[source_name] = value
+    try:
+        pygame.event.post(pygame.event.Event(DATA_EVENT, source=source_name)) # Thread-safe
+    except pygame.error:
+        pass # Display not open yet; the first frame reads the snapshot anyway
+
+# Function to tell whether a source is shared over the hub ("indoor:kitchen" counts as "indoor")
+def is_hub_source(source_name):
+    return source_name.partition(":")[0] in HUB_SOURCES
+
+# Function to send the shared readings to the subscribers (hub publisher only)
+def publish_to_hub(source_name, value):
+    if is_hub_source(source_name):
+        snapshot = acquisition.snapshot
+        hub_publisher.publish({name: snapshot.get(name) for name in snapshot.sources if is_hub_source(name)})
+
+# Function to take readings from the hub (runs on the subscriber thread)
+def receive_from_hub(values):
+    for name, value in values.items():
+        if is_hub_source(name):
+            acquisition.publish(name, value)
+
+# Function to fork the sensor process. It has to happen before pygame starts, so the
+# child does not inherit the display.
+def start_sensor_process():
+    global sensor_reader
+    if not SENSORS:
+        return
+    sensor_reader = SensorReader(SENSORS)
+    sensor_reader.start()
+
+# Function to create the acquisition engine, showing the last known values until the
+# sources produce fresh ones
+def init_acquisition(seed_values):
+    global acquisition
+    acquisition = AcquisitionEngine()
+    for name, value in seed_values.items():
+        acquisition.seed(name, value)
+
+# Function to start the background readers (runs on a startup thread after the first frame).
+# Sensor, weather and system readings run in the background on their own schedules.
+def init_data_sources():
+    global weather_client, cpu_temperature_sampler, system_stats_sampler, history, hub_publisher, hub_subscriber
+    global recorder
+
+    with startup_timer.phase("import forecast, history"):
+        from forecast import FORECAST_UPDATE_INTERVAL
+        from timeseries import TimeSeriesStore, default_history_path
+
+    with startup_timer.phase("weather client"):
+        weather_client = WeatherClient(base_url=WEATHER_API_URL, cache_path=default_cache_path(),
+                                       update_interval=FORECAST_UPDATE_INTERVAL)
+
+    with startup_timer.phase("telemetry"):
+        cpu_temperature_sampler = AdaptiveSampler(make_thermal_source(SYSFS_ROOT),
+                                                  min_interval=2, max_interval=CPU_TEMP_READ_INTERVAL * 3 / 1000,
+                                                  threshold=0.5) # °C
+        system_stats_sampler = AdaptiveSampler(SystemStatsSource(PROCFS_ROOT),
+                                               min_interval=5, max_interval=SYSTEM_STATS_READ_INTERVAL * 6 / 1000,
+                                               threshold=0.5) # percentage points
+
+    with startup_timer.phase("history"):
+        try:
+            history = TimeSeriesStore(default_history_path(), HISTORY_METRICS)
+        except (OSError, ValueError) as e:
+            print(f"History disabled, could not open {default_history_path()}: {e}")
+            history = None
+
+    with startup_timer.phase("derived values"):
+        init_derived_metrics()
+
+    # Subscribers only read the sensor and the weather themselves while the hub is quiet
+    local_enabled = None
+    if HUB_MODE == "subscribe":
+        hub_subscriber = HubSubscriber(HUB_ADDRESS, receive_from_hub)
+        hub_subscriber.start()
+        local_enabled = hub_subscriber.is_quiet
+
+    if sensor_reader is not None:
+        for spec in SENSORS:
+            read_sensor = functools.partial(read_sensor_data, spec.name)
+            acquisition.add_source(sensor_source_name(spec.name), stage_timings["sensor_read"].wrap(read_sensor),
+                                   READ_INTERVAL / 1000, enabled=local_enabled)
+    acquisition.add_source("weather", stage_timings["weather_fetch"].wrap(get_outside_weather),
+                           WEATHER_API_INTERVAL / 1000, enabled=local_enabled)
+    acquisition.add_source("cpu_temperature", stage_timings["cpu_temperature"].wrap(cpu_temperature_sampler.sample),
+                           cpu_temperature_sampler.next_interval)
+    acquisition.add_source("system_stats", stage_timings["system_stats"].wrap(system_stats_sampler.sample),
+                           system_stats_sampler.next_interval)
+    acquisition.add_listener(post_data_event)
+    if history is not None:
+        acquisition.add_listener(record_history)
+    if RECORD_PATH:
+        try:
+            recorder = Recorder(RECORD_PATH)
+            recorder.record_setup(recording_setup())
+            acquisition.add_listener(record_reading)
+            print(f"Recording readings to {RECORD_PATH}")
+        except OSError as e:
+            print(f"Recording disabled, could not open {RECORD_PATH}: {e}")
+            recorder = None
+    if HUB_MODE == "publish":
+        try:
+            hub_publisher = HubPublisher(HUB_ADDRESS)
+            hub_publisher.start()
+            acquisition.add_listener(publish_to_hub)
+            print(f"Hub publishing on {HUB_ADDRESS}")
+        except OSError as e:
+            print(f"Hub disabled, could not listen on {HUB_ADDRESS}: {e}")
+            hub_publisher = None
+
+    # Show the last cached forecast right away instead of waiting for the first request
+    with startup_timer.phase("cached forecast"):
+        cached_weather = weather_client.cached(get_weather_params())
+        if cached_weather is not None:
+            try:
+                acquisition.seed("weather", parse_forecast(cached_weather).at(clock.timestamp()))
+            except (KeyError, ValueError) as e:
+                print(f"Ignoring unreadable cached weather: {e}")
+    acquisition.start()
+    startup_timer.mark("data sources started")
+
+    for name in list(startup_timer.phases):
+        metrics.gauge("startup_phase_seconds", "Seconds spent in each startup phase", {"phase": name},
+                      getter=lambda phase=name: startup_timer.phases[phase])
+    for line in startup_timer.report():
+        print(f"Startup {line}")
+
+# Function to write the current readings to disk for the next cold start
+def save_last_known_values():
+    if acquisition is not None:
+        last_known_values.save({name: state.value for name, state in acquisition.snapshot.sources.items()})
+
+# Function to stop the background readers
+def shutdown_data_sources():
+    if data_sources_thread is not None:
+        data_sources_thread.join(timeout=5) # Let a still-running startup finish first
+    save_last_known_values()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if frame_streamer is not None:
+        frame_streamer.stop()
+    if hub_subscriber is not None:
+        hub_subscriber.stop()
+    if hub_publisher is not None:
+        hub_publisher.stop()
+    if acquisition is not None:
+        acquisition.stop()
+    if sensor_reader is not None:
+        sensor_reader.stop()
+    for sampler in (cpu_temperature_sampler, system_stats_sampler):
+        if sampler is not None:
+            sampler.close()
+    if history is not None:
+        history.flush()
+    if recorder is not None:
+        recorder.close()
+
+# Function to print per-source latency, staleness and cache statistics
+def report_acquisition():
+    for line in acquisition.report():
+        print(f"Acquisition {line}")
+    if sensor_reader is not None:
+        stats = sensor_reader.stats()
+        print(f"Sensors: {stats['reads']} reads ({stats['reads_per_second']:.2f}/s, bus busy "
+              f"{stats['bus_busy']:.0%}), {stats['errors']} errors, {stats['rejected']} rejected as outliers, "
+              f"lateness {stats['mean_lateness_ms']:.0f} ms mean / {stats['max_lateness_ms']:.0f} ms max"
+              + (" (simulated)" if stats["simulated"] else ""))
+        if len(stats["sensors"]) > 1:
+            for name, sensor in stats["sensors"].items():
+                print(f"Sensor {name}: {sensor['reads']} reads, {sensor['errors']} errors"
+                      + (f" ({sensor['failures']} in a row, backing off)" if sensor["failures"] > 1 else "")
+                      + f", {sensor['mean_read_ms']:.0f} ms per read, lateness {sensor['mean_lateness_ms']:.0f} ms "
+                      f"mean / {sensor['max_lateness_ms']:.0f} ms max")
+    for sampler in (cpu_temperature_sampler, system_stats_sampler):
+        if sampler is None:
+            continue
+        stats = sampler.stats()
+        print(f"Telemetry {stats['source']}: {stats['samples']} samples, every {stats['interval']:.1f} s, "
+              f"{stats['mean_wall_us']:.0f} us wall / {stats['mean_cpu_us']:.0f} us CPU per sample")
+    if weather_client is not None:
+        stats = weather_client.stats()
+        print(f"Weather cache: {stats['hit_rate']:.1%} hit rate, {stats['network_requests']} requests, "
+              f"{stats['bytes_saved']} bytes and {stats['handshakes_saved']} handshakes saved")
+    if hub_publisher is not None:
+        stats = hub_publisher.stats()
+        print(f"Hub: {stats['subscribers']} subscribers, {stats['frames_sent']} frames "
+              f"({stats['bytes_sent']} bytes) sent, {stats['dropped']} dropped")
+    if hub_subscriber is not None:
+        stats = hub_subscriber.stats()
+        state = "quiet, fetching locally" if stats["quiet"] else ("connected" if stats["connected"] else "reconnecting")
+        print(f"Hub subscriber: {state}, {stats['frames_received']} frames ({stats['bytes_received']} bytes) "
+              f"received, {stats['connects']} connects")
+    if recorder is not None:
+        stats = recorder.stats()
+        print(f"Recording: {stats['records']} records, {stats['bytes_written']} bytes written")
+    if frame_streamer is not None:
+        stats = frame_streamer.stats()
+        print(f"Frame stream: {stats['clients']} clients, {stats['tiles_sent']} of {stats['tiles_hashed']} "
+              f"checked tiles sent ({stats['bytes_sent']} bytes)")
+
+# Function to parse "1024x600" into (1024, 600)
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
 
 # --- MAIN LOOP ---
-running = True
-while running:
-    # Event handling
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN: # Added to handle key presses
-            if event.key == pygame.K_ESCAPE: # Added to check for the escape key
-                running = False # Set running to False to exit the loop
-
-    current_time_ms = pygame.time.get_ticks() # Get current time in milliseconds
-    # Trigger full animation at regular intervals
-    # This block is no longer needed if gauges are always full.
-    # if current_time_ms - last_full_animation_time > FULL_ANIMATION_INTERVAL:
-    #     last_full_animation_time = current_time_ms
-
-    # Read DHT11 sensor data at regular intervals
-    if current_time_ms - last_read_time > READ_INTERVAL:
-        read_sensor_data()
-        last_read_time = current_time_ms
-
-    # Fetch outside weather data at regular intervals
-    if current_time_ms - last_weather_api_read_time > WEATHER_API_INTERVAL:
-        get_outside_weather()
-        last_weather_api_read_time = current_time_ms
-
-    # Read CPU temperature at regular intervals
-    if current_time_ms - last_cpu_temp_read_time > CPU_TEMP_READ_INTERVAL:
-        get_cpu_temperature()
-        last_cpu_temp_read_time = current_time_ms
-
-    # Read Memory and Storage at regular intervals
-    if current_time_ms - last_system_stats_read_time > SYSTEM_STATS_READ_INTERVAL:
-        get_memory_usage()
-        get_storage_usage()
-        last_system_stats_read_time = current_time_ms
-
-    # Smoothly update display values
-    update_display_values()
-
-    # Drawing
-    draw_screen()
-
-    # Update the display
-    pygame.display.flip()
-
-# Quit Pygame
-pygame.quit()
-sys.exit()
\ No newline at end of file
+def main():
+    global last_text_cache_report_time, last_acquisition_report_time, last_frame_governor_report_time
+    global last_metrics_log_time, last_values_save_time, last_layout_check_time, data_sources_thread
+
+    import argparse
+    parser = argparse.ArgumentParser(description="Raspberry Pi weather display")
+    parser.add_argument("--headless", action="store_true", help="render with SDL's dummy driver (no screen needed)")
+    parser.add_argument("--size", type=parse_size, help="screen size as WIDTHxHEIGHT")
+    args = parser.parse_args()
+
+    # Cold start: fork the sensor process, open the display and draw the last known values
+    # straight away; everything slow comes up on a background thread afterwards.
+    # The sensor process is forked before pygame starts so it does not inherit the display
+    with startup_timer.phase("sensor process"):
+        start_sensor_process()
+    with startup_timer.phase("open display"):
+        init_display(headless=args.headless, size=args.size)
+    with startup_timer.phase("last known values"):
+        init_acquisition(last_known_values.load())
+    with startup_timer.phase("draw first frame"):
+        apply_snapshot(acquisition.snapshot)
+        update_outdoor_values(clock.ticks())
+        update_display_values(clock.ticks())
+        draw_screen()
+        pygame.display.flip()
+    startup_timer.mark("first frame")
+    init_metrics()
+    init_frame_stream()
+    data_sources_thread = threading.Thread(target=init_data_sources, name="startup", daemon=True)
+    data_sources_thread.start()
+
+    applied_snapshot_version = -1
+    pixel_counter = PixelRateCounter()
+    governor = FrameGovernor(active_fps=MAX_FPS, wake_on_minute=(IDLE_WAKE == "minute"))
+    running = True
+
+    # systemctl stop (SIGTERM) ends the loop like ESC does, so the shutdown below runs
+    def stop_running(signum, frame):
+        nonlocal running
+        running = False
+        pygame.event.post(pygame.event.Event(pygame.QUIT)) # Wake the loop if it is sleeping
+    signal.signal(signal.SIGTERM, stop_running)
+
+    # Readings, history and the recording are saved however the loop ends
+    try:
+        while running:
+            # Sleep until the next frame is due; input and new readings wake the loop early
+            current_time_ms = clock.ticks()
+            timeout = governor.timeout_ms(current_time_ms, clock.now(), animation_interval_ms())
+            if LOCATION_ROTATE_INTERVAL > 0 and len(locations) > 1:
+                timeout = min(timeout, LOCATION_ROTATE_INTERVAL - current_time_ms % LOCATION_ROTATE_INTERVAL)
+            first_event = pygame.event.wait(timeout) if timeout > 0 else pygame.event.poll()
+
+            # Event handling
+            with stage_timings["event_poll"].time():
+                for event in [first_event] + pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+                    if event.type == pygame.KEYDOWN: # Added to handle key presses
+                        if event.key == pygame.K_ESCAPE: # Added to check for the escape key
+                            running = False # Set running to False to exit the loop
+
+            current_time_ms = clock.ticks() # Get current time in milliseconds
+            # Trigger full animation at regular intervals
+            # This block is no longer needed if gauges are always full.
+            # if current_time_ms - last_full_animation_time > FULL_ANIMATION_INTERVAL:
+            #     last_full_animation_time = current_time_ms
+
+            # Pick up new readings from the acquisition threads (a plain attribute read, no locking)
+            with stage_timings["apply_snapshot"].time():
+                snapshot = acquisition.snapshot
+                if snapshot.version != applied_snapshot_version:
+                    apply_snapshot(snapshot)
+                    applied_snapshot_version = snapshot.version
+                update_outdoor_values(current_time_ms)
+
+            # Smoothly update display values
+            with stage_timings["update_display_values"].time():
+                update_display_values(current_time_ms)
+
+            # Pick up edits to layout.json; the next draw lays the screen out again
+            if current_time_ms - last_layout_check_time > LAYOUT_CHECK_INTERVAL:
+                reload_layout_if_changed()
+                last_layout_check_time = current_time_ms
+
+            # Drawing: only widgets whose value changed are repainted
+            with stage_timings["draw_screen"].time():
+                dirty_rects = draw_screen()
+
+            # Update the display with just the changed areas
+            with stage_timings["flip"].time():
+                if dirty_rects:
+                    pygame.display.update(dirty_rects)
+
+            # Send the changed tiles to any mirror clients
+            if frame_streamer is not None:
+                with stage_timings["stream"].time():
+                    frame_streamer.publish(screen, dirty_rects)
+            frames_counter.inc()
+            pixel_counter.add_frame(dirty_rects, current_time_ms)
+            governor.frame_done(current_time_ms, animation_interval_ms() is not None)
+
+            # Report text cache effectiveness at regular intervals
+            if current_time_ms - last_text_cache_report_time > TEXT_CACHE_REPORT_INTERVAL:
+                stats = text_cache.stats()
+                print(f"Text cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), "
+                      f"{stats['entries']} entries, {stats['evictions']} evictions")
+                last_text_cache_report_time = current_time_ms
+
+            # Report per-source latency and staleness at regular intervals
+            if current_time_ms - last_acquisition_report_time > ACQUISITION_REPORT_INTERVAL:
+                report_acquisition()
+                last_acquisition_report_time = current_time_ms
+
+            # Report frame rate and what sleeping between frames saves
+            if current_time_ms - last_frame_governor_report_time > FRAME_GOVERNOR_REPORT_INTERVAL:
+                stats = governor.report()
+                if stats is not None:
+                    print(f"Frame governor: {stats['fps']:.1f} fps, {stats['active_share']:.0%} of frames animating, "
+                          f"render loop used {stats['core_fraction']:.1%} of a core "
+                          f"({stats['cpu_per_frame_ms']:.2f} ms CPU per frame); saved {stats['saved_vs_spinning']:.0%} "
+                          f"of a core vs. a free-running loop (~{stats['watts_saved_vs_spinning']:.2f} W) and "
+                          f"{stats['saved_vs_full_rate']:.0%} vs. rendering at {MAX_FPS} fps")
+                last_frame_governor_report_time = current_time_ms
+
+            # Keep the last readings on disk for the next cold start
+            if current_time_ms - last_values_save_time > LAST_VALUES_SAVE_INTERVAL:
+                save_last_known_values()
+                last_values_save_time = current_time_ms
+
+            # One JSON line with every counter and stage timing, for log shipping
+            if current_time_ms - last_metrics_log_time > METRICS_LOG_INTERVAL:
+                print(f"Metrics {metrics.json_line()}")
+                last_metrics_log_time = current_time_ms
+    except KeyboardInterrupt:
+        print("Interrupted, shutting down")
+    finally:
+        # Stop the background readers and quit Pygame
+        shutdown_data_sources()
+        pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# On-disk locations and safe writes shared by the dhtui modules.
+#
+# History, last-known values and profiles go under DHTUI_DATA_DIR
+# (default ~/.local/share/dhtui). Small state files are replaced atomically, so a
+# power cut leaves either the old file or the new one, never half of one.
+import os
+
+
+def default_data_dir():
+    return os.environ.get("DHTUI_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".local", "share", "dhtui")
+
+
+# Writes bytes to path through a temporary file and os.replace(). Raises OSError.
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,111 @@
+# Hourly forecast for the dhtui display.
+#
+# Instead of polling Open-Meteo's "current" values, the display fetches hourly and
+# daily arrays for every location about once an hour and works out "now" locally.
+# Continuous fields are interpolated linearly between the hours around the requested
+# time (all fields of a location in one vectorised step); the weather code is a step
+# function, since a code halfway between "rain" and "snow" means nothing. Daily
+# high/low come from the daily arrays, sunlight % from cloud cover and feels-like
+# from the apparent temperature of the same response.
+#
+# All times are Unix timestamps (timeformat=unixtime). Daily entries start at local
+# midnight of each location (timezone=auto), so a 23 or 25 hour DST day is just a
+# longer or shorter gap and nothing has to do local-time arithmetic.
+import numpy as np
+
+from locations import WeatherTable, parse_batch
+
+HOURLY_FIELDS = ["temperature_2m", "relative_humidity_2m", "wind_speed_10m", "cloud_cover",
+                 "apparent_temperature", "weather_code"]
+INTERPOLATED_FIELDS = [field for field in HOURLY_FIELDS if field != "weather_code"]
+DAILY_FIELDS = ["temperature_2m_max", "temperature_2m_min"]
+# Columns of the WeatherTable produced for a point in time
+TABLE_FIELDS = INTERPOLATED_FIELDS + ["weather_code", "sunlight"] + DAILY_FIELDS
+
+FORECAST_UPDATE_INTERVAL = 60 * 60 # Seconds; Open-Meteo's hourly arrays change about this often
+
+
+# Request parameters for hourly and daily arrays covering yesterday to tomorrow, so
+# "now" is always bracketed even if a refresh fails for a while
+def forecast_params(registry, past_days=1, forecast_days=2):
+    params = registry.batch_params()
+    params.update({
+        "hourly": ",".join(HOURLY_FIELDS),
+        "daily": ",".join(DAILY_FIELDS),
+        "temperature_unit": "celsius",
+        "wind_speed_unit": "ms",
+        "timeformat": "unixtime",
+        "timezone": "auto", # Daily entries start at each location's local midnight
+        "past_days": past_days,
+        "forecast_days": forecast_days,
+    })
+    return params
+
+
+# Arrays for one location
+class LocationForecast:
+    def __init__(self, hourly, daily):
+        self.times = np.asarray(hourly["time"], dtype=np.float64)
+        # One row per interpolated field; missing values (null in the JSON) become NaN
+        self.values = np.array([hourly[field] for field in INTERPOLATED_FIELDS], dtype=np.float64)
+        self.weather_codes = np.array(hourly["weather_code"], dtype=np.float64)
+        self.day_starts = np.asarray(daily["time"], dtype=np.float64)
+        self.daily_values = np.array([daily[field] for field in DAILY_FIELDS], dtype=np.float64)
+        if len(self.times) < 2 or np.any(np.diff(self.times) <= 0):
+            raise ValueError("hourly forecast times must be increasing")
+
+    # True if t (scalar or array) lies within the hourly arrays
+    def covers(self, t):
+        return (self.times[0] <= t) & (t <= self.times[-1])
+
+    # Interpolated fields at t, shaped (len(INTERPOLATED_FIELDS),) + shape of t.
+    # t may be a scalar or an array (e.g. for backfilling history); outside the
+    # covered range the result is NaN rather than a clamped edge value.
+    def interpolate(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        i = np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, len(self.times) - 2)
+        t0, t1 = self.times[i], self.times[i + 1]
+        weight = np.clip((t - t0) / (t1 - t0), 0.0, 1.0)
+        result = self.values[:, i] * (1 - weight) + self.values[:, i + 1] * weight
+        return np.where(self.covers(t), result, np.nan)
+
+    # Weather code of the hour containing t (NaN outside the arrays)
+    def weather_code(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        i = np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, len(self.times) - 1)
+        return np.where(self.covers(t), self.weather_codes[i], np.nan)
+
+    # Daily fields for the local day containing t (NaN outside the arrays)
+    def daily(self, t):
+        t = np.asarray(t, dtype=np.float64)
+        i = np.searchsorted(self.day_starts, t, side="right") - 1
+        inside = (i >= 0) & (t < self.day_starts[-1] + 25 * 3600) # Last day may be a 25 hour DST day
+        return np.where(inside, self.daily_values[:, np.clip(i, 0, len(self.day_starts) - 1)], np.nan)
+
+
+class Forecast:
+    def __init__(self, names, location_forecasts):
+        self.names = list(names)
+        self.locations = list(location_forecasts)
+
+    # Builds the forecast from a (possibly batched) API response
+    @classmethod
+    def from_response(cls, data, names):
+        hourly = parse_batch(data, names, "hourly", ["time"] + HOURLY_FIELDS)
+        daily = parse_batch(data, names, "daily", ["time"] + DAILY_FIELDS)
+        return cls(names, [LocationForecast(hourly.row(name), daily.row(name)) for name in names])
+
+    # Values for every location at Unix time t, as a WeatherTable.
+    # Fields are None where the forecast does not cover t.
+    def at(self, t):
+        columns = {field: [] for field in TABLE_FIELDS}
+        for location in self.locations:
+            values = dict(zip(INTERPOLATED_FIELDS, location.interpolate(t)))
+            values["weather_code"] = location.weather_code(t)
+            values["sunlight"] = 100 - values["cloud_cover"]
+            values.update(zip(DAILY_FIELDS, location.daily(t)))
+            for field in TABLE_FIELDS:
+                value = float(values[field])
+                columns[field].append(None if np.isnan(value) else value)
+        columns["weather_code"] = [None if code is None else int(code) for code in columns["weather_code"]]
+        return WeatherTable(self.names, columns, times=[t] * len(self.names))
@@ -0,0 +1,76 @@
+# Frame scheduling for the dhtui display.
+#
+# The render loop used to spin as fast as the CPU allowed. FrameGovernor tells it how
+# long it may sleep before the next frame: one frame interval while something on
+# screen is moving (a smoothed value still converging, an animated icon), and once
+# everything is static, until the next whole second or the next minute boundary (the
+# clock only shows minutes). The loop sleeps in pygame.event.wait(), so input and new
+# readings, which the acquisition threads post as events, wake it straight away.
+#
+# The governor also measures the render loop's own CPU time, so it can report what it
+# saves against a free-running loop and against rendering at the full rate all the time.
+import time
+
+BUSY_CORE_WATTS = 0.9 # Roughly what one fully busy core adds on a Raspberry Pi 4
+WAKE_MARGIN_MS = 5 # Wake just after a second/minute boundary, not just before it
+
+
+class FrameGovernor:
+    def __init__(self, active_fps=30, wake_on_minute=False, busy_core_watts=BUSY_CORE_WATTS,
+                 cpu_clock=time.thread_time, wall_clock=time.monotonic):
+        self.frame_interval_ms = 1000 / active_fps
+        self.wake_on_minute = wake_on_minute
+        self.busy_core_watts = busy_core_watts
+        self.cpu_clock = cpu_clock # CPU time of the render loop's thread only
+        self.wall_clock = wall_clock
+        self.last_frame_ms = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_cpu_start = self.cpu_clock()
+        self.window_wall_start = self.wall_clock()
+        self.frames = 0
+        self.active_frames = 0
+
+    # Milliseconds the loop may wait before the next frame. interval_ms is the frame
+    # interval the screen needs right now (None when nothing is moving); now is the
+    # wall-clock datetime the clock widget shows.
+    def timeout_ms(self, now_ms, now, interval_ms=None):
+        if self.last_frame_ms is None:
+            return 0 # First frame right away
+        if interval_ms is not None:
+            interval_ms = max(interval_ms, self.frame_interval_ms)
+            return max(0, int(self.last_frame_ms + interval_ms - now_ms))
+
+        ms_into_second = now.microsecond // 1000
+        if self.wake_on_minute:
+            return (60 - now.second) * 1000 - ms_into_second + WAKE_MARGIN_MS
+        return 1000 - ms_into_second + WAKE_MARGIN_MS
+
+    def frame_done(self, now_ms, active):
+        self.last_frame_ms = now_ms
+        self.frames += 1
+        self.active_frames += bool(active)
+
+    # Summary of the window since the last report, then starts a new window
+    def report(self):
+        cpu = self.cpu_clock() - self.window_cpu_start
+        wall = self.wall_clock() - self.window_wall_start
+        frames, active_frames = self.frames, self.active_frames
+        self._reset_window()
+        if wall <= 0 or frames == 0:
+            return None
+
+        core_fraction = cpu / wall # Share of one core used by the render loop
+        cpu_per_frame = cpu / frames
+        full_rate_fraction = min(1.0, cpu_per_frame * 1000 / self.frame_interval_ms)
+        return {
+            "fps": frames / wall,
+            "active_share": active_frames / frames,
+            "core_fraction": core_fraction,
+            "cpu_per_frame_ms": cpu_per_frame * 1000,
+            # A free-running loop keeps one core busy; a fixed-rate loop pays every frame
+            "saved_vs_spinning": 1.0 - core_fraction,
+            "saved_vs_full_rate": max(0.0, full_rate_fraction - core_fraction),
+            "watts_saved_vs_spinning": (1.0 - core_fraction) * self.busy_core_watts,
+        }
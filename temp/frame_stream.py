@@ -0,0 +1,274 @@
+# Frame streaming for the dhtui display.
+#
+# Mirrors the rendered screen to browsers and to a second display without running
+# the acquisition and render stack twice. The screen is split into tiles; after each
+# frame only the tiles under draw_screen()'s dirty rects are hashed, and only those
+# whose pixels really changed are PNG-encoded and sent. A minute change therefore
+# costs a few clock tiles, whatever the resolution, and nothing at all is hashed or
+# encoded while no client is connected.
+#
+# Clients connect over plain HTTP:
+#   GET /         page with a canvas that follows the stream
+#   GET /events   Server-Sent Events, one JSON message per frame with the changed tiles
+# A new client first gets every tile, then only changes.
+#
+#   python frame_stream.py mirror http://kiosk:8081   # show the stream on another screen
+import base64
+import hashlib
+import http.server
+import io
+import json
+import queue
+import sys
+import threading
+
+import pygame
+
+TILE_SIZE = 64
+CLIENT_QUEUE_FRAMES = 120 # A client this far behind is dropped; EventSource reconnects by itself
+KEEPALIVE_INTERVAL = 15 # Seconds
+
+PAGE = b"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>dhtui mirror</title>
+<style>html,body{margin:0;background:#000;height:100%}canvas{width:100%;height:100%;object-fit:contain}</style>
+</head><body><canvas id="screen"></canvas><script>
+const canvas = document.getElementById("screen");
+const context = canvas.getContext("2d");
+let pending = Promise.resolve(); // Tiles are drawn strictly in the order they were sent
+new EventSource("/events").onmessage = (event) => {
+  const frame = JSON.parse(event.data);
+  pending = pending.then(async () => {
+    if (canvas.width !== frame.width || canvas.height !== frame.height) {
+      canvas.width = frame.width;
+      canvas.height = frame.height;
+    }
+    const images = await Promise.all(frame.tiles.map(([x, y, png]) =>
+      fetch("data:image/png;base64," + png).then((r) => r.blob()).then(createImageBitmap)));
+    frame.tiles.forEach(([x, y], i) => context.drawImage(images[i], x, y));
+  });
+};
+</script></body></html>
+"""
+
+tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring # tostring before pygame 2.1.3
+
+
+class _Client:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_FRAMES)
+        self.needs_keyframe = True
+
+
+class FrameStreamer:
+    def __init__(self, host="127.0.0.1", port=8081, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self._clients = []
+        self._lock = threading.Lock()
+        self._hashes = {} # (x, y) -> digest of the tile's pixels as last sent
+        self._encoded = {} # (x, y) -> base64 PNG of that tile, for new clients
+        self._size = None
+        streamer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(handler):
+                path = handler.path.split("?")[0]
+                if path == "/":
+                    handler.send_response(200)
+                    handler.send_header("Content-Type", "text/html; charset=utf-8")
+                    handler.send_header("Content-Length", str(len(PAGE)))
+                    handler.end_headers()
+                    handler.wfile.write(PAGE)
+                elif path == "/events":
+                    streamer._serve_events(handler)
+                else:
+                    handler.send_error(404)
+
+            def log_message(handler, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="frame-stream", daemon=True)
+
+        # Statistics
+        self.tiles_hashed = 0
+        self.tiles_sent = 0
+        self.bytes_sent = 0
+        self.frames_sent = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+    # Runs on an HTTP thread for as long as the client stays connected
+    def _serve_events(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        client = _Client()
+        with self._lock:
+            self._clients.append(client)
+        try:
+            while True:
+                try:
+                    message = client.queue.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break # Dropped or server stopping
+                handler.wfile.write(message)
+                handler.wfile.flush()
+                self.bytes_sent += len(message)
+        except OSError:
+            pass # Client went away
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+
+    # Tile origins covering the given rects, clipped to the screen
+    def _tiles_under(self, screen_rect, rects):
+        size = self.tile_size
+        tiles = set()
+        for rect in rects:
+            rect = rect.clip(screen_rect)
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            for y in range(rect.top // size * size, rect.bottom, size):
+                for x in range(rect.left // size * size, rect.right, size):
+                    tiles.add((x, y))
+        return tiles
+
+    def _encode(self, surface, tile_rect):
+        output = io.BytesIO()
+        pygame.image.save(surface.subsurface(tile_rect), output, "tile.png")
+        return base64.b64encode(output.getvalue()).decode("ascii")
+
+    # Called by the render loop after the dirty rects have been pushed to the display
+    def publish(self, surface, dirty_rects):
+        with self._lock:
+            clients = list(self._clients)
+        if not clients:
+            # Nobody is watching: skip the work, and start from a full frame next time
+            self._hashes.clear()
+            self._encoded.clear()
+            return
+        screen_rect = surface.get_rect()
+        if screen_rect.size != self._size:
+            self._size = screen_rect.size # Resolution changed: every tile is new
+            self._hashes.clear()
+            self._encoded.clear()
+        keyframe = not self._encoded
+        tiles = self._tiles_under(screen_rect, [screen_rect] if keyframe else dirty_rects)
+
+        changed = []
+        for x, y in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+            tile_rect = pygame.Rect(x, y, self.tile_size, self.tile_size).clip(screen_rect)
+            digest = hashlib.blake2b(tobytes(surface.subsurface(tile_rect), "RGB"), digest_size=16).digest()
+            self.tiles_hashed += 1
+            if self._hashes.get((x, y)) == digest:
+                continue
+            self._hashes[(x, y)] = digest
+            self._encoded[(x, y)] = self._encode(surface, tile_rect)
+            changed.append((x, y))
+
+        width, height = surface.get_size()
+        delta = None
+        for client in clients:
+            if client.needs_keyframe:
+                tiles_to_send = sorted(self._encoded, key=lambda tile: (tile[1], tile[0]))
+                client.needs_keyframe = False
+            elif changed:
+                tiles_to_send = changed
+            else:
+                continue
+            if tiles_to_send is changed and delta is not None:
+                message = delta
+            else:
+                payload = {"width": width, "height": height,
+                           "tiles": [[x, y, self._encoded[(x, y)]] for x, y in tiles_to_send]}
+                message = b"data: " + json.dumps(payload, separators=(",", ":")).encode("ascii") + b"\n\n"
+                if tiles_to_send is changed:
+                    delta = message # Encoded once, shared by every up-to-date client
+            try:
+                client.queue.put_nowait(message)
+                self.tiles_sent += len(tiles_to_send)
+                self.frames_sent += 1
+            except queue.Full:
+                with self._lock:
+                    if client in self._clients:
+                        self._clients.remove(client)
+                try:
+                    while True:
+                        client.queue.get_nowait() # Make room to wake the HTTP thread so it closes the connection
+                except queue.Empty:
+                    pass
+                client.queue.put_nowait(None)
+
+    def stats(self):
+        return {"clients": self.client_count(), "tiles_hashed": self.tiles_hashed, "tiles_sent": self.tiles_sent,
+                "frames_sent": self.frames_sent, "bytes_sent": self.bytes_sent}
+
+
+# Shows a stream on this machine's screen (e.g. a second, cheaper panel)
+def mirror(url, size=None, fullscreen=False):
+    import urllib.request
+
+    pygame.init()
+    window = None
+    canvas = None
+    with urllib.request.urlopen(url.rstrip("/") + "/events") as response:
+        for line in response:
+            if not line.startswith(b"data: "):
+                continue
+            frame = json.loads(line[6:])
+            if canvas is None or canvas.get_size() != (frame["width"], frame["height"]):
+                canvas = pygame.Surface((frame["width"], frame["height"]))
+                window_size = size or canvas.get_size()
+                window = pygame.display.set_mode(window_size, pygame.FULLSCREEN if fullscreen else 0)
+                pygame.display.set_caption("dhtui mirror")
+            rects = []
+            for x, y, png in frame["tiles"]:
+                tile = pygame.image.load(io.BytesIO(base64.b64decode(png)), "tile.png")
+                rects.append(canvas.blit(tile, (x, y)))
+            if window.get_size() == canvas.get_size():
+                window.blit(canvas, (0, 0))
+                pygame.display.update(rects)
+            else:
+                pygame.transform.smoothscale(canvas, window.get_size(), window)
+                pygame.display.flip()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Mirror a dhtui frame stream")
+    parser.add_argument("command", choices=["mirror"])
+    parser.add_argument("url", help="stream address, e.g. http://kiosk:8081")
+    parser.add_argument("--size", help="window size as WIDTHxHEIGHT (default: same as the stream)")
+    parser.add_argument("--fullscreen", action="store_true")
+    args = parser.parse_args(argv[1:])
+    size = tuple(int(v) for v in args.size.lower().split("x")) if args.size else None
+    try:
+        mirror(args.url, size, args.fullscreen)
+    except KeyboardInterrupt:
+        pass
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
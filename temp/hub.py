@@ -0,0 +1,359 @@
+# LAN data hub for a fleet of dhtui displays.
+#
+# One display runs as the hub publisher: it fetches the weather and reads its sensor
+# as usual and pushes every change as a compact binary snapshot to all connected
+# subscribers. The other displays subscribe instead of polling. The publisher resends
+# the latest snapshot as a heartbeat, so a subscriber notices when the hub goes quiet
+# and falls back to fetching locally until the hub is back.
+#
+# The channel is a plain stream socket, either TCP ("tcp://0.0.0.0:5007", works across
+# the LAN) or a Unix socket ("unix:///run/dhtui/hub.sock", several processes on one
+# host). Every message is a 4-byte length followed by one encoded snapshot.
+#
+#   python hub.py listen tcp://panel-1:5007   # print what a hub publishes
+import math
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+from locations import WeatherTable
+
+MAGIC = b"DHUB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBIdB") # magic, version, sequence number, published_at, record count
+FRAME_LENGTH = struct.Struct("<I")
+MAX_FRAME_SIZE = 1 << 20
+
+# Value kinds
+KIND_FLOAT = 1 # A single number (CPU temperature)
+KIND_TUPLE = 2 # A tuple of numbers (indoor temperature, humidity, timestamp)
+KIND_DICT = 3 # Names to numbers (memory/storage)
+KIND_TABLE = 4 # WeatherTable
+
+# Column kinds inside a table
+COLUMN_FLOAT = 0
+COLUMN_INT = 1
+
+HEARTBEAT_INTERVAL = 5.0 # Seconds between resends of the latest snapshot
+QUIET_AFTER = 15.0 # Seconds without any message before a subscriber fails over
+
+
+# --- encoding ---
+def _pack_str(text):
+    data = text.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_str(buffer, offset):
+    (length,) = struct.unpack_from("<H", buffer, offset)
+    offset += 2
+    return bytes(buffer[offset:offset + length]).decode("utf-8"), offset + length
+
+
+def _number(value):
+    return math.nan if value is None else float(value)
+
+
+def _value(number, integer=False):
+    if math.isnan(number):
+        return None
+    return int(number) if integer else number
+
+
+def _encode_value(value):
+    if isinstance(value, WeatherTable):
+        fields = list(value.columns)
+        parts = [struct.pack("<BHH", KIND_TABLE, len(value.names), len(fields))]
+        parts += [_pack_str(name) for name in value.names]
+        parts += [struct.pack(f"<{len(value.names)}d", *(_number(t) for t in value.times))]
+        for field in fields:
+            column = value.column(field)
+            integer = all(v is None or isinstance(v, int) for v in column)
+            parts.append(_pack_str(field) + struct.pack("<B", COLUMN_INT if integer else COLUMN_FLOAT))
+            parts.append(struct.pack(f"<{len(column)}d", *(_number(v) for v in column)))
+        return b"".join(parts)
+    if isinstance(value, dict):
+        parts = [struct.pack("<BH", KIND_DICT, len(value))]
+        for key, number in value.items():
+            parts.append(_pack_str(key) + struct.pack("<d", _number(number)))
+        return b"".join(parts)
+    if isinstance(value, (tuple, list)):
+        return struct.pack(f"<BB{len(value)}d", KIND_TUPLE, len(value), *(_number(v) for v in value))
+    return struct.pack("<Bd", KIND_FLOAT, _number(value))
+
+
+def _decode_value(buffer, offset):
+    kind = buffer[offset]
+    if kind == KIND_TABLE:
+        count, n_fields = struct.unpack_from("<HH", buffer, offset + 1)
+        offset += 5
+        names = []
+        for _ in range(count):
+            name, offset = _unpack_str(buffer, offset)
+            names.append(name)
+        times = [_value(t) for t in struct.unpack_from(f"<{count}d", buffer, offset)]
+        offset += 8 * count
+        columns = {}
+        for _ in range(n_fields):
+            field, offset = _unpack_str(buffer, offset)
+            integer = buffer[offset] == COLUMN_INT
+            numbers = struct.unpack_from(f"<{count}d", buffer, offset + 1)
+            offset += 1 + 8 * count
+            columns[field] = [_value(number, integer) for number in numbers]
+        return WeatherTable(names, columns, times), offset
+    if kind == KIND_DICT:
+        (count,) = struct.unpack_from("<H", buffer, offset + 1)
+        offset += 3
+        value = {}
+        for _ in range(count):
+            key, offset = _unpack_str(buffer, offset)
+            value[key] = _value(struct.unpack_from("<d", buffer, offset)[0])
+            offset += 8
+        return value, offset
+    if kind == KIND_TUPLE:
+        count = buffer[offset + 1]
+        numbers = struct.unpack_from(f"<{count}d", buffer, offset + 2)
+        return tuple(_value(number) for number in numbers), offset + 2 + 8 * count
+    if kind == KIND_FLOAT:
+        return _value(struct.unpack_from("<d", buffer, offset + 1)[0]), offset + 9
+    raise ValueError(f"unknown value kind {kind}")
+
+
+# Encodes {source name: value} into one snapshot message
+def encode_snapshot(values, seq=0, published_at=None):
+    if published_at is None:
+        published_at = time.time()
+    records = [v for v in values.items() if v[1] is not None]
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, seq, published_at, len(records))]
+    for name, value in records:
+        parts.append(_pack_str(name) + _encode_value(value))
+    return b"".join(parts)
+
+
+# Returns (seq, published_at, {source name: value})
+def decode_snapshot(data):
+    magic, version, seq, published_at, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("not a dhtui hub snapshot")
+    offset = HEADER.size
+    values = {}
+    for _ in range(count):
+        name, offset = _unpack_str(data, offset)
+        values[name], offset = _decode_value(data, offset)
+    return seq, published_at, values
+
+
+# --- transport ---
+# "tcp://host:port" or "unix:///path" -> (family, address)
+def parse_address(address):
+    scheme, _, rest = address.partition("://")
+    if scheme == "unix":
+        return socket.AF_UNIX, rest
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "0.0.0.0", int(port))
+    raise ValueError(f"hub address must start with tcp:// or unix://, got {address!r}")
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("hub closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+class HubPublisher:
+    def __init__(self, address, heartbeat_interval=HEARTBEAT_INTERVAL, send_timeout=1.0):
+        self.address = address
+        self.heartbeat_interval = heartbeat_interval
+        self.send_timeout = send_timeout # A subscriber that cannot take a frame in time is dropped
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._latest = None
+        self._seq = 0
+        self._running = False
+        self._server = None
+
+        # Statistics
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+
+    def start(self):
+        family, bind_address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.unlink(bind_address) # Left over from a previous run
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(bind_address)
+        self._server.listen(16)
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="hub-accept", daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name="hub-heartbeat", daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR) # Wakes the accept() in _accept_loop
+            except OSError:
+                pass
+            self._server.close()
+        with self._lock:
+            for sock in self._subscribers:
+                sock.close()
+            self._subscribers = []
+
+    # Sends {source name: value} to every subscriber
+    def publish(self, values):
+        with self._lock:
+            self._seq += 1
+            payload = encode_snapshot(values, self._seq)
+            self._latest = FRAME_LENGTH.pack(len(payload)) + payload
+            self._send_to_all(self._latest)
+
+    def _send_to_all(self, frame):
+        for sock in list(self._subscribers):
+            try:
+                sock.sendall(frame)
+                self.frames_sent += 1
+                self.bytes_sent += len(frame)
+            except OSError:
+                self._subscribers.remove(sock)
+                sock.close()
+                self.dropped += 1
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break # Server socket closed by stop()
+            sock.settimeout(self.send_timeout)
+            with self._lock:
+                if not self._running:
+                    sock.close() # Accepted while stop() was closing everything
+                    break
+                if self._latest is not None:
+                    try:
+                        sock.sendall(self._latest) # New subscribers get the current state at once
+                    except OSError:
+                        sock.close()
+                        self.dropped += 1
+                        continue
+                    self.frames_sent += 1
+                    self.bytes_sent += len(self._latest)
+                self._subscribers.append(sock)
+
+    def _heartbeat_loop(self):
+        while self._running:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                if self._latest is not None:
+                    self._send_to_all(self._latest)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {"subscribers": subscribers, "frames_sent": self.frames_sent, "bytes_sent": self.bytes_sent,
+                "dropped": self.dropped}
+
+
+class HubSubscriber:
+    def __init__(self, address, on_values, quiet_after=QUIET_AFTER, clock=time.monotonic):
+        self.address = address
+        self.on_values = on_values # Callable({source name: value}) for every changed snapshot
+        self.quiet_after = quiet_after
+        self.clock = clock
+        self.last_received = clock() # Give the hub a chance before failing over at startup
+        self.connected = False
+        self._running = False
+        self._sock = None
+        self._last_values = {}
+
+        # Statistics
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.connects = 0
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, name="hub-subscriber", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._sock is not None:
+            self._sock.close()
+
+    # True once nothing has arrived for quiet_after seconds; the display then fetches locally
+    def is_quiet(self):
+        return self.clock() - self.last_received > self.quiet_after
+
+    def _run(self):
+        family, address = parse_address(self.address)
+        delay = 1.0
+        while self._running:
+            try:
+                self._sock = socket.socket(family, socket.SOCK_STREAM)
+                self._sock.settimeout(self.quiet_after)
+                self._sock.connect(address)
+                self.connected = True
+                self.connects += 1
+                delay = 1.0
+                while self._running:
+                    (length,) = FRAME_LENGTH.unpack(_recv_exactly(self._sock, FRAME_LENGTH.size))
+                    if length > MAX_FRAME_SIZE:
+                        raise ValueError(f"hub frame of {length} bytes is too large")
+                    _, _, values = decode_snapshot(_recv_exactly(self._sock, length))
+                    self.last_received = self.clock()
+                    self.frames_received += 1
+                    self.bytes_received += FRAME_LENGTH.size + length
+                    # Heartbeats repeat the last snapshot; only pass on what changed
+                    changed = {name: value for name, value in values.items() if self._last_values.get(name) != value}
+                    self._last_values.update(changed)
+                    if changed:
+                        self.on_values(changed)
+            except (OSError, ValueError, struct.error) as e:
+                if self._running and self.connected:
+                    print(f"Hub connection to {self.address} lost: {e}")
+            finally:
+                self.connected = False
+                self._sock.close()
+            if self._running:
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+    def stats(self):
+        return {"connected": self.connected, "frames_received": self.frames_received,
+                "bytes_received": self.bytes_received, "connects": self.connects, "quiet": self.is_quiet()}
+
+
+def main(argv):
+    if len(argv) != 3 or argv[1] != "listen":
+        print("usage: python hub.py listen ADDRESS")
+        return 2
+
+    def show(values):
+        print(time.strftime("%H:%M:%S"), {name: (value.row(value.names[0]) if isinstance(value, WeatherTable) else value)
+                                          for name, value in values.items()})
+
+    subscriber = HubSubscriber(argv[2], show)
+    subscriber.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        subscriber.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
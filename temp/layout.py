@@ -0,0 +1,124 @@
+# Declarative screen layout for the dhtui display.
+#
+# layout.json describes panels (fractions of the screen), the widgets placed in them
+# and the fonts they use. compile_layout() turns it into a flat table of integer rects
+# plus one loaded font per distinct size for a given resolution. That only happens when
+# the display opens or the file changes; widgets are built from the table, and the
+# render loop does no layout math.
+#
+# Fonts, gaps, offsets, icon sizes and radii are given in design pixels and scaled by
+# min(width / design width, height / design height), so one file fits 800x480,
+# 1024x600 and 4K panels alike.
+#
+# Placement of a widget:
+#   gauge  "cell": [column, row] of the panel's "grid", "size": [width, height] as panel fractions
+#   text   "font": a key of "fonts"
+#   icon   "size": design pixels
+#   stat   "radius": design pixels
+# and, except for gauges, "x"/"y" as fractions of the panel (default: centred), or
+# "below": an earlier widget plus a "gap" in design pixels, with optional "dx"/"dy"
+# design-pixel offsets.
+import collections
+import json
+import math
+import os
+
+import pygame
+
+DEFAULT_LAYOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout.json")
+WIDGET_TYPES = ("gauge", "text", "icon", "stat")
+
+# One compiled widget: its box on screen and the font key it draws with (or None)
+LayoutSlot = collections.namedtuple("LayoutSlot", "rect font")
+
+
+class CompiledLayout:
+    def __init__(self, size, scale, slots, fonts, font_sizes):
+        self.size = size
+        self.scale = scale
+        self.slots = slots # Widget name -> LayoutSlot, in drawing order
+        self.fonts = fonts # Font key -> pygame Font
+        self.font_sizes = font_sizes # Font key -> point size
+
+    # Design pixels to screen pixels (line widths and small offsets inside widgets)
+    def px(self, value):
+        return max(1, int(round(value * self.scale))) if value else 0
+
+
+def load_layout(path=DEFAULT_LAYOUT_PATH):
+    with open(path) as f:
+        spec = json.load(f)
+    for key in ("design_size", "fonts", "panels", "widgets"):
+        if key not in spec:
+            raise ValueError(f"layout {path} has no {key!r}")
+    return spec
+
+
+# Halves round up, so a box straddling a pixel lands the same way at every position
+def _round(value):
+    return int(math.floor(value + 0.5))
+
+
+def _default_font(size):
+    return pygame.font.Font(None, size)
+
+
+# Compiles a layout spec for one screen size. load_font(size) returns a font; fonts of
+# the same size are loaded once and shared.
+def compile_layout(spec, size, load_font=_default_font):
+    width, height = size
+    design_width, design_height = spec["design_size"]
+    scale = min(width / design_width, height / design_height)
+
+    font_sizes = {key: max(1, int(round(points * scale))) for key, points in spec["fonts"].items()}
+    loaded = {}
+    fonts = {}
+    for key, points in font_sizes.items():
+        if points not in loaded:
+            loaded[points] = load_font(points)
+        fonts[key] = loaded[points]
+
+    panels = {}
+    for name, panel in spec["panels"].items():
+        x, y, w, h = panel["rect"]
+        panels[name] = (x * width, y * height, w * width, h * height, panel.get("grid", (1, 1)))
+
+    slots = {}
+    for name, widget in spec["widgets"].items():
+        kind = widget.get("type")
+        if kind not in WIDGET_TYPES:
+            raise ValueError(f"widget {name!r} has unknown type {kind!r}")
+        if widget.get("panel") not in panels:
+            raise ValueError(f"widget {name!r} is in unknown panel {widget.get('panel')!r}")
+        panel_x, panel_y, panel_w, panel_h, (columns, rows) = panels[widget["panel"]]
+        font = widget.get("font")
+        if font is not None and font not in fonts:
+            raise ValueError(f"widget {name!r} uses unknown font {font!r}")
+
+        if kind == "gauge":
+            # Equal gaps around and between the cells of the panel's grid
+            box_w, box_h = widget["size"][0] * panel_w, widget["size"][1] * panel_h
+            column, row = widget["cell"]
+            gap_x = (panel_w - columns * box_w) / (columns + 1)
+            gap_y = (panel_h - rows * box_h) / (rows + 1)
+            left = panel_x + gap_x * (column + 1) + box_w * column
+            top = panel_y + gap_y * (row + 1) + box_h * row
+        else:
+            if kind == "text":
+                box_w, box_h = panel_w, fonts[font].get_height()
+            elif kind == "icon":
+                box_w = box_h = widget["size"] * scale
+            else:
+                box_w = box_h = 2 * widget["radius"] * scale
+            center_x = panel_x + widget.get("x", 0.5) * panel_w + widget.get("dx", 0) * scale
+            if "below" in widget:
+                above = slots.get(widget["below"])
+                if above is None:
+                    raise ValueError(f"widget {name!r} must come after {widget['below']!r}")
+                top = above.rect.bottom + widget.get("gap", 0) * scale + widget.get("dy", 0) * scale
+            else:
+                top = panel_y + widget.get("y", 0.5) * panel_h + widget.get("dy", 0) * scale - box_h / 2
+            left = center_x - box_w / 2
+        slots[name] = LayoutSlot(pygame.Rect(_round(left), _round(top), _round(box_w), _round(box_h)), font)
+
+    return CompiledLayout((width, height), scale, slots, fonts, font_sizes)
@@ -0,0 +1,96 @@
+# Weather locations for the dhtui display.
+#
+# All registered locations are fetched in one Open-Meteo request per refresh
+# (the API accepts comma-separated latitude/longitude lists), and the response is
+# parsed into a WeatherTable: one column per field, one row per location. Adding
+# a location adds a row, not another request.
+import collections
+
+Location = collections.namedtuple("Location", ["name", "latitude", "longitude"])
+
+
+class LocationRegistry:
+    def __init__(self, locations=()):
+        self._locations = collections.OrderedDict()
+        for location in locations:
+            self.add(*location)
+
+    def add(self, name, latitude, longitude):
+        self._locations[name] = Location(name, float(latitude), float(longitude))
+
+    def names(self):
+        return list(self._locations)
+
+    def __iter__(self):
+        return iter(self._locations.values())
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, name):
+        return name in self._locations
+
+    # Latitude/longitude parameters covering every location in one request
+    def batch_params(self):
+        return {
+            "latitude": ",".join(f"{location.latitude:.6f}" for location in self),
+            "longitude": ",".join(f"{location.longitude:.6f}" for location in self),
+        }
+
+    # Parses "Plant:52.42,10.78;HQ:48.13,11.58" (as used by DHTUI_LOCATIONS)
+    @classmethod
+    def from_spec(cls, spec):
+        registry = cls()
+        for entry in spec.split(";"):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, _, coordinates = entry.rpartition(":")
+            latitude, longitude = coordinates.split(",")
+            registry.add(name.strip() or f"Location {len(registry) + 1}", latitude, longitude)
+        return registry
+
+
+class WeatherTable:
+    def __init__(self, names, columns, times=None):
+        self.names = list(names)
+        self.columns = columns # field -> list of values, aligned with names
+        self.times = times or [None] * len(self.names) # API timestamp of each row
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def column(self, field):
+        return self.columns[field]
+
+    # Values for one location as a dict (None if the location is unknown)
+    def row(self, name):
+        i = self._index.get(name)
+        if i is None:
+            return None
+        return {field: values[i] for field, values in self.columns.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    # Equal tables mean nothing changed (used to skip repeated snapshots)
+    def __eq__(self, other):
+        if not isinstance(other, WeatherTable):
+            return NotImplemented
+        return self.names == other.names and self.columns == other.columns and self.times == other.times
+
+
+# Splits a batched response into columns. A single location comes back as one
+# object, several locations as a list of objects in request order.
+def parse_batch(data, names, section, fields):
+    results = data if isinstance(data, list) else [data]
+    if len(results) != len(names):
+        raise ValueError(f"expected {len(names)} locations in API response, got {len(results)}")
+    columns = {field: [] for field in fields}
+    times = []
+    for result in results:
+        if section not in result:
+            raise ValueError(f"{section} data not found in API response.")
+        values = result[section]
+        for field in fields:
+            columns[field].append(values.get(field))
+        times.append(values.get("time"))
+    return WeatherTable(names, columns, times)
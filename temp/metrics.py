@@ -0,0 +1,293 @@
+# Instrumentation for the dhtui display.
+#
+# Timing histograms and counters live in a MetricsRegistry. They are served in the
+# Prometheus text format from a small HTTP endpoint bound to localhost, and
+# summarised as one JSON line for the log. Observing a value takes a lock and a
+# bisect, so it is cheap enough for every frame and every acquisition read.
+#
+# Profiling a misbehaving unit without restarting it:
+#   kill -USR1 <pid>   start cProfile; send again to stop and write a .prof file
+#   kill -USR2 <pid>   start tracemalloc; send again to write the top allocations
+import bisect
+import cProfile
+import http.server
+import io
+import json
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+
+# Seconds; from sub-millisecond draw calls up to slow network requests
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    # getter reads a total kept elsewhere (e.g. another process) at collection time
+    def __init__(self, name, help, labels=None, getter=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.getter = getter
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        if self.getter is not None:
+            try:
+                return self.getter()
+            except Exception:
+                return None # Source not running (yet)
+        return self._value
+
+    def samples(self):
+        value = self.value()
+        return [] if value is None else [(self.name, self.labels, value)]
+
+
+# A value read at collection time (e.g. how long a startup phase took)
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    # Context manager timing the block, e.g. `with stage_time("draw_screen"): ...`
+    def time(self):
+        return _Timer(self)
+
+    # Wraps a callable so every call is timed (used for acquisition sources)
+    def wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+        return timed
+
+    def state(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+    # Upper bound of the bucket containing the given fraction of observations
+    def quantile(self, fraction):
+        counts, _ = self.state()
+        total = sum(counts)
+        if not total:
+            return None
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= fraction * total:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        counts, total_sum = self.state()
+        samples = []
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            samples.append((self.name + "_bucket", dict(self.labels, le=repr(bound)), running))
+        running += counts[-1]
+        samples.append((self.name + "_bucket", dict(self.labels, le="+Inf"), running))
+        samples.append((self.name + "_sum", self.labels, total_sum))
+        samples.append((self.name + "_count", self.labels, running))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="dhtui_"):
+        self.prefix = prefix
+        self._metrics = {} # (name, labels) -> metric, in registration order
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        key = (metric.name, tuple(sorted(metric.labels.items())))
+        with self._lock:
+            return self._metrics.setdefault(key, metric)
+
+    def counter(self, name, help, labels=None, getter=None):
+        return self._register(Counter(self.prefix + name, help, labels, getter))
+
+    def gauge(self, name, help, labels=None, getter=None):
+        return self._register(Gauge(self.prefix + name, help, labels, getter))
+
+    def histogram(self, name, help, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help, labels, buckets))
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render_prometheus(self):
+        lines = []
+        described = set()
+        for metric in self.metrics():
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Compact summary for the JSON log line: counter values and, per histogram,
+    # count, mean and p50/p99 bucket bounds in milliseconds
+    def summary(self):
+        counters = {}
+        timings = {}
+        for metric in self.metrics():
+            key = metric.name[len(self.prefix):] + "".join(f".{value}" for _, value in sorted(metric.labels.items()))
+            if metric.kind in ("counter", "gauge"):
+                counters[key] = metric.value()
+                continue
+            counts, total_sum = metric.state()
+            count = sum(counts)
+            if not count:
+                continue
+            p50, p99 = metric.quantile(0.5), metric.quantile(0.99)
+            timings[key] = {
+                "count": count,
+                "mean_ms": round(total_sum / count * 1000, 3),
+                "p50_ms": p50 * 1000 if p50 != float("inf") else None,
+                "p99_ms": p99 * 1000 if p99 != float("inf") else None,
+            }
+        return {"time": round(time.time(), 3), "counters": counters, "timings": timings}
+
+    def json_line(self):
+        return json.dumps(self.summary(), separators=(",", ":"))
+
+
+# Serves GET /metrics from a daemon thread
+class MetricsServer:
+    def __init__(self, registry, host="127.0.0.1", port=9105):
+        self.registry = registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass # Scrapes would flood the log
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.address = self.httpd.server_address
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# On-demand profiling: SIGUSR1 toggles cProfile (it profiles the main thread, which
+# runs the render loop), SIGUSR2 toggles tracemalloc. Results go to output_dir.
+class SignalProfiler:
+    def __init__(self, output_dir, top=25):
+        self.output_dir = output_dir
+        self.top = top
+        self.profiler = None
+
+    def install(self):
+        if not hasattr(signal, "SIGUSR1"):
+            return False # Not on this platform
+        signal.signal(signal.SIGUSR1, self._toggle_cpu_profile)
+        signal.signal(signal.SIGUSR2, self._toggle_memory_trace)
+        return True
+
+    def _output_path(self, kind, suffix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_dir, f"dhtui-{kind}-{os.getpid()}-{stamp}{suffix}")
+
+    def _toggle_cpu_profile(self, signum, frame):
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            print("Profiler: cProfile started (send SIGUSR1 again to stop)")
+            return
+        self.profiler.disable()
+        path = self._output_path("profile", ".prof")
+        self.profiler.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(self.profiler, stream=text).sort_stats("cumulative").print_stats(self.top)
+        self.profiler = None
+        print(f"Profiler: wrote {path}")
+        print(text.getvalue())
+
+    def _toggle_memory_trace(self, signum, frame):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            print("Profiler: tracemalloc started (send SIGUSR2 again to stop)")
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        path = self._output_path("tracemalloc", ".txt")
+        with open(path, "w") as f:
+            f.write(f"traced: {current} bytes current, {peak} bytes peak\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+        print(f"Profiler: wrote {path} ({current / 1024:.0f} KiB traced, {peak / 1024:.0f} KiB peak)")
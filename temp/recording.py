@@ -0,0 +1,104 @@
+# Field recordings for the dhtui display.
+#
+# With DHTUI_RECORD=/path/to/incident.drec the display appends everything it
+# receives to a compact, append-only binary log: each new Open-Meteo response
+# (the raw JSON, zlib-compressed) and each changed sensor reading, CPU temperature
+# and memory/storage value (in the hub's snapshot encoding), with the wall-clock
+# time it arrived. replay.py plays a log back through the display at up to 1000x,
+# so an API outage or a sensor glitch storm can be reproduced at a desk.
+#
+# Each session starts with a setup record (the locations and sensors the display
+# was configured with), so a replay does not depend on the environment it runs in.
+#
+# Layout: "DREC", a version byte, then records of kind (1 byte), time (float64)
+# and payload length (uint32), followed by the payload. A record cut short by a
+# power cut is ignored when reading.
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from hub import encode_snapshot, decode_snapshot
+
+MAGIC = b"DREC"
+FORMAT_VERSION = 1
+RECORD_HEADER = struct.Struct("<BdI") # kind, time, payload length
+
+KIND_VALUES = 1 # {source name: value}, encoded like a hub snapshot
+KIND_RESPONSE = 2 # Raw weather API response, zlib-compressed JSON
+KIND_SETUP = 3 # Locations and sensors of the recording display, JSON
+
+
+class Recorder:
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_values = {} # Sources report unchanged values on every poll; only changes are written
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC + bytes([FORMAT_VERSION]))
+
+        # Statistics
+        self.records = 0
+        self.bytes_written = 0
+
+    def _write(self, kind, payload, t):
+        record = RECORD_HEADER.pack(kind, t, len(payload)) + payload
+        with self._lock:
+            self._file.write(record)
+            self._file.flush() # One write per record, so a crash loses at most the last one
+            self.records += 1
+            self.bytes_written += len(record)
+
+    # Acquisition listener: records a reading if it changed since the last one
+    def record_value(self, source_name, value):
+        if self._last_values.get(source_name) == value:
+            return
+        self._last_values[source_name] = value
+        t = self.clock()
+        self._write(KIND_VALUES, encode_snapshot({source_name: value}, published_at=t), t)
+
+    def record_setup(self, setup):
+        self._write(KIND_SETUP, json.dumps(setup, separators=(",", ":")).encode("utf-8"), self.clock())
+
+    def record_response(self, data):
+        self._write(KIND_RESPONSE, zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8")),
+                    self.clock())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def stats(self):
+        return {"records": self.records, "bytes_written": self.bytes_written}
+
+
+# Yields (kind, time, payload) for every complete record in a log
+def read_records(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC or len(data) <= len(MAGIC) or data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a dhtui recording")
+    offset = len(MAGIC) + 1
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, t, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break # Cut short while being written
+        yield kind, t, data[offset:offset + length]
+        offset += length
+
+
+# Payload of a record: {source name: value}, the API response or the setup as a dict
+def decode_record(kind, payload):
+    if kind == KIND_VALUES:
+        return decode_snapshot(payload)[2]
+    if kind == KIND_RESPONSE:
+        return json.loads(zlib.decompress(payload))
+    if kind == KIND_SETUP:
+        return json.loads(payload)
+    raise ValueError(f"unknown record kind {kind}")
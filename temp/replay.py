@@ -0,0 +1,183 @@
+# Replays a field recording through the dhtui display.
+#
+# The records in a DHTUI_RECORD log are fed back through the same code the live
+# display runs, set up with the locations and sensors stored in the log: each weather response goes through parse_forecast() and the
+# forecast is interpolated every WEATHER_API_INTERVAL, and readings go into an
+# AcquisitionEngine snapshot. Then come apply_snapshot(), the smoothing and the
+# renderer. A SimulatedClock stands in for pygame's ticks and the wall clock and
+# runs at --speed times real time (1x to 1000x). Frames are drawn as fast as
+# --fps allows, and the virtual time each frame covers grows with the speed.
+#
+# The report gives throughput (records and frames per second, the speed reached)
+# and latency (how long after a record was due it was on screen, and frame time).
+#
+#   python replay.py incident.drec --speed 100
+#   python replay.py incident.drec --speed 1000 --size 1920x1080 --fps 0   # flat out
+#   python replay.py incident.drec --speed 1 --window                      # watch it
+import argparse
+import datetime
+import math
+import sys
+import time
+
+import pygame
+
+import dhtui
+from acquisition import AcquisitionEngine
+from recording import read_records, decode_record, KIND_VALUES, KIND_RESPONSE, KIND_SETUP
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def replay(path, speed, size, fps, headless=True):
+    records = list(read_records(path))
+    setups = [decode_record(kind, payload) for kind, _, payload in records if kind == KIND_SETUP]
+    records = [record for record in records if record[0] != KIND_SETUP]
+    if not records:
+        raise ValueError(f"{path} holds no records")
+    if setups:
+        dhtui.apply_recording_setup(setups[0])
+    else:
+        print(f"{path} does not say which locations and sensors it was recorded with; using this machine's")
+    start_time = records[0][1]
+    duration_ms = round((records[-1][1] - start_time) * 1000)
+
+    dhtui.clock = dhtui.SimulatedClock(start=datetime.datetime.fromtimestamp(start_time))
+    dhtui.init_display(headless=headless, size=size)
+    engine = AcquisitionEngine(clock=lambda: dhtui.clock.ticks() / 1000)
+    dhtui.acquisition = engine
+    dhtui.display_temperature_c = dhtui.display_humidity = None
+    dhtui.last_smoothing_ms = None
+    dhtui.forecast = dhtui.forecast_response = None
+    dhtui.init_derived_metrics() # High/low and trends start with the recording
+
+    frame_interval = 1 / fps if fps else 0.0
+    forecast = None
+    next_weather_ms = 0
+    applied_version = -1
+    next_record = 0
+    pending = [] # Wall-clock times at which delivered records were due, until they are on screen
+
+    record_latencies = []
+    frame_times = []
+    parse_times = []
+    frames = 0
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    while True:
+        wall_now = time.perf_counter()
+        virtual_ms = min(duration_ms, int((wall_now - wall_start) * speed * 1000))
+        frame_start = wall_now
+
+        # Deliver every record that is due by now, and re-interpolate the forecast on
+        # the live display's schedule, in time order
+        while True:
+            record_ms = round((records[next_record][1] - start_time) * 1000) if next_record < len(records) else math.inf
+            weather_ms = next_weather_ms if forecast is not None else math.inf
+            due_ms = min(record_ms, weather_ms)
+            if due_ms > virtual_ms:
+                break
+            dhtui.clock.elapsed_ms = due_ms # Readings and forecasts see the time they arrived at
+            if weather_ms < record_ms:
+                try:
+                    engine.publish("weather", forecast.at(dhtui.clock.timestamp()))
+                except (KeyError, ValueError) as e:
+                    print(f"Skipping unusable forecast: {e}")
+                    forecast = None
+                next_weather_ms += dhtui.WEATHER_API_INTERVAL
+                continue
+            kind, _, payload = records[next_record]
+            if kind == KIND_RESPONSE:
+                parse_start = time.perf_counter()
+                forecast = dhtui.parse_forecast(decode_record(kind, payload))
+                parse_times.append(time.perf_counter() - parse_start)
+                next_weather_ms = record_ms # Interpolate at once, as the live display does
+            elif kind == KIND_VALUES:
+                for name, value in decode_record(kind, payload).items():
+                    engine.publish(name, value)
+            pending.append(wall_start + record_ms / 1000 / speed)
+            next_record += 1
+
+        # One frame, as in dhtui.main()
+        dhtui.clock.elapsed_ms = virtual_ms
+        snapshot = engine.snapshot
+        if snapshot.version != applied_version:
+            dhtui.apply_snapshot(snapshot)
+            applied_version = snapshot.version
+        dhtui.update_outdoor_values(virtual_ms)
+        dhtui.update_display_values(virtual_ms)
+        dirty_rects = dhtui.draw_screen()
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        pygame.event.pump()
+        frames += 1
+
+        frame_end = time.perf_counter()
+        frame_times.append(frame_end - frame_start)
+        record_latencies += [frame_end - due for due in pending]
+        pending = []
+
+        if next_record >= len(records) and virtual_ms >= duration_ms:
+            break
+        if frame_interval:
+            time.sleep(max(0.0, frame_start + frame_interval - time.perf_counter()))
+
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+    return {
+        "records": len(records),
+        "responses": sum(1 for kind, _, _ in records if kind == KIND_RESPONSE),
+        "virtual_seconds": duration_ms / 1000,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "achieved_speed": duration_ms / 1000 / wall_seconds if wall_seconds else float("inf"),
+        "records_per_second": len(records) / wall_seconds if wall_seconds else float("inf"),
+        "frames": frames,
+        "fps": frames / wall_seconds if wall_seconds else float("inf"),
+        "frame_p50_ms": percentile(frame_times, 0.5) * 1000,
+        "frame_p99_ms": percentile(frame_times, 0.99) * 1000,
+        "latency_p50_ms": percentile(record_latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(record_latencies, 0.99) * 1000,
+        "latency_max_ms": max(record_latencies, default=0.0) * 1000,
+        "parse_mean_ms": sum(parse_times) / len(parse_times) * 1000 if parse_times else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a dhtui recording through the display")
+    parser.add_argument("recording", help="file written with DHTUI_RECORD")
+    parser.add_argument("--speed", type=float, default=100.0, help="virtual seconds per real second (1 to 1000)")
+    parser.add_argument("--size", type=dhtui.parse_size, default=(1024, 600), help="screen size as WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=float, default=60.0, help="frame rate cap; 0 renders as fast as possible")
+    parser.add_argument("--window", action="store_true", help="show the replay instead of rendering headless")
+    args = parser.parse_args()
+    if not 1 <= args.speed <= 1000:
+        parser.error("--speed must be between 1 and 1000")
+
+    try:
+        results = replay(args.recording, args.speed, args.size, args.fps, headless=not args.window)
+    except (OSError, ValueError) as e:
+        print(f"Cannot replay {args.recording}: {e}")
+        return 1
+    finally:
+        pygame.quit()
+
+    print(f"Replayed {results['records']} records ({results['responses']} weather responses) covering "
+          f"{results['virtual_seconds']:.0f} s in {results['wall_seconds']:.2f} s: "
+          f"{results['achieved_speed']:.0f}x of {args.speed:.0f}x requested")
+    print(f"Throughput: {results['records_per_second']:.0f} records/s, {results['frames']} frames at "
+          f"{results['fps']:.0f} fps, {results['cpu_seconds']:.2f} CPU-s")
+    print(f"Frame time: p50 {results['frame_p50_ms']:.2f} ms, p99 {results['frame_p99_ms']:.2f} ms; "
+          f"forecast parse {results['parse_mean_ms']:.2f} ms mean")
+    print(f"Record to screen: p50 {results['latency_p50_ms']:.1f} ms, p99 {results['latency_p99_ms']:.1f} ms, "
+          f"max {results['latency_max_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+# Out-of-process DHT sensor reader for the dhtui display.
+#
+# adafruit_dht's bitbang path busy-waits for about 250 ms per read while holding the
+# GIL, and DHT11 reads fail often. The sensor is therefore read in its own process,
+# pinned to its own core. That process schedules reads no faster than the sensor
+# allows, backs off on repeated failures, rejects outliers with a Hampel filter and
+# publishes validated readings through a small shared-memory struct. The UI side
+# only copies a few bytes out of shared memory.
+#
+# One process serves any number of sensors ("living=dht22:D17;kitchen=dht11:D4@5").
+# It reads them one at a time, so no two bitbang captures ever overlap. The first reads
+# are staggered across the read interval, and every sensor keeps its own minimum
+# interval, backoff and outlier filters. Each sensor has its own slot in shared memory,
+# and the slot also holds read time and scheduling lateness, so throughput and jitter
+# can be measured.
+#
+# Backends are given as "dht11:D4", "dht22:D17" or "fake" (simulated readings, for
+# running without GPIO, e.g. "fake:temperature=19,phase=2,read_time=0.25").
+import collections
+import heapq
+import math
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import struct
+import time
+from multiprocessing import shared_memory
+
+# One slot per sensor: seq, timestamp, temperature, humidity, reads, errors, rejected,
+# consecutive failures, backend flags, seconds spent reading, total and largest lateness
+READING_STRUCT = struct.Struct("<Qdddiiiiiddd")
+FLAG_SIMULATED = 1
+
+MIN_READ_INTERVAL = 2.0 # Seconds; default time between reads of one sensor
+MAX_RETRY_INTERVAL = 30.0
+SENSOR_MIN_INTERVALS = {"dht11": 2.0, "dht22": 2.0} # adafruit_dht returns its cached reading inside 2 s; faster requests are slowed down
+GUARD_TIME = 0.05 # Seconds of quiet between two captures, so the next one starts with a settled bus and CPU
+
+SensorSpec = collections.namedtuple("SensorSpec", "name backend interval")
+
+
+# "dht11:D4" or "living=dht22:D17@5;kitchen=dht11:D4" -> [SensorSpec]. An unnamed first
+# sensor is called "indoor", other unnamed ones after their pin. "none" means no sensor.
+def parse_sensor_specs(text):
+    specs = []
+    for i, entry in enumerate(part.strip() for part in text.split(";")):
+        if not entry or entry.lower() == "none":
+            continue
+        name, _, backend = entry.partition("=") if "=" in entry.partition(":")[0] else ("", "", entry)
+        backend, _, interval = backend.partition("@")
+        if not name:
+            name = "indoor" if not specs else (backend.partition(":")[2] or f"sensor{i + 1}")
+        specs.append(SensorSpec(name.strip(), backend.strip(), float(interval) if interval else None))
+    return specs
+
+
+# Shortest time the part allows between two reads
+def min_read_interval(spec):
+    return SENSOR_MIN_INTERVALS.get(spec.backend.partition(":")[0].lower(), 0.0)
+
+
+# Seconds between reads of a sensor: what was asked for, but never faster than the part allows
+def read_interval(spec):
+    return max(spec.interval or MIN_READ_INTERVAL, min_read_interval(spec))
+
+
+# Simulated sensor: the sine/cosine values the display used to generate itself, with
+# the level, swing and phase configurable so several fake rooms differ, optionally
+# with noise, injected read failures and spikes to exercise the filter, and a read
+# time to stand in for the bitbang capture when testing the scheduler.
+class FakeDHTBackend:
+    simulated = True
+
+    def __init__(self, failure_rate=0.0, spike_rate=0.0, seed=None, temperature=25.0, temperature_swing=5.0,
+                 humidity=60.0, humidity_swing=10.0, phase=0.0, step=0.1, noise=0.0, read_time=0.0):
+        self.failure_rate = failure_rate
+        self.spike_rate = spike_rate
+        self.random = random.Random(seed)
+        self.temperature = temperature
+        self.temperature_swing = temperature_swing
+        self.humidity = humidity
+        self.humidity_swing = humidity_swing
+        self.step = step # Simulation time per read
+        self.noise = noise # Standard deviation added to both values
+        self.read_time = read_time # Seconds each read takes
+        self.sim_time = phase
+
+    def read(self):
+        if self.read_time:
+            time.sleep(self.read_time)
+        self.sim_time += self.step # Increment simulation time
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError("Checksum did not validate. Try again.")
+        temperature = self.temperature + self.temperature_swing * math.sin(self.sim_time) # 20..30 by default
+        humidity = self.humidity + self.humidity_swing * math.cos(self.sim_time * 0.7) # 50..70 by default
+        if self.noise:
+            temperature += self.random.gauss(0, self.noise)
+            humidity += self.random.gauss(0, self.noise)
+        if self.random.random() < self.spike_rate:
+            temperature += self.random.choice([-1, 1]) * 40
+        return temperature, humidity
+
+    def close(self):
+        pass
+
+
+# Real DHT11/DHT22 through Blinka. Imported here so only the worker process pays
+# for board detection and GPIO setup.
+class DHTBackend:
+    simulated = False
+
+    def __init__(self, kind, pin):
+        import board
+        import adafruit_dht
+        sensor_class = {"dht11": adafruit_dht.DHT11, "dht22": adafruit_dht.DHT22}[kind]
+        self.device = sensor_class(getattr(board, pin))
+
+    def read(self):
+        temperature = self.device.temperature
+        humidity = self.device.humidity
+        if temperature is None or humidity is None:
+            raise RuntimeError("Sensor returned no data")
+        return temperature, humidity
+
+    def close(self):
+        self.device.exit()
+
+
+def make_backend(spec):
+    kind, _, pin = spec.partition(":")
+    kind = kind.lower()
+    if kind == "fake":
+        options = dict(option.split("=") for option in pin.split(",") if option) # e.g. fake:failure_rate=0.3
+        options = {key: float(value) for key, value in options.items()}
+        if "seed" in options:
+            options["seed"] = int(options["seed"])
+        return FakeDHTBackend(**options)
+    return DHTBackend(kind, pin or "D4")
+
+
+# Hampel filter: rejects a value that is more than k scaled MADs from the median of
+# the recent window. min_threshold stops a perfectly flat window from rejecting
+# every small, real change, and a run of rejections is taken as a real step change.
+class HampelFilter:
+    def __init__(self, window=7, k=3.0, min_threshold=1.0):
+        self.values = collections.deque(maxlen=window)
+        self.k = k
+        self.min_threshold = min_threshold
+        self.consecutive_rejects = 0
+
+    def accept(self, value):
+        if len(self.values) >= 3:
+            median = statistics.median(self.values)
+            mad = statistics.median(abs(v - median) for v in self.values)
+            threshold = max(self.k * 1.4826 * mad, self.min_threshold)
+            if abs(value - median) > threshold:
+                self.consecutive_rejects += 1
+                if self.consecutive_rejects <= self.values.maxlen // 2:
+                    return False
+                self.values.clear() # The outliers persisted: the level really changed
+        self.consecutive_rejects = 0
+        self.values.append(value)
+        return True
+
+
+# Seconds to wait before the next read, given the number of consecutive failures
+def next_read_delay(failures, min_interval=MIN_READ_INTERVAL):
+    if failures <= 1:
+        return min_interval # DHT checksum errors are common; one plain retry first
+    return min(MAX_RETRY_INTERVAL, min_interval * 2 ** (failures - 1))
+
+
+def write_reading(buffer, offset, seq, *fields):
+    # Seqlock: an odd sequence number tells readers a write is in progress
+    struct.pack_into("<Q", buffer, offset, seq + 1)
+    READING_STRUCT.pack_into(buffer, offset, seq + 1, *fields)
+    struct.pack_into("<Q", buffer, offset, seq + 2)
+    return seq + 2
+
+
+# A write takes microseconds, so a slot that stays odd (or keeps changing) this many
+# tries means the worker died mid-write; the caller gets an error instead of a spin
+READ_RETRIES = 1000
+
+
+def read_reading(buffer, offset=0):
+    for _ in range(READ_RETRIES):
+        seq = struct.unpack_from("<Q", buffer, offset)[0]
+        if not seq % 2:
+            values = READING_STRUCT.unpack_from(buffer, offset)
+            if struct.unpack_from("<Q", buffer, offset)[0] == seq:
+                return values
+        time.sleep(0) # Let the writer finish
+    raise RuntimeError("sensor reading is stuck mid-write (did the sensor process die?)")
+
+
+# Worker-side state of one sensor
+class ScheduledSensor:
+    def __init__(self, slot, name, backend, interval, min_interval=0.0):
+        self.slot = slot
+        self.offset = slot * READING_STRUCT.size
+        self.name = name
+        self.backend = backend
+        self.interval = interval
+        self.min_interval = min_interval
+        self.temperature_filter = HampelFilter(min_threshold=2.0) # °C; real rooms never jump this much in 2 s
+        self.humidity_filter = HampelFilter(min_threshold=5.0) # %RH
+        self.seq = 0
+        self.reads = self.errors = self.rejected = self.failures = 0
+        self.flags = FLAG_SIMULATED if backend.simulated else 0
+        self.last_temperature = self.last_humidity = math.nan
+        self.last_timestamp = 0.0
+        self.busy = 0.0 # Seconds spent inside backend.read()
+        self.lateness_total = 0.0 # Seconds reads started after they were due
+        self.lateness_max = 0.0
+
+    def read(self):
+        self.reads += 1
+        try:
+            temperature, humidity = self.backend.read()
+            self.failures = 0
+            temperature_ok = self.temperature_filter.accept(temperature)
+            humidity_ok = self.humidity_filter.accept(humidity)
+            if temperature_ok and humidity_ok:
+                self.last_temperature, self.last_humidity, self.last_timestamp = temperature, humidity, time.time()
+            else:
+                self.rejected += 1
+        except RuntimeError:
+            # Checksum and timing errors are routine on the DHT11
+            self.errors += 1
+            self.failures += 1
+        except Exception as e:
+            print(f"An unexpected error occurred reading sensor {self.name}: {e}")
+            self.errors += 1
+            self.failures += 1
+
+    def publish(self, buffer):
+        self.seq = write_reading(buffer, self.offset, self.seq, self.last_timestamp, self.last_temperature,
+                                 self.last_humidity, self.reads, self.errors, self.rejected, self.failures,
+                                 self.flags, self.busy, self.lateness_total, self.lateness_max)
+
+
+# Decides which sensor to read next. Reads never overlap and are GUARD_TIME apart;
+# the first reads are spread evenly over the shortest interval so the sensors do not
+# all come due together. A sensor that keeps failing is backed off on its own.
+class SensorScheduler:
+    def __init__(self, sensors, guard_time=GUARD_TIME, clock=time.monotonic):
+        self.sensors = sensors
+        self.guard_time = guard_time
+        self.clock = clock
+        now = clock()
+        spacing = min(sensor.interval for sensor in sensors) / len(sensors) if sensors else 0
+        self.queue = [(now + i * spacing, i) for i in range(len(sensors))] # (due time, sensor index)
+        heapq.heapify(self.queue)
+        self.bus_free_at = now # No capture may start before this
+
+    # (sensor, due time, seconds to wait before reading it)
+    def next(self):
+        due, i = self.queue[0]
+        return self.sensors[i], due, max(due, self.bus_free_at) - self.clock()
+
+    # Reads the sensor that is due and schedules its next read
+    def run_next(self):
+        due, i = heapq.heappop(self.queue)
+        sensor = self.sensors[i]
+        started = self.clock()
+        lateness = max(0.0, started - due)
+        sensor.lateness_total += lateness
+        sensor.lateness_max = max(sensor.lateness_max, lateness)
+        sensor.read()
+        finished = self.clock()
+        sensor.busy += finished - started
+        self.bus_free_at = finished + self.guard_time
+        if sensor.failures:
+            next_due = started + next_read_delay(sensor.failures, sensor.interval)
+        else:
+            # Keep the cadence after a late read; after a long stall, start a new one
+            # instead of catching up faster than the part allows
+            next_due = due + sensor.interval
+            if next_due < started + sensor.min_interval:
+                next_due = started + sensor.interval
+        heapq.heappush(self.queue, (next_due, i))
+        return sensor
+
+
+# Entry point of the sensor process
+def worker_main(shm_name, specs, cpu, guard_time, parent_pid):
+    # Ctrl+C reaches the whole process group; the display stops this process itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError as e:
+            print(f"Could not pin sensor worker to CPU {cpu}: {e}")
+
+    sensors = []
+    for slot, spec in enumerate(specs):
+        try:
+            backend = make_backend(spec.backend)
+        except Exception as e:
+            print(f"Failed to initialize DHT sensor {spec.name} ({spec.backend}): {e}")
+            print("This sensor will run in simulation mode.")
+            backend = FakeDHTBackend(phase=slot * 0.9) # Distinct curves per simulated room
+        sensors.append(ScheduledSensor(slot, spec.name, backend, read_interval(spec), min_read_interval(spec)))
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = shm.buf
+    scheduler = SensorScheduler(sensors, guard_time)
+
+    try:
+        while os.getppid() == parent_pid: # Exit if the display process goes away
+            _, _, delay = scheduler.next()
+            if delay > 0:
+                time.sleep(min(delay, 1.0))
+                continue
+            scheduler.run_next().publish(buffer)
+    finally:
+        for sensor in sensors:
+            sensor.backend.close()
+        buffer.release()
+        shm.close()
+
+
+# UI side: owns the shared memory and the worker process
+class SensorReader:
+    def __init__(self, specs, cpu=None, guard_time=GUARD_TIME, clock=time.monotonic):
+        if isinstance(specs, str):
+            specs = parse_sensor_specs(specs)
+        self.specs = list(specs)
+        self.slots = {spec.name: i * READING_STRUCT.size for i, spec in enumerate(self.specs)}
+        size = max(1, len(self.specs)) * READING_STRUCT.size
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.shm.buf[:size] = bytes(size)
+        self.clock = clock
+        self.started = clock()
+        if cpu is None and hasattr(os, "sched_getaffinity"):
+            cpu = max(os.sched_getaffinity(0)) # Last core; the UI usually runs on core 0
+        # fork, so the display script is not re-imported in the child
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(
+            target=worker_main, name="dht-sensor",
+            args=(self.shm.name, self.specs, cpu, guard_time, os.getpid()), daemon=True)
+
+    def start(self):
+        self.started = self.clock()
+        self.process.start()
+
+    def names(self):
+        return [spec.name for spec in self.specs]
+
+    # Latest validated reading of one sensor as (temperature, humidity, timestamp), or None
+    # before its first one
+    def read(self, name=None):
+        offset = self.slots[name] if name is not None else 0
+        _, timestamp, temperature, humidity = read_reading(self.shm.buf, offset)[:4]
+        if timestamp == 0.0:
+            return None
+        return temperature, humidity, timestamp
+
+    # Counters and timing of one sensor
+    def sensor_stats(self, name):
+        (_, _, _, _, reads, errors, rejected, failures, flags,
+         busy, lateness_total, lateness_max) = read_reading(self.shm.buf, self.slots[name])
+        return {"reads": reads, "errors": errors, "rejected": rejected, "failures": failures,
+                "simulated": bool(flags & FLAG_SIMULATED), "busy_seconds": busy,
+                "mean_read_ms": busy / reads * 1000 if reads else 0.0,
+                "mean_lateness_ms": lateness_total / reads * 1000 if reads else 0.0,
+                "max_lateness_ms": lateness_max * 1000}
+
+    # Totals over all sensors, plus aggregate throughput and the share of time the bus was busy
+    def stats(self):
+        sensors = {name: self.sensor_stats(name) for name in self.slots}
+        totals = {key: sum(s[key] for s in sensors.values()) for key in ("reads", "errors", "rejected")}
+        elapsed = max(self.clock() - self.started, 1e-9)
+        busy = sum(s["busy_seconds"] for s in sensors.values())
+        lateness = [s["mean_lateness_ms"] * s["reads"] for s in sensors.values()]
+        return dict(totals, simulated=any(s["simulated"] for s in sensors.values()), sensors=sensors,
+                    reads_per_second=totals["reads"] / elapsed, bus_busy=busy / elapsed,
+                    mean_lateness_ms=sum(lateness) / totals["reads"] if totals["reads"] else 0.0,
+                    max_lateness_ms=max((s["max_lateness_ms"] for s in sensors.values()), default=0.0))
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,92 @@
+# Cold-start support for the dhtui display.
+#
+# After a power cut the panel should show something useful as soon as the display is
+# open. The last readings are therefore kept in a small on-disk snapshot (the same
+# compact binary format the LAN hub sends), drawn in the very first frame, and the
+# slow parts (sensor backend, HTTP client, history, forecast) come up afterwards in
+# the background. StartupTimer records how long each import and startup phase took,
+# so time-to-first-frame can be tracked.
+import os
+import struct
+import time
+
+from files import write_atomic
+from hub import encode_snapshot, decode_snapshot
+
+
+# Seconds since this process was started by the kernel, so the interpreter's own
+# startup is included (None where /proc is not available)
+def process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rpartition(")")[2].split()[19]) # Field 22, after the command name
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        age = process_age()
+        self.offset = age if age is not None else 0.0 # Time already spent before this module ran
+        self.phases = {} # name -> seconds, in the order they finished
+        self.milestones = {} # name -> seconds since process start
+
+    # Context manager timing one phase, e.g. `with startup_timer.phase("import pygame"):`
+    def phase(self, name):
+        return _Phase(self, name)
+
+    # Records that something happened now, e.g. the first frame
+    def mark(self, name):
+        self.milestones.setdefault(name, self.elapsed())
+
+    # Seconds since the process started
+    def elapsed(self):
+        return self.offset + self.clock() - self.started
+
+    def report(self):
+        lines = [f"{name:<28} {seconds * 1000:8.1f} ms" for name, seconds in self.phases.items()]
+        lines += [f"{name:<28} {seconds * 1000:8.1f} ms after process start"
+                  for name, seconds in self.milestones.items()]
+        return lines
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.timer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.phases[self.name] = self.timer.clock() - self.start
+        return False
+
+
+# Last readings on disk, shown before any source has produced a fresh value
+class LastKnownValues:
+    def __init__(self, path):
+        self.path = path
+
+    # {source name: value}, or {} if there is no readable snapshot
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                _, saved_at, values = decode_snapshot(f.read())
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable last-known values {self.path}: {e}")
+            return {}
+        return values
+
+    def save(self, values):
+        try:
+            write_atomic(self.path, encode_snapshot(values))
+        except OSError as e:
+            print(f"Error writing last-known values: {e}")
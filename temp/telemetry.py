@@ -0,0 +1,136 @@
+# System telemetry for the dhtui display.
+#
+# Replaces forking `vcgencmd measure_temp` every 10 s. The CPU temperature comes
+# straight from /sys/class/thermal through a file descriptor that stays open and is
+# re-read with pread(); vcgencmd is only used when sysfs has no thermal zone.
+# Memory (/proc/meminfo, also pread) and disk (statvfs) are sampled together.
+# Each source is wrapped in an AdaptiveSampler that samples faster while the value
+# moves and slower while it is flat, and keeps track of its own sampling cost.
+# The sysfs/procfs roots can be pointed at a fake tree for testing.
+import os
+import subprocess
+import time
+
+
+class SysfsThermalSource:
+    name = "sysfs"
+
+    def __init__(self, sysfs_root="/sys", zone="thermal_zone0"):
+        self.path = os.path.join(sysfs_root, "class", "thermal", zone, "temp")
+        self.fd = os.open(self.path, os.O_RDONLY) # Raises if the zone does not exist
+
+    # Millidegrees Celsius, e.g. "45622\n"
+    def sample(self):
+        return int(os.pread(self.fd, 32, 0)) / 1000
+
+    def close(self):
+        os.close(self.fd)
+
+
+class VcgencmdThermalSource:
+    name = "vcgencmd"
+
+    def sample(self):
+        result = subprocess.run(['vcgencmd', 'measure_temp'], capture_output=True, text=True, check=True, timeout=5)
+        # Extract temperature (e.g., "temp=45.6'C")
+        return float(result.stdout.strip().split('=')[1].replace("'C", ""))
+
+    def close(self):
+        pass
+
+
+def make_thermal_source(sysfs_root="/sys"):
+    try:
+        return SysfsThermalSource(sysfs_root)
+    except OSError as e:
+        print(f"No sysfs thermal zone ({e}); falling back to vcgencmd for CPU temperature.")
+        return VcgencmdThermalSource()
+
+
+# Memory and storage usage in one sample
+class SystemStatsSource:
+    name = "meminfo+statvfs"
+
+    def __init__(self, procfs_root="/proc", mount_point="/"):
+        self.meminfo_fd = os.open(os.path.join(procfs_root, "meminfo"), os.O_RDONLY)
+        self.mount_point = mount_point
+
+    def sample(self):
+        meminfo = {}
+        for line in os.pread(self.meminfo_fd, 4096, 0).decode("ascii", "replace").splitlines():
+            key, _, rest = line.partition(":")
+            if key in ("MemTotal", "MemAvailable"):
+                meminfo[key] = int(rest.split()[0])
+        memory = (meminfo["MemTotal"] - meminfo["MemAvailable"]) / meminfo["MemTotal"] * 100
+
+        disk = os.statvfs(self.mount_point)
+        total = disk.f_blocks * disk.f_frsize
+        used = (disk.f_blocks - disk.f_bfree) * disk.f_frsize
+        storage = used / total * 100 if total else 0.0
+        return {"memory": memory, "storage": storage}
+
+    def close(self):
+        os.close(self.meminfo_fd)
+
+
+# Largest change between two samples (plain numbers or dicts of numbers)
+def sample_change(previous, current):
+    if previous is None:
+        return float("inf")
+    if isinstance(current, dict):
+        return max(abs(current[key] - previous.get(key, current[key])) for key in current)
+    return abs(current - previous)
+
+
+class AdaptiveSampler:
+    def __init__(self, source, min_interval, max_interval, threshold, speedup=0.5, slowdown=1.5):
+        self.source = source
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold # Change that counts as "moving"
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.interval = min_interval
+        self.last_value = None
+
+        # Sampling cost
+        self.samples = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+
+    def sample(self):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            value = self.source.sample()
+        except Exception:
+            # A missing sensor stays missing; retry less and less often, like a flat value
+            self.interval = min(self.max_interval, self.interval * self.slowdown)
+            raise
+        finally:
+            self.wall_time += time.perf_counter() - wall_start
+            self.cpu_time += time.process_time() - cpu_start
+            self.samples += 1
+
+        if sample_change(self.last_value, value) >= self.threshold:
+            self.interval = max(self.min_interval, self.interval * self.speedup)
+        else:
+            self.interval = min(self.max_interval, self.interval * self.slowdown)
+        self.last_value = value
+        return value
+
+    # Used as the acquisition interval, so the schedule follows the sampler
+    def next_interval(self):
+        return self.interval
+
+    def stats(self):
+        return {
+            "source": self.source.name,
+            "samples": self.samples,
+            "interval": self.interval,
+            "mean_wall_us": self.wall_time / self.samples * 1e6 if self.samples else 0.0,
+            "mean_cpu_us": self.cpu_time / self.samples * 1e6 if self.samples else 0.0,
+        }
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,79 @@
+# Text surface caching for the dhtui display.
+#
+# font.render() at 180/220 pt is the most expensive call in the render loop, and
+# the same strings come back frame after frame. TextCache keeps rendered surfaces
+# in a bounded LRU, and DigitAtlas builds numbers out of glyphs rasterised once.
+import collections
+
+
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict() # (text, font, color, antialias) -> Surface
+        self.pinned = {} # Surfaces rendered once at startup; never evicted
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the rendered surface for text, rendering it only on a cache miss
+    def render(self, text, font, color, antialias=True):
+        key = (text, font, color, antialias)
+        surface = self.pinned.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    # Renders a label that never changes once, outside the LRU
+    def pin(self, text, font, color, antialias=True):
+        key = (text, font, color, antialias)
+        if key not in self.pinned:
+            self.pinned[key] = font.render(text, antialias, color)
+        return self.pinned[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "pinned": len(self.pinned),
+        }
+
+
+# Pre-rasterised glyphs for one font and colour. Numbers are composed by blitting
+# glyph surfaces side by side, so a changing value never calls font.render().
+class DigitAtlas:
+    DEFAULT_CHARACTERS = "0123456789-:.%N/A "
+
+    def __init__(self, font, color, characters=DEFAULT_CHARACTERS, antialias=True):
+        self.glyphs = {ch: font.render(ch, antialias, color) for ch in characters}
+        self.height = font.get_height()
+
+    def can_render(self, text):
+        return all(ch in self.glyphs for ch in text)
+
+    def size(self, text):
+        return sum(self.glyphs[ch].get_width() for ch in text), self.height
+
+    # Blits text with its top-left corner at (x, y)
+    def blit(self, surface, text, x, y):
+        for ch in text:
+            glyph = self.glyphs[ch]
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
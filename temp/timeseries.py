@@ -0,0 +1,265 @@
+# Reading history for the dhtui display.
+#
+# Every metric gets a fixed-size ring buffer of (timestamp, value) pairs plus a few
+# rollup tiers (min/max/sum/count per 1 min, 10 min and 1 h bucket by default).
+# Everything lives in NumPy arrays backed by one memory-mapped file, so history
+# survives a restart without a load step and no Python object is created per sample.
+# Sparklines read the coarsest tier that still gives at least one bucket per pixel,
+# which keeps drawing 7 days of history proportional to the width, not the samples.
+import os
+import threading
+import time
+
+import numpy as np
+
+from files import default_data_dir
+
+MAGIC = b"DHTTS001"
+NAME_SIZE = 48 # Bytes reserved per metric name
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("capacity", "<i8"),
+    ("tier_capacity", "<i8"),
+    ("n_metrics", "<i8"),
+    ("n_tiers", "<i8"),
+])
+# Rows of a tier buffer
+START, MIN, MAX, SUM, COUNT = range(5)
+
+
+def default_history_path():
+    return os.path.join(default_data_dir(), "history.bin")
+
+
+class TimeSeriesStore:
+    def __init__(self, path, metrics, capacity=65536, tiers=(60, 600, 3600), tier_capacity=10080):
+        self.path = path
+        self.metrics = list(metrics)
+        self.capacity = capacity
+        self.tiers = list(tiers)
+        self.tier_capacity = tier_capacity
+        self._lock = threading.Lock()
+        self._open()
+
+    # --- file layout ---
+    # One slot per metric name. The file can hold slots for metrics that are no longer
+    # listed (a removed location or renamed sensor), so their history comes back with them.
+    def _layout(self, n_slots):
+        n_tiers = len(self.tiers)
+        regions = [
+            ("header", HEADER_DTYPE, (1,)),
+            ("names", np.dtype(f"S{NAME_SIZE}"), (n_slots,)),
+            ("tier_seconds", np.dtype("<i8"), (n_tiers,)),
+            # head/count for the raw ring (slot 0) and every tier (slots 1..n)
+            ("cursors", np.dtype("<i8"), (n_slots, n_tiers + 1, 2)),
+            ("raw_time", np.dtype("<f8"), (n_slots, self.capacity)),
+            ("raw_value", np.dtype("<f4"), (n_slots, self.capacity)),
+            ("tier_data", np.dtype("<f8"), (n_slots, n_tiers, 5, self.tier_capacity)),
+        ]
+        offset = 0
+        layout = []
+        for name, dtype, shape in regions:
+            layout.append((name, dtype, shape, offset))
+            offset += dtype.itemsize * int(np.prod(shape))
+            offset = (offset + 7) // 8 * 8 # Keep every region 8-byte aligned
+        return layout, offset
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        wanted = [name.encode("utf-8")[:NAME_SIZE] for name in self.metrics]
+        slots = self._existing_slots()
+        if slots is None:
+            if os.path.exists(self.path):
+                print(f"History file {self.path} has different buffer sizes; starting a new history.")
+            self._create(self.path, wanted)
+        else:
+            added = [name for name in wanted if name not in slots]
+            if added:
+                self._grow(slots, slots + added)
+        self._map(self.path)
+        slots = list(self._names)
+        self._index = {name: slots.index(key) for name, key in zip(self.metrics, wanted)}
+
+    # Slot names of the file at self.path, or None if there is no usable file
+    def _existing_slots(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = np.fromfile(f, dtype=HEADER_DTYPE, count=1)
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        if len(header) != 1:
+            return None
+        header = header[0]
+        if (header["magic"] != MAGIC
+                or header["capacity"] != self.capacity
+                or header["tier_capacity"] != self.tier_capacity
+                or header["n_tiers"] != len(self.tiers)):
+            return None
+        layout, expected = self._layout(int(header["n_metrics"]))
+        if size != expected:
+            return None
+        self._map(self.path, layout, expected, mode="r")
+        slots = list(self._names)
+        tiers = list(self._tier_seconds)
+        del self._mm
+        return slots if tiers == self.tiers else None
+
+    def _map(self, path, layout=None, size=None, mode="r+"):
+        if layout is None:
+            with open(path, "rb") as f:
+                n_slots = int(np.fromfile(f, dtype=HEADER_DTYPE, count=1)[0]["n_metrics"])
+            layout, size = self._layout(n_slots)
+        self._mm = np.memmap(path, dtype=np.uint8, mode=mode, shape=(size,))
+        for name, dtype, shape, offset in layout:
+            setattr(self, "_" + name, np.ndarray(shape, dtype=dtype, buffer=self._mm, offset=offset))
+
+    def _create(self, path, slots):
+        layout, size = self._layout(len(slots))
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self._map(path, layout, size)
+        header = self._header[0]
+        header["magic"] = MAGIC
+        header["capacity"] = self.capacity
+        header["tier_capacity"] = self.tier_capacity
+        header["n_metrics"] = len(slots)
+        header["n_tiers"] = len(self.tiers)
+        self._names[:] = slots
+        self._tier_seconds[:] = self.tiers
+        self._mm.flush()
+        del self._mm
+
+    # Rewrites the file with empty slots added after the existing ones
+    def _grow(self, slots, new_slots):
+        tmp_path = self.path + ".tmp"
+        self._create(tmp_path, new_slots)
+        new = np.memmap(tmp_path, dtype=np.uint8, mode="r+")
+        old = np.memmap(self.path, dtype=np.uint8, mode="r")
+        new_layout, _ = self._layout(len(new_slots))
+        for (name, dtype, shape, offset), (_, _, _, new_offset) in zip(self._layout(len(slots))[0], new_layout):
+            if name in ("header", "names", "tier_seconds"):
+                continue
+            region = np.ndarray(shape, dtype=dtype, buffer=old, offset=offset)
+            np.ndarray(shape, dtype=dtype, buffer=new, offset=new_offset)[:] = region
+        new.flush()
+        del new, old
+        os.replace(tmp_path, self.path)
+        print(f"History: added {', '.join(name.decode('utf-8') for name in new_slots[len(slots):])}")
+
+    # --- writing ---
+    # Samples older than the newest stored one (the clock stepped back, e.g. an NTP
+    # correction or a Pi without RTC before its first sync) are dropped, so every ring
+    # stays sorted by time for the binary search in _ring_range().
+    def append(self, metric, value, t=None):
+        if value is None:
+            return
+        i = self._index[metric]
+        if t is None:
+            t = time.time()
+        with self._lock:
+            head, count = self._cursors[i, 0]
+            if count and t < self._raw_time[i, (head - 1) % self.capacity]:
+                return
+            self._raw_time[i, head] = t
+            self._raw_value[i, head] = value
+            self._cursors[i, 0] = ((head + 1) % self.capacity, min(count + 1, self.capacity))
+
+            for k, seconds in enumerate(self.tiers):
+                self._add_to_tier(i, k, t - t % seconds, value)
+
+    def _add_to_tier(self, i, k, bucket_start, value):
+        data = self._tier_data[i, k]
+        head, count = self._cursors[i, k + 1]
+        last = (head - 1) % self.tier_capacity
+        if count and data[START, last] == bucket_start:
+            data[MIN, last] = min(data[MIN, last], value)
+            data[MAX, last] = max(data[MAX, last], value)
+            data[SUM, last] += value
+            data[COUNT, last] += 1
+        else:
+            data[:, head] = (bucket_start, value, value, value, 1)
+            self._cursors[i, k + 1] = ((head + 1) % self.tier_capacity, min(count + 1, self.tier_capacity))
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self.flush()
+
+    # --- reading ---
+    # Physical indices of the ring entries with start <= time < end, oldest first.
+    # Binary search over the ring, so the cost follows the result size.
+    def _ring_range(self, times, head, count, capacity, start, end):
+        base = head - count
+
+        def first_at_or_after(t):
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[(base + mid) % capacity] < t:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        lo = first_at_or_after(start) if start is not None else 0
+        hi = first_at_or_after(end) if end is not None else count
+        return (base + np.arange(lo, hi)) % capacity
+
+    def latest(self, metric):
+        i = self._index[metric]
+        head, count = self._cursors[i, 0]
+        if not count:
+            return None
+        last = (head - 1) % self.capacity
+        return float(self._raw_time[i, last]), float(self._raw_value[i, last])
+
+    # Raw samples in [start, end) as (times, values) arrays
+    def window(self, metric, start=None, end=None):
+        i = self._index[metric]
+        head, count = self._cursors[i, 0]
+        idx = self._ring_range(self._raw_time[i], head, count, self.capacity, start, end)
+        return self._raw_time[i, idx], self._raw_value[i, idx].astype(np.float64)
+
+    # min/max/mean of [start, end) split into `width` equal buckets; NaN where empty.
+    # Returns (bucket_starts, mins, maxs, means).
+    def buckets(self, metric, start, end, width):
+        i = self._index[metric]
+        span = (end - start) / width
+        edges = start + span * np.arange(width)
+
+        # Coarsest tier that still has at least one bucket per output column
+        tier = None
+        for k, seconds in sorted(enumerate(self.tiers), key=lambda item: item[1]):
+            if seconds <= span:
+                tier = k
+        if tier is None:
+            times, values = self.window(metric, start, end)
+            mins = maxs = sums = values
+            counts = np.ones_like(values)
+        else:
+            head, count = self._cursors[i, tier + 1]
+            data = self._tier_data[i, tier]
+            idx = self._ring_range(data[START], head, count, self.tier_capacity, start, end)
+            times, mins, maxs, sums, counts = (data[row, idx] for row in (START, MIN, MAX, SUM, COUNT))
+
+        out_min = np.full(width, np.nan)
+        out_max = np.full(width, np.nan)
+        out_mean = np.full(width, np.nan)
+        if len(times):
+            columns = np.minimum(((times - start) / span).astype(np.int64), width - 1)
+            # Samples are time ordered, so each column is one contiguous run
+            run_starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+            cols = columns[run_starts]
+            out_min[cols] = np.minimum.reduceat(mins, run_starts)
+            out_max[cols] = np.maximum.reduceat(maxs, run_starts)
+            out_mean[cols] = np.add.reduceat(sums, run_starts) / np.add.reduceat(counts, run_starts)
+        return edges, out_min, out_max, out_mean
+
+    # (min, max, mean) over [start, end); None if there are no samples
+    def summary(self, metric, start, end):
+        _, mins, maxs, means = self.buckets(metric, start, end, 1)
+        if np.isnan(mins[0]):
+            return None
+        return float(mins[0]), float(maxs[0]), float(means[0])
@@ -0,0 +1,200 @@
+# Open-Meteo client for the dhtui display.
+#
+# One keep-alive requests.Session is shared by every call, and responses are kept
+# in a small on-disk cache keyed by the request parameters. Open-Meteo only
+# recomputes "current" values every 15 minutes, so a cached response is served
+# until the next model update instead of making a fresh HTTPS request each poll.
+# Errors back off exponentially with jitter, and the last cached response keeps
+# being served while the API is unreachable.
+# requests is imported by the first WeatherClient rather than at import time; it is
+# one of the slower imports on a Pi and the display should not wait for it.
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from files import write_atomic
+
+requests = None # Imported by load_requests()
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+MODEL_UPDATE_INTERVAL = 15 * 60 # Seconds between Open-Meteo "current" updates
+UPDATE_SETTLE_DELAY = 60 # Wait this long after an update boundary before refetching
+
+
+class WeatherBackoff(Exception):
+    pass
+
+
+# Stable cache key for a parameter dict (order of keys does not matter)
+def cache_key(base_url, params):
+    canonical = json.dumps([base_url, sorted((str(k), str(v)) for k, v in params.items())])
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def load_requests():
+    global requests
+    if requests is None:
+        import requests as requests_module
+        requests = requests_module
+    return requests
+
+
+def default_cache_path():
+    cache_dir = os.environ.get("DHTUI_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "dhtui")
+    return os.path.join(cache_dir, "weather_cache.json")
+
+
+class WeatherClient:
+    def __init__(self, base_url=OPEN_METEO_URL, cache_path=None, update_interval=MODEL_UPDATE_INTERVAL,
+                 timeout=5, backoff_base=5, backoff_max=600, session=None, clock=time.time):
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.update_interval = update_interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        load_requests() # Also needed with an injected session, for its exception types
+        self.session = session or requests.Session()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()
+        self._failures = 0
+        self._retry_at = 0.0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0 # Expired entries served because the API failed or is backing off
+        self.network_requests = 0
+        self.failures = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self.handshakes_saved = 0
+
+    # Returns the decoded JSON response for params, from cache while it is fresh
+    def fetch(self, params):
+        key = cache_key(self.base_url, params)
+        with self._lock:
+            entry = self._cache.get(key)
+            now = self.clock()
+            if entry is not None and now < entry["expires_at"]:
+                self.hits += 1
+                self.bytes_saved += entry["size"]
+                self.handshakes_saved += 1
+                return entry["data"]
+
+            if now < self._retry_at:
+                if entry is not None:
+                    self.stale_hits += 1
+                    return entry["data"]
+                raise WeatherBackoff(f"backing off for {self._retry_at - now:.0f} s after {self._failures} failures")
+
+            self.misses += 1
+
+        try:
+            data, size = self._request(params)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                self._register_failure()
+                if entry is not None:
+                    self.stale_hits += 1
+                    print(f"Error fetching outside weather, serving cached data: {e}")
+                    return entry["data"]
+            raise
+
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+            fetched_at = self.clock()
+            self._cache[key] = {
+                "data": data,
+                "size": size,
+                "fetched_at": fetched_at,
+                "expires_at": self._expiry(data, fetched_at),
+            }
+            self._save_cache()
+        return data
+
+    # Cached response for params regardless of age (None if never fetched).
+    # Lets the display show the last known weather immediately at startup.
+    def cached(self, params):
+        with self._lock:
+            entry = self._cache.get(cache_key(self.base_url, params))
+        return entry["data"] if entry is not None else None
+
+    def _request(self, params):
+        connections_before = self._connections_opened()
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+        content = response.content
+        data = json.loads(content)
+        with self._lock:
+            self.network_requests += 1
+            self.bytes_downloaded += len(content)
+            if self._connections_opened() == connections_before:
+                self.handshakes_saved += 1 # Reused the pooled keep-alive connection
+        return data, len(content)
+
+    # Total connections urllib3 has opened for this session (falls back to one per request)
+    def _connections_opened(self):
+        try:
+            pools = self.session.get_adapter(self.base_url).poolmanager.pools
+            return sum(pools[key].num_connections for key in list(pools.keys()))
+        except Exception:
+            return self.network_requests + 1
+
+    # Responses stay fresh until the next model update after the data's timestamp
+    def _expiry(self, data, fetched_at):
+        if isinstance(data, list): # Batched multi-location response; all share one update time
+            data = data[0] if data else {}
+        current = data.get("current") if isinstance(data, dict) else None
+        interval = self.update_interval
+        if isinstance(current, dict) and isinstance(current.get("time"), (int, float)):
+            interval = current.get("interval") or interval
+            expires_at = current["time"] + interval + UPDATE_SETTLE_DELAY
+        else:
+            expires_at = (fetched_at // interval + 1) * interval + UPDATE_SETTLE_DELAY
+        # Guard against clock skew between us and the API
+        return min(max(expires_at, fetched_at + UPDATE_SETTLE_DELAY), fetched_at + interval + UPDATE_SETTLE_DELAY)
+
+    # Exponential backoff with jitter (a random delay between half and all of the step)
+    def _register_failure(self):
+        self.failures += 1
+        self._failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+        self._retry_at = self.clock() + random.uniform(delay / 2, delay)
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            write_atomic(self.cache_path, json.dumps(self._cache).encode("utf-8"))
+        except OSError as e:
+            print(f"Error writing weather cache: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "network_requests": self.network_requests,
+            "failures": self.failures,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+            "handshakes_saved": self.handshakes_saved,
+        }
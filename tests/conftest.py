@@ -0,0 +1,5 @@
+# The dhtui modules live in temp/ and import each other by plain module name.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp"))
@@ -0,0 +1,108 @@
+# Hub snapshot codec, and publisher/subscriber over a Unix socket as several processes
+# on one host would use it.
+import time
+
+import pytest
+
+from hub import HubPublisher, HubSubscriber, decode_snapshot, encode_snapshot, parse_address
+from locations import WeatherTable
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def weather_table():
+    columns = {"temperature_2m": [11.5, None], "weather_code": [3, 61]}
+    return WeatherTable(["Plant", "HQ"], columns, [1_700_000_000, 1_700_000_000])
+
+
+def test_snapshot_round_trip():
+    values = {
+        "cpu": 48.5,
+        "indoor": (21.5, None, 1_700_000_000.25),
+        "system": {"memory": 35.0, "storage": 61.25},
+        "weather": weather_table(),
+        "missing": None, # Left out of the message
+    }
+    seq, published_at, decoded = decode_snapshot(encode_snapshot(values, seq=7, published_at=123.5))
+    assert (seq, published_at) == (7, 123.5)
+    assert decoded == {name: value for name, value in values.items() if value is not None}
+    assert decoded["weather"].row("HQ") == {"temperature_2m": None, "weather_code": 61}
+    assert isinstance(decoded["weather"].row("Plant")["weather_code"], int)
+
+
+def test_foreign_data_is_rejected():
+    with pytest.raises(ValueError):
+        decode_snapshot(b"XXXX" + encode_snapshot({"cpu": 1.0})[4:])
+
+
+def test_parse_address():
+    assert parse_address("tcp://:5007")[1] == ("0.0.0.0", 5007)
+    assert parse_address("unix:///run/dhtui/hub.sock")[1] == "/run/dhtui/hub.sock"
+    with pytest.raises(ValueError):
+        parse_address("udp://host:5007")
+
+
+@pytest.fixture
+def address(tmp_path):
+    return f"unix://{tmp_path / 'hub.sock'}"
+
+
+def test_subscribers_get_the_latest_snapshot_and_then_changes(address):
+    publisher = HubPublisher(address, heartbeat_interval=60)
+    publisher.start()
+    received = []
+    first = HubSubscriber(address, received.append, quiet_after=5)
+    second = HubSubscriber(address, lambda values: None, quiet_after=5)
+    try:
+        publisher.publish({"cpu": 48.5, "system": {"memory": 35.0}})
+        first.start()
+        assert wait_for(lambda: len(received) == 1)
+        assert received[0] == {"cpu": 48.5, "system": {"memory": 35.0}}
+
+        # A new subscriber is greeted on its own socket only
+        second.start()
+        assert wait_for(lambda: second.frames_received == 1)
+        assert first.frames_received == 1
+
+        publisher.publish({"cpu": 49.0, "system": {"memory": 35.0}})
+        assert wait_for(lambda: len(received) == 2)
+        assert received[1] == {"cpu": 49.0} # Only what changed
+        assert publisher.stats()["subscribers"] == 2
+    finally:
+        first.stop()
+        second.stop()
+        publisher.stop()
+
+
+def test_subscriber_fails_over_when_the_hub_goes_quiet_and_comes_back(address):
+    publisher = HubPublisher(address, heartbeat_interval=0.1)
+    publisher.start()
+    publisher.publish({"cpu": 48.5})
+    received = []
+    subscriber = HubSubscriber(address, received.append, quiet_after=0.5)
+    subscriber.start()
+    try:
+        assert wait_for(lambda: subscriber.frames_received >= 3) # Heartbeats keep it alive
+        assert not subscriber.is_quiet()
+
+        publisher.stop()
+        assert wait_for(subscriber.is_quiet)
+        time.sleep(1.5) # The subscriber keeps trying to reconnect
+        assert publisher.stats()["subscribers"] == 0
+        assert subscriber.is_quiet()
+
+        publisher = HubPublisher(address, heartbeat_interval=0.1)
+        publisher.start()
+        publisher.publish({"cpu": 50.0})
+        assert wait_for(lambda: not subscriber.is_quiet(), timeout=15)
+        assert received[-1] == {"cpu": 50.0}
+    finally:
+        subscriber.stop()
+        publisher.stop()
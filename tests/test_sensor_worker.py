@@ -0,0 +1,83 @@
+# Sensor worker with the fake backend: seqlock, filter, scheduling and the worker process.
+import time
+
+import pytest
+
+from sensor_worker import (READING_STRUCT, FakeDHTBackend, HampelFilter, ScheduledSensor, SensorReader,
+                           SensorScheduler, SensorSpec, parse_sensor_specs, read_interval, read_reading,
+                           write_reading)
+
+
+def test_seqlock_round_trip():
+    buffer = bytearray(2 * READING_STRUCT.size)
+    fields = (1_700_000_000.5, 21.5, 48.0, 10, 1, 0, 0, 1, 0.25, 0.01, 0.005)
+    seq = write_reading(buffer, READING_STRUCT.size, 0, *fields)
+    assert seq == 2
+    values = read_reading(buffer, READING_STRUCT.size)
+    assert values[0] == seq
+    assert values[1:] == fields
+    assert read_reading(buffer, 0)[1] == 0.0 # The other slot is untouched
+
+
+def test_slot_stuck_mid_write_raises():
+    buffer = bytearray(READING_STRUCT.size)
+    buffer[0] = 1 # Odd sequence number: a writer that never finished
+    with pytest.raises(RuntimeError):
+        read_reading(buffer)
+
+
+def test_parse_sensor_specs():
+    specs = parse_sensor_specs("living=dht22:D17@5;dht11:D4;none")
+    assert specs == [SensorSpec("living", "dht22:D17", 5.0), SensorSpec("D4", "dht11:D4", None)]
+    assert parse_sensor_specs("dht11:D4")[0].name == "indoor"
+
+
+def test_read_interval_respects_the_part():
+    assert read_interval(SensorSpec("a", "dht11:D4", 1.0)) == 2.0
+    assert read_interval(SensorSpec("a", "dht22:D17", 5.0)) == 5.0
+    assert read_interval(SensorSpec("a", "fake", 0.5)) == 0.5
+
+
+def test_hampel_filter_rejects_a_spike_but_follows_a_step():
+    hampel = HampelFilter(min_threshold=2.0)
+    for value in (21.0, 21.1, 21.0, 20.9, 21.0):
+        assert hampel.accept(value)
+    assert not hampel.accept(61.0)
+    assert hampel.accept(21.1)
+    # A level change that persists is accepted after a few readings
+    results = [hampel.accept(30.0) for _ in range(5)]
+    assert not results[0] and results[-1]
+
+
+def test_failing_sensor_is_backed_off_alone():
+    now = [0.0]
+    clock = lambda: now[0]
+    sensors = [ScheduledSensor(0, "good", FakeDHTBackend(seed=1), 2.0, 2.0),
+               ScheduledSensor(1, "bad", FakeDHTBackend(failure_rate=1.0, seed=1), 2.0, 2.0)]
+    scheduler = SensorScheduler(sensors, guard_time=0.0, clock=clock)
+    reads = {"good": 0, "bad": 0}
+    while now[0] < 60:
+        sensor, due, delay = scheduler.next()
+        now[0] += max(delay, 0.0)
+        reads[scheduler.run_next().name] += 1
+    assert sensors[0].errors == 0 and sensors[0].last_timestamp > 0
+    assert sensors[1].failures > 3
+    assert reads["good"] >= 29
+    assert reads["bad"] < 10
+
+
+def test_worker_process_publishes_fake_readings():
+    reader = SensorReader("fake:temperature=19,temperature_swing=0;attic=fake:humidity=40,humidity_swing=0")
+    reader.start()
+    try:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and (reader.read() is None or reader.read("attic") is None):
+            time.sleep(0.05)
+        temperature, _, timestamp = reader.read()
+        _, humidity, _ = reader.read("attic")
+        assert temperature == pytest.approx(19.0)
+        assert humidity == pytest.approx(40.0)
+        assert timestamp > 0
+        assert reader.stats()["simulated"]
+    finally:
+        reader.stop()
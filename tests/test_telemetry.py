@@ -0,0 +1,86 @@
+# Telemetry sources against a temporary sysfs/procfs tree, and the adaptive sampler.
+import pytest
+
+from telemetry import AdaptiveSampler, SysfsThermalSource, SystemStatsSource, make_thermal_source, sample_change
+
+MEMINFO = "MemTotal:        1000000 kB\nMemFree:          200000 kB\nMemAvailable:     250000 kB\n"
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    zone = tmp_path / "class" / "thermal" / "thermal_zone0"
+    zone.mkdir(parents=True)
+    (zone / "temp").write_text("45622\n")
+    return tmp_path
+
+
+def test_thermal_zone_is_reread_through_the_open_descriptor(sysfs):
+    source = make_thermal_source(str(sysfs))
+    try:
+        assert isinstance(source, SysfsThermalSource)
+        assert source.sample() == pytest.approx(45.622)
+        (sysfs / "class" / "thermal" / "thermal_zone0" / "temp").write_text("51000\n")
+        assert source.sample() == pytest.approx(51.0)
+    finally:
+        source.close()
+
+
+def test_missing_thermal_zone_raises(tmp_path):
+    with pytest.raises(OSError):
+        SysfsThermalSource(str(tmp_path))
+
+
+def test_memory_and_storage(tmp_path):
+    (tmp_path / "meminfo").write_text(MEMINFO)
+    source = SystemStatsSource(str(tmp_path), mount_point=str(tmp_path))
+    try:
+        values = source.sample()
+    finally:
+        source.close()
+    assert values["memory"] == pytest.approx(75.0)
+    assert 0.0 <= values["storage"] <= 100.0
+
+
+def test_sample_change():
+    assert sample_change(None, 1.0) == float("inf")
+    assert sample_change(40.0, 41.5) == 1.5
+    assert sample_change({"memory": 10.0, "storage": 50.0}, {"memory": 12.0, "storage": 50.5}) == 2.0
+
+
+class ScriptedSource:
+    name = "scripted"
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def sample(self):
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def close(self):
+        pass
+
+
+def test_sampler_slows_down_while_flat_and_speeds_up_on_change():
+    sampler = AdaptiveSampler(ScriptedSource([40.0] * 6 + [45.0]), min_interval=2, max_interval=10, threshold=0.5)
+    for _ in range(6):
+        sampler.sample()
+    assert sampler.next_interval() == 10
+    sampler.sample()
+    assert sampler.next_interval() == 5
+    assert sampler.stats()["samples"] == 7
+
+
+def test_sampler_backs_off_when_the_source_fails():
+    sampler = AdaptiveSampler(ScriptedSource([OSError("gone")] * 8), min_interval=2, max_interval=60, threshold=0.5)
+    intervals = []
+    for _ in range(8):
+        with pytest.raises(OSError):
+            sampler.sample()
+        intervals.append(sampler.next_interval())
+    assert intervals == sorted(intervals)
+    assert intervals[0] > 2
+    assert intervals[-1] <= 60
+    assert sampler.stats()["samples"] == 8
@@ -0,0 +1,116 @@
+# WeatherClient against a local stub HTTP server: caching, backoff and stale fallback.
+import http.server
+import json
+import threading
+
+import pytest
+import requests
+
+from weather_client import WeatherBackoff, WeatherClient
+
+PARAMS = {"latitude": 52.4, "longitude": 10.8, "hourly": "temperature_2m"}
+CURRENT_TIME = 1_700_000_100
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        body = json.dumps({"current": {"time": CURRENT_TIME, "interval": 900, "temperature_2m": 11.5}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = 0
+    server.status = 200
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/forecast"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClock:
+    def __init__(self, now=CURRENT_TIME + 10):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_fresh_response_is_served_from_cache(stub, tmp_path):
+    clock = FakeClock()
+    client = WeatherClient(stub.url, cache_path=str(tmp_path / "cache.json"), clock=clock)
+    first = client.fetch(PARAMS)
+    second = client.fetch(PARAMS)
+    assert first == second
+    assert first["current"]["temperature_2m"] == 11.5
+    assert stub.requests == 1
+    assert client.stats()["hits"] == 1
+
+    # Expires after the next model update (time + interval + settle delay)
+    clock.now = CURRENT_TIME + 900 + 61
+    client.fetch(PARAMS)
+    assert stub.requests == 2
+
+
+def test_cache_survives_a_restart(stub, tmp_path):
+    cache_path = str(tmp_path / "cache.json")
+    WeatherClient(stub.url, cache_path=cache_path, clock=FakeClock()).fetch(PARAMS)
+    client = WeatherClient(stub.url, cache_path=cache_path, clock=FakeClock())
+    assert client.cached(PARAMS)["current"]["temperature_2m"] == 11.5
+    client.fetch(PARAMS)
+    assert stub.requests == 1
+
+
+def test_server_errors_back_off(stub, tmp_path):
+    stub.status = 500
+    clock = FakeClock()
+    client = WeatherClient(stub.url, cache_path=str(tmp_path / "cache.json"), backoff_base=10, clock=clock)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.fetch(PARAMS)
+    with pytest.raises(WeatherBackoff):
+        client.fetch(PARAMS)
+    assert stub.requests == 1
+
+    # After the backoff the next request goes out and succeeds
+    stub.status = 200
+    clock.now += 10
+    assert client.fetch(PARAMS)["current"]["temperature_2m"] == 11.5
+    assert stub.requests == 2
+
+
+def test_stale_cache_is_served_while_the_api_fails(stub, tmp_path):
+    clock = FakeClock()
+    client = WeatherClient(stub.url, cache_path=str(tmp_path / "cache.json"), clock=clock)
+    data = client.fetch(PARAMS)
+    stub.status = 503
+    clock.now += 3600
+    assert client.fetch(PARAMS) == data # Request fails, cached data is served
+    assert client.fetch(PARAMS) == data # Backing off, no request
+    assert stub.requests == 2
+    assert client.stats()["stale_hits"] == 2
+
+
+def test_connection_refused_backs_off(tmp_path):
+    server = http.server.HTTPServer(("127.0.0.1", 0), StubHandler)
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/forecast"
+    server.server_close() # Nothing listens on the port any more
+    client = WeatherClient(url, cache_path=str(tmp_path / "cache.json"), clock=FakeClock())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.fetch(PARAMS)
+    with pytest.raises(WeatherBackoff):
+        client.fetch(PARAMS)
+    assert client.stats()["failures"] == 1